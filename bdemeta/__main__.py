@@ -1,20 +1,24 @@
 # bdemeta
 
 import argparse
+import io
 import json
+import os
 import pathlib
 import shlex
 import shutil
 import signal
 import sys
-from typing import Callable, List, TextIO
+from typing import Callable, List, Optional, Set, TextIO, Tuple, TYPE_CHECKING
 
-import bdemeta.cmake
 import bdemeta.graph
 import bdemeta.resolver
-import bdemeta.testing
 from bdemeta.resolver import InvalidPathError, normalize_roots
-from bdemeta.testing import Runner
+
+# 'bdemeta.cmake' and 'bdemeta.testing' (which loads 'multiprocessing') are
+# imported only by the modes that use them, to keep startup fast.
+if TYPE_CHECKING:
+    from bdemeta.testing import Runner
 
 class NoConfigError(RuntimeError):
     pass
@@ -46,6 +50,11 @@ def get_parser() -> argparse.ArgumentParser:
                                   action='store_true',
                                   dest='incl_test_deps',
                                   help='include test dependencies')
+    resolving_parser.add_argument('--cache', metavar='<cache>',
+                                  help='cache metadata in the specified file')
+    resolving_parser.add_argument('-j', '--jobs', metavar='<jobs>',
+                                  type=int, default=1,
+                                  help='number of threads reading metadata')
     resolving_parser.add_argument('config', metavar='<config>',
                                   help='configuration file')
     resolving_parser.add_argument('targets', nargs='+', metavar='<target>',
@@ -62,6 +71,23 @@ def get_parser() -> argparse.ArgumentParser:
     cmake_parser.add_argument('-p', '--plugin-tests',
                               action='store_true',
                               help='build tests as plugins')
+    cmake_parser.add_argument('--unity', action='store_true',
+                              help='combine the sources of each package ' \
+                                   'into unity builds')
+    cmake_parser.add_argument('--unity-batch', metavar='<sources>', type=int,
+                              help='combine at most the specified number ' \
+                                   'of sources per unity build; implies ' \
+                                   '--unity')
+    cmake_parser.add_argument('--pch', action='store_true',
+                              help='precompile the dependency headers ' \
+                                   'included most often by each target')
+    cmake_output = cmake_parser.add_mutually_exclusive_group()
+    cmake_output.add_argument('-o', '--output', metavar='<file>',
+                              help='write the lists file to the specified ' \
+                                   'file unless it is unchanged')
+    cmake_output.add_argument('--output-dir', metavar='<directory>',
+                              help='write a lists file including one file ' \
+                                   'per target to the specified directory')
     runtest_parser = subparser.add_parser('runtests',
                                           help='run specified or discovered ' \
                                                'unit tests')
@@ -70,6 +96,69 @@ def get_parser() -> argparse.ArgumentParser:
     runtest_parser.add_argument('-m', '--max-cases', metavar='<maximum cases>',
                                 type=int, default=100,
                                 help='maximum cases to attempt per driver')
+    runtest_parser.add_argument('-j', '--jobs', metavar='<jobs>|auto',
+                                help='maximum cases to run at once, or ' \
+                                     'as many as the load average allows')
+    runtest_parser.add_argument('--mem-per-job', metavar='<size>',
+                                help='only run as many cases at once as ' \
+                                     'fit in available memory at the ' \
+                                     'specified size each')
+    runtest_parser.add_argument('-d', '--discover', action='store_true',
+                                help='find the number of cases of each ' \
+                                     'driver before running them')
+    runtest_parser.add_argument('--case-cache', metavar='<cache>',
+                                help='cache discovered numbers of cases in ' \
+                                     'the specified file (implies -d)')
+    runtest_parser.add_argument('--timing-db', metavar='<database>',
+                                help='record case durations in the ' \
+                                     'specified file and run the slowest ' \
+                                     'first')
+    runtest_parser.add_argument('--timings', action='store_const',
+                                const=10, default=0,
+                                help='report the slowest cases')
+    runtest_parser.add_argument('--timeout', metavar='<seconds>',
+                                type=float,
+                                help='kill cases running longer than the ' \
+                                     'specified number of seconds')
+    runtest_parser.add_argument('--driver-timeout',
+                                metavar='<pattern>=<seconds>',
+                                action='append', default=[],
+                                help='override the timeout for drivers ' \
+                                     'matching the specified pattern')
+    runtest_parser.add_argument('--log-dir', metavar='<directory>',
+                                help='keep the output of failed cases in ' \
+                                     'the specified directory')
+    runtest_parser.add_argument('--results-cache', metavar='<cache>',
+                                help='skip cases that passed when last ' \
+                                     'run, recording results in the ' \
+                                     'specified file')
+    runtest_parser.add_argument('--no-cache', action='store_true',
+                                help='run every case, ignoring previous ' \
+                                     'results')
+    runtest_parser.add_argument('--json', metavar='<file>',
+                                help='write a JSON lines record of each ' \
+                                     'case to the specified file')
+    runtest_parser.add_argument('--junit', metavar='<file>',
+                                help='write a JUnit XML report to the ' \
+                                     'specified file')
+    runtest_parser.add_argument('--fail-fast', action='store_true',
+                                help='stop at the first failed case')
+    runtest_parser.add_argument('--config', metavar='<config>',
+                                help='configuration file')
+    runtest_parser.add_argument('--affected', metavar='<target>',
+                                action='append', default=[],
+                                help='only run drivers of targets that ' \
+                                     'depend on the specified target')
+    runtest_parser.add_argument('--daemon', action='store_true',
+                                help='run tests on a persistent service, ' \
+                                     'starting it if necessary')
+    runtest_parser.add_argument('--socket', metavar='<socket>',
+                                help='socket of the persistent service')
+    runtest_parser.add_argument('--stop', action='store_true',
+                                help='stop the persistent service once it ' \
+                                     'has run the tests already submitted')
+    runtest_parser.add_argument('--serve', metavar='<socket>',
+                                help=argparse.SUPPRESS)
     runtest_parser.add_argument('tests', nargs='*', metavar='<test>',
                                 help='test driver glob pattern')
 
@@ -77,7 +166,9 @@ def get_parser() -> argparse.ArgumentParser:
 
 def make_resolver(config_path_str: str,
                   incl_test_deps: bool,
-                  plugin_tests: bool) -> bdemeta.resolver.TargetResolver:
+                  plugin_tests: bool,
+                  cache_path_str: Optional[str]=None) \
+                                          -> bdemeta.resolver.TargetResolver:
     config_path = pathlib.Path(config_path_str)
     config_dir  = config_path.parent
     try:
@@ -90,13 +181,54 @@ def make_resolver(config_path_str: str,
     if 'conan_roots' in config:
         config['conan_roots'] = normalize_roots(config['conan_roots'], config_dir)
 
+    cache_path = pathlib.Path(cache_path_str) if cache_path_str else None
     return bdemeta.resolver.TargetResolver(config,
                                            incl_test_deps,
-                                           plugin_tests)
+                                           plugin_tests,
+                                           cache_path)
+
+def select_affected(resolver:    bdemeta.resolver.TargetResolver,
+                    tests:       List[Tuple[str, str]],
+                    targets:     Set[str],
+                    exec_suffix: str) -> List[Tuple[str, str]]:
+    '''Return those of the specified 'tests' for components of targets that
+    are, or depend on, any of the specified 'targets'.'''
+    for target in targets:
+        resolver.identify(target)
+
+    result = []
+    for name, path in tests:
+        component = pathlib.Path(name).name
+        if exec_suffix and component.endswith(exec_suffix):
+            component = component[:-len(exec_suffix)]
+        if component.endswith('.t'):
+            component = component[:-len('.t')]
+        owner = resolver.owner(component)
+        if owner is not None and resolver.depends_on(owner, targets):
+            result.append((name, path))
+    return result
+
+def parse_size(value: str) -> int:
+    '''Return the number of bytes in the specified 'value', optionally
+    suffixed by 'K', 'M', 'G' or 'T' for powers of 1024.  Raise 'ValueError'
+    if 'value' is not a positive size.'''
+    units = 'KMGT'
+    scale = 1
+    if value and value[-1].upper() in units:
+        scale = 1024 ** (units.index(value[-1].upper()) + 1)
+        value = value[:-1]
+    size = int(float(value) * scale)
+    if size <= 0:
+        raise ValueError(value)
+    return size
+
+def service_address() -> str:
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(os.environ.get('TMPDIR', '/tmp'), f'bdemeta-{uid}.sock')
 
 def run(stdout:      TextIO,
         stderr:      TextIO,
-        runner:      Runner,
+        runner:      Optional['Runner'],
         get_columns: Callable[[], int],
         exec_suffix: str,
         raw_args:    List[str]) -> int:
@@ -105,30 +237,92 @@ def run(stdout:      TextIO,
     if args.mode == 'walk':
         resolver = make_resolver(args.config,
                                  args.incl_test_deps,
-                                 getattr(args, 'plugin_tests', False))
-        targets = bdemeta.resolver.resolve(resolver, args.targets)
+                                 getattr(args, 'plugin_tests', False),
+                                 args.cache)
+        targets = bdemeta.resolver.resolve(resolver,
+                                           args.targets,
+                                           args.jobs)
         print(' '.join(t.name for t in targets), file=stdout)
+        resolver.save_cache()
         return 0
     elif args.mode == 'dot':
         resolver = make_resolver(args.config,
                                  args.incl_test_deps,
-                                 getattr(args, 'plugin_tests', False))
-        targets = bdemeta.resolver.resolve(resolver, args.targets)
+                                 getattr(args, 'plugin_tests', False),
+                                 args.cache)
+        targets = bdemeta.resolver.resolve(resolver,
+                                           args.targets,
+                                           args.jobs)
         print('digraph G {', file=stdout)
         for t in targets:
             for d in resolver.dependencies(t.name):
                 print(f'    "{t.name}" -> "{d}"', file=stdout)
         print('}', file=stdout)
+        resolver.save_cache()
         return 0
     elif args.mode == 'cmake':
+        unity_batch: Optional[int] = None
+        if args.unity_batch is not None:
+            if args.unity_batch < 1:
+                raise InvalidArgumentsError(f'invalid unity batch: ' \
+                                            f'{args.unity_batch}')
+            unity_batch = args.unity_batch
+        elif args.unity:
+            unity_batch = 0
         resolver = make_resolver(args.config,
                                  args.incl_test_deps,
-                                 getattr(args, 'plugin_tests', False))
-        targets = bdemeta.resolver.resolve(resolver, args.targets)
-        bdemeta.cmake.generate(targets, stdout)
+                                 getattr(args, 'plugin_tests', False),
+                                 args.cache)
+        targets = bdemeta.resolver.resolve(resolver,
+                                           args.targets,
+                                           args.jobs)
+        from bdemeta import cmake
+        if args.pch:
+            cmake.select_precompiled_headers(
+                  targets,
+                  lambda source: cmake.cached_includes(resolver.cache,
+                                                       pathlib.Path(source)))
+        if args.output:
+            output = pathlib.Path(args.output)
+            lists  = io.StringIO()
+            cmake.generate(targets, lists, unity_batch, output.parent)
+            written = cmake.write_if_changed(output, lists.getvalue())
+            print('updated' if written else 'unchanged', file=stdout)
+        elif args.output_dir:
+            written = bool(cmake.generate_directory(
+                                                targets,
+                                                pathlib.Path(args.output_dir),
+                                                unity_batch))
+            print('updated' if written else 'unchanged', file=stdout)
+        else:
+            cmake.generate(targets, stdout, unity_batch)
+        resolver.save_cache()
         return 0
     else:
         assert(args.mode == 'runtests')
+        from bdemeta import testing
+        if runner is None:
+            runner = testing.test_runner
+
+        if (args.daemon or args.serve or args.stop) and \
+                                                    sys.platform == 'win32':
+            raise InvalidArgumentsError('the test service requires Unix ' \
+                                        'domain sockets')
+
+        if args.serve:  # pragma: no cover
+            service = testing.Service(args.serve, runner)
+            try:
+                service.serve_forever()
+            finally:
+                service.close()
+            return 0
+
+        if args.stop:
+            address = args.socket or service_address()
+            if not testing.stop_service(address):
+                print('No test service running at:', address, file=stderr)
+            return 0
+
         if args.tests:
             patterns = args.tests
         else:
@@ -138,27 +332,105 @@ def run(stdout:      TextIO,
             for test in pathlib.Path('.').glob(pattern):
                 tests.append((str(test), str(test.resolve())))
 
+        if args.affected:
+            if not args.config:
+                raise InvalidArgumentsError('--affected requires --config')
+            resolver = make_resolver(args.config, True, False)
+            tests    = select_affected(resolver,
+                                       tests,
+                                       set(args.affected),
+                                       exec_suffix)
+
         if args.executor:
             executor = shlex.split(args.executor,
                                    posix=sys.platform != "win32")
         else:
             executor = []
 
+        discover   = args.discover or bool(args.case_cache)
+        case_cache = pathlib.Path(args.case_cache) if args.case_cache else None
+        timing_db  = pathlib.Path(args.timing_db) if args.timing_db else None
+        log_dir    = pathlib.Path(args.log_dir) if args.log_dir else None
+        result_db  = pathlib.Path(args.results_cache) \
+                                             if args.results_cache else None
+        json_path  = pathlib.Path(args.json) if args.json else None
+        junit_path = pathlib.Path(args.junit) if args.junit else None
+        overrides = {}
+        for override in args.driver_timeout:
+            pattern, _, seconds = override.rpartition('=')
+            try:
+                if not pattern:
+                    raise ValueError(override)
+                overrides[pattern] = float(seconds)
+            except ValueError:
+                raise InvalidArgumentsError(f'invalid driver timeout: ' \
+                                            f'{override}')
+        jobs      = None
+        auto_jobs = args.jobs == 'auto'
+        if args.jobs and not auto_jobs:
+            try:
+                jobs = int(args.jobs)
+                if jobs < 1:
+                    raise ValueError(args.jobs)
+            except ValueError:
+                raise InvalidArgumentsError(f'invalid jobs: {args.jobs}')
+        mem_per_job = None
+        if args.mem_per_job:
+            try:
+                mem_per_job = parse_size(args.mem_per_job)
+            except ValueError:
+                raise InvalidArgumentsError(f'invalid memory per job: ' \
+                                            f'{args.mem_per_job}')
+        if args.daemon and args.timings and not timing_db:
+            raise InvalidArgumentsError('--timings with --daemon requires ' \
+                                        '--timing-db')
+
+        options = testing.RunOptions(max_cases=args.max_cases,
+                                     discover=discover,
+                                     case_cache=case_cache,
+                                     timing_db=timing_db,
+                                     slowest=args.timings,
+                                     timeout=args.timeout,
+                                     overrides=overrides,
+                                     log_dir=log_dir,
+                                     fail_fast=args.fail_fast,
+                                     result_db=result_db,
+                                     reuse=not args.no_cache,
+                                     json_path=json_path,
+                                     junit_path=junit_path,
+                                     jobs=jobs,
+                                     auto_jobs=auto_jobs,
+                                     mem_per_job=mem_per_job)
+
         signal.signal(signal.SIGINT, signal.SIG_DFL)
-        return bdemeta.testing.run_tests(stdout,
-                                         stderr,
-                                         runner,
-                                         executor,
-                                         get_columns,
-                                         tests,
-                                         args.max_cases)
-
-def main(stdout:      TextIO            = sys.stdout,
-         stderr:      TextIO            = sys.stderr,
-         runner:      Runner            = bdemeta.testing.test_runner,
-         get_columns: Callable[[], int] = get_columns,
-         exec_suffix: str               = exec_suffix,
-         args:        List[str]         = sys.argv) -> int:
+        if args.daemon:
+            address = args.socket or service_address()
+            try:
+                return testing.run_tests_remotely(stdout,
+                                                  stderr,
+                                                  address,
+                                                  executor,
+                                                  get_columns,
+                                                  tests,
+                                                  options=options)
+            except testing.ServiceError as e:
+                print('Could not reach test service at:', e.args[0],
+                      file=stderr)
+                return -1
+        return testing.run_tests(stdout,
+                                 stderr,
+                                 runner,
+                                 executor,
+                                 get_columns,
+                                 tests,
+                                 options=options)
+
+def main(stdout:      TextIO             = sys.stdout,
+         stderr:      TextIO             = sys.stderr,
+         runner:      Optional['Runner'] = None,
+         get_columns: Callable[[], int]  = get_columns,
+         exec_suffix: str                = exec_suffix,
+         args:        List[str]          = sys.argv) -> int:
     try:
         return run(stdout, stderr, runner, get_columns, exec_suffix, args[1:])
     except NoConfigError as e:
@@ -173,6 +445,9 @@ def main(stdout:      TextIO            = sys.stdout,
     except bdemeta.resolver.TargetNotFoundError as e:
         print('Could not find target:', e.args[0], file=stderr)
         return -1
+    except InvalidArgumentsError as e:
+        print('Invalid arguments:', e.args[0], file=stderr)
+        return -1
     return 0
 
 if __name__ == '__main__':  # pragma: no cover
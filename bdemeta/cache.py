@@ -0,0 +1,93 @@
+# bdemeta.cache
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+Stat = Optional[List[int]]
+
+class ResolutionCache:
+    '''A persistent store of values derived from metadata on disk.  Each value
+    remains valid for as long as the files and directories it was derived from
+    have the same modification time and size.'''
+
+    VERSION = 4
+
+    def __init__(self, path: Path, key: str) -> None:
+        '''Load the cache stored at the specified 'path', discarding its
+        contents if they were stored under a different 'key' (e.g. a
+        different configuration).'''
+        self._path  = path
+        self._key   = key
+        self._dirty = False
+        self._stats: Dict[str, Stat] = {}
+        self._entries: Dict[str, Dict[str, Dict[str, object]]] = {}
+
+        try:
+            with path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and \
+                            data.get('version') == ResolutionCache.VERSION and \
+                            data.get('key') == key and \
+                            isinstance(data.get('entries'), dict):
+            self._entries = data['entries']
+
+    def _stat(self, path: str) -> Stat:
+        if path not in self._stats:
+            try:
+                st = os.stat(path)
+                self._stats[path] = [st.st_mtime_ns, st.st_size]
+            except OSError:
+                self._stats[path] = None
+        return self._stats[path]
+
+    def forget_stats(self) -> None:
+        '''Forget the modification times and sizes read so far, so that
+        changes made to the files since are detected by subsequent lookups.'''
+        self._stats.clear()
+
+    def get(self, kind: str, key: str) -> Optional[object]:
+        '''Return the value of the specified 'kind' stored for the specified
+        'key' if none of the paths it was derived from have changed since, and
+        'None' otherwise.'''
+        entry = self._entries.get(kind, {}).get(key)
+        if entry is None:
+            return None
+        stats = entry['stats']
+        assert isinstance(stats, dict)
+        for path, stat in stats.items():
+            if self._stat(path) != stat:
+                return None
+        return entry['value']
+
+    def put(self,
+            kind:  str,
+            key:   str,
+            value: object,
+            paths: Iterable[Path]) -> None:
+        '''Store the specified 'value' of the specified 'kind' for the
+        specified 'key', as derived from the specified 'paths'.'''
+        stats = {str(p): self._stat(str(p)) for p in paths}
+        self._entries.setdefault(kind, {})[key] = {
+            'stats': stats,
+            'value': value,
+        }
+        self._dirty = True
+
+    def save(self) -> None:
+        '''Write this cache back to disk if anything was stored in it.'''
+        if not self._dirty:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self._path.with_name(self._path.name + '.tmp')
+        with temporary.open('w') as f:
+            json.dump({
+                'version': ResolutionCache.VERSION,
+                'key':     self._key,
+                'entries': self._entries,
+            }, f)
+        os.replace(str(temporary), str(self._path))
+        self._dirty = False
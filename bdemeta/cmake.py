@@ -1,14 +1,21 @@
 # bdemeta.cmake
 
+import hashlib
 import os
-from typing import List, TextIO, Union
+import posixpath
+import re
+from pathlib import Path
+from typing import (cast, Callable, Dict, Iterable, List, Optional, Sequence,
+                    TextIO, Tuple, Union)
 
+from bdemeta.cache import ResolutionCache
 from bdemeta.types import Application, CMake, Group, Package, Pkg, Target
 BdeTarget = Union[Group, Package]
+Relocate  = Callable[[str], str]
 
 LISTS_PROLOGUE = '''\
-cmake_minimum_required(VERSION 3.8)
-project(bdemeta-generated-{targets[0].name})
+cmake_minimum_required(VERSION {version})
+project(bdemeta-generated-{name})
 
 set(CONAN_BLD_INFO ${{CMAKE_BINARY_DIR}}/conanbuildinfo.cmake)
 if(EXISTS ${{CONAN_BLD_INFO}})
@@ -19,31 +26,51 @@ endif()
 '''
 LIBRARY_PROLOGUE = '''\
 add_library(
-    {target.name}
+    {name}
 '''
 APPLICATION_PROLOGUE = '''\
 add_executable(
-    {target.name}
+    {name}
 '''
 DEFINE_SYMBOL = '''\
 set_target_properties(
-    {target.name} PROPERTIES
-    DEFINE_SYMBOL "BUILDING_{target_upper}"
+    {name} PROPERTIES
+    DEFINE_SYMBOL "BUILDING_{upper}"
+)
+
+'''
+UNITY_BUILD = '''\
+set_target_properties(
+    {name} PROPERTIES
+    UNITY_BUILD ON
+    UNITY_BUILD_MODE GROUP
+)
+
+'''
+UNITY_GROUP_PROLOGUE = '''\
+set_source_files_properties(
+'''
+UNITY_GROUP_EPILOGUE = '''\
+    PROPERTIES UNITY_GROUP "{group}"
 )
 
+'''
+PRECOMPILE_HEADERS_PROLOGUE = '''\
+target_precompile_headers(
+    {name} PRIVATE
 '''
 INCLUDE_DIRECTORIES_PROLOGUE = '''\
 target_include_directories(
-    {target.name} PUBLIC
+    {name} PUBLIC
 '''
 LINK_LIBRARIES_PROLOGUE = '''\
 target_link_libraries(
-    {target.name} PUBLIC
+    {name} PUBLIC
 '''
 LAZILY_BOUND_FLAG = '''\
 if(APPLE)
     set_target_properties(
-        {target.name} PROPERTIES
+        {name} PROPERTIES
         LINK_FLAGS "-undefined dynamic_lookup"
     )
 endif()  # APPLE
@@ -93,14 +120,14 @@ endif()  # BUILD_SHARED_LIBS
 '''
 INSTALL_LIBRARY = '''\
 install(
-    TARGETS {target.name}
+    TARGETS {name}
     COMPONENT development
     DESTINATION lib
     EXCLUDE_FROM_ALL
 )
 
 install(
-    TARGETS {target.name}
+    TARGETS {name}
     COMPONENT runtime
     DESTINATION .
 )
@@ -108,7 +135,7 @@ install(
 '''
 TEST_TARGET_PROLOGUE = '''\
 add_custom_target(
-    {target.name}.t
+    {name}.t
     DEPENDS
 '''
 ALL_TESTS_PROLOGUE = '''\
@@ -129,7 +156,7 @@ add_executable(
 
 target_link_libraries(
     {name}
-    {target.name}
+    {target}
 )
 
 '''
@@ -142,7 +169,7 @@ add_library(
 
 target_link_libraries(
     {name}
-    {target.name}
+    {target}
 )
 
 if(APPLE)
@@ -173,88 +200,304 @@ add_custom_target(
 
 '''
 
-def generate_bde(target: BdeTarget, out: TextIO) -> None:
+def lines(items: Iterable[str]) -> str:
+    '''Return the specified 'items' as indented arguments, one per line.'''
+    arguments = list(items)
+    if not arguments:
+        return ''
+    return '    ' + '\n    '.join(arguments) + '\n'
+
+def unchanged(path: str) -> str:
+    return path
+
+def relocation(directory: Optional[Path]) -> Relocate:
+    '''Return a function mapping a path relative to the current directory to
+    the same path relative to the specified 'directory', in which the lists
+    file is written, and leaving absolute paths unchanged.  CMake resolves
+    relative paths from the directory of the lists file using them.  Paths
+    are left unchanged if 'directory' is not specified.'''
+    if directory is None:
+        return unchanged
+    try:
+        prefix = Path(os.path.relpath(os.curdir, directory)).as_posix()
+    except ValueError:
+        # 'directory' is on another drive, so no relative path leads back.
+        prefix = Path.cwd().as_posix()
+    if prefix == '.':
+        return unchanged
+    return lambda path: path if os.path.isabs(path) else f'{prefix}/{path}'
+
+def unity_fragments(target:      BdeTarget,
+                    unity_batch: int,
+                    fragments:   List[str],
+                    relocate:    Relocate=unchanged) -> None:
+    '''Append the commands building the specified 'target' as a unity build to
+    the specified 'fragments'.  The sources of each package are combined in
+    the order of its components, in batches of the specified 'unity_batch'
+    sources if it is positive.  Paths are written as mapped by the specified
+    'relocate'.'''
+    fragments.append(UNITY_BUILD.format(name=target.name))
+    packages = target.packages() if isinstance(target, Group) else [target]
+    for package in packages:
+        sources = [relocate(s) for s in package.sources()]
+        if not sources:
+            continue
+        size    = unity_batch if unity_batch > 0 else len(sources)
+        batches = [sources[i:i + size] for i in range(0, len(sources), size)]
+        for index, batch in enumerate(batches):
+            group = package.name
+            if len(batches) > 1:
+                group += f'.{index + 1}'
+            fragments.append(UNITY_GROUP_PROLOGUE)
+            fragments.append(lines(batch))
+            fragments.append(UNITY_GROUP_EPILOGUE.format(group=group))
+
+INCLUDE = re.compile(r'^[ \t]*#[ \t]*include[ \t]*[<"]([^>"\n]+)[>"]',
+                     re.MULTILINE)
+
+def scan_includes(path: Path) -> List[str]:
+    '''Return the names included by the '#include' directives of the source
+    file at the specified 'path', in the order they first appear in it.'''
+    with path.open(errors='replace') as source:
+        text = source.read()
+    return list(dict.fromkeys(INCLUDE.findall(text)))
+
+def cached_includes(cache: Optional[ResolutionCache], path: Path) -> List[str]:
+    if cache is None:
+        return scan_includes(path)
+
+    value = cache.get('includes', str(path))
+    if value is not None:
+        return cast(List[str], value)
+    includes = scan_includes(path)
+    cache.put('includes', str(path), includes, [path])
+    return includes
+
+def select_precompiled_headers(targets:  Sequence[Target],
+                               includes: Callable[[str], List[str]],
+                               limit:    int=16) -> None:
+    '''Set the 'precompiled_headers' of each group and package in the
+    specified 'targets' to at most the specified 'limit' headers of other
+    targets in 'targets' that are included by at least half, and at least
+    two, of its sources, as returned by the specified 'includes', most
+    frequently included first.  A target's own headers, including those of
+    every package of a group, are never selected, so that changing them does
+    not rebuild the precompiled header.'''
+    bde_targets = [t for t in targets if isinstance(t, (Group, Package))]
+
+    # Map the name by which each header is included to the target owning it.
+    owners: Dict[str, Tuple[str, str]] = {}
+    for target in bde_targets:
+        for header in target.headers():
+            owners.setdefault(posixpath.basename(header), (target.name, header))
+
+    for target in bde_targets:
+        counts: Dict[str, int] = {}
+        total = 0
+        for source in target.sources():
+            total += 1
+            for name in includes(source):
+                owner = owners.get(name)
+                if owner is not None and owner[0] != target.name:
+                    counts[owner[1]] = counts.get(owner[1], 0) + 1
+        frequent = [h for h, n in counts.items() if n >= 2 and 2 * n >= total]
+        frequent.sort(key=lambda h: (-counts[h], h))
+        target.precompiled_headers = frequent[:limit]
+
+def bde_fragments(target:      BdeTarget,
+                  fragments:   List[str],
+                  unity_batch: Optional[int]=None,
+                  relocate:    Relocate=unchanged) -> bool:
+    '''Append the commands building the specified 'target' to the specified
+    'fragments', and return whether 'target' has any test drivers.  If
+    'unity_batch' is specified, build 'target' as a unity build as per
+    'unity_fragments'.  Paths are written as mapped by the specified
+    'relocate'.'''
+    name = target.name
     if isinstance(target, Application):
-        out.write(APPLICATION_PROLOGUE.format(**locals()))
+        fragments.append(APPLICATION_PROLOGUE.format(name=name))
     else:
-        out.write(LIBRARY_PROLOGUE.format(**locals()))
+        fragments.append(LIBRARY_PROLOGUE.format(name=name))
+    fragments.append(lines(map(relocate, target.sources())))
+    fragments.append(COMMAND_EPILOGUE)
+
+    if unity_batch is not None:
+        unity_fragments(target, unity_batch, fragments, relocate)
 
-    for component in target.sources():
-        out.write('    {}\n'.format(component).replace('\\', '/'))
-    out.write(COMMAND_EPILOGUE)
+    fragments.append(DEFINE_SYMBOL.format(name=name, upper=name.upper()))
 
-    target_upper = target.name.upper()
-    out.write(DEFINE_SYMBOL.format(**locals()))
+    if target.precompiled_headers:
+        fragments.append(PRECOMPILE_HEADERS_PROLOGUE.format(name=name))
+        fragments.append(lines(map(relocate, target.precompiled_headers)))
+        fragments.append(COMMAND_EPILOGUE)
 
-    out.write(INCLUDE_DIRECTORIES_PROLOGUE.format(**locals()))
-    for include in target.includes():
-        out.write('    {}\n'.format(include).replace('\\', '/'))
-    out.write(COMMAND_EPILOGUE)
+    fragments.append(INCLUDE_DIRECTORIES_PROLOGUE.format(name=name))
+    fragments.append(lines(map(relocate, target.includes())))
+    fragments.append(COMMAND_EPILOGUE)
 
-    out.write(LINK_LIBRARIES_PROLOGUE.format(**locals()))
-    for dependency in target.dependencies():
-        if dependency.has_output:
-            out.write('    {}\n'.format(dependency.name))
-    out.write(COMMAND_EPILOGUE)
+    fragments.append(LINK_LIBRARIES_PROLOGUE.format(name=name))
+    fragments.append(lines(d.name for d in target.dependencies()
+                                                             if d.has_output))
+    fragments.append(COMMAND_EPILOGUE)
 
     if target.lazily_bound:
-        out.write(LAZILY_BOUND_FLAG.format(**locals()))
+        fragments.append(LAZILY_BOUND_FLAG.format(name=name))
 
+    driver_template = PLUGIN_TEST_DRIVER if target.plugin_tests else \
+                                                                   TEST_DRIVER
     drivers = []
     for driver in target.drivers():
-        name = os.path.splitext(os.path.basename(driver))[0]
-        if target.plugin_tests:
-            out.write(PLUGIN_TEST_DRIVER.format(**locals()).replace('\\', '/'))
-        else:
-            out.write(TEST_DRIVER.format(**locals()).replace('\\', '/'))
-        drivers.append(name)
+        driver_name = posixpath.splitext(posixpath.basename(driver))[0]
+        fragments.append(driver_template.format(name=driver_name,
+                                                driver=relocate(driver),
+                                                target=name))
+        drivers.append(driver_name)
 
     if drivers:
-        out.write(TEST_TARGET_PROLOGUE.format(**locals()))
-        for driver in drivers:
-            out.write('    {}\n'.format(driver))
-        out.write(COMMAND_EPILOGUE)
-
-    out.write(INSTALL_HEADERS_PROLOGUE)
-    for header in target.headers():
-        out.write('    {}\n'.format(header).replace('\\', '/'))
-    out.write(INSTALL_HEADERS_DESTINATION)
-    out.write(COMMAND_EPILOGUE)
-
-    out.write(INSTALL_LIBRARY.format(**locals()))
-
-def generate_pkg(target: Pkg, out: TextIO) -> None:
-    name    = target.name
-    package = target.package
-    out.write(PKG_CONFIG.format(**locals()))
-
-def generate(targets: List[Target], out: TextIO) -> None:
-    uses_pkg_config = any(isinstance(t, Pkg) for t in targets)
-
-    out.write(LISTS_PROLOGUE.format(**locals()))
-    out.write(INSTALL_TARGETS)
-    if uses_pkg_config:
-        out.write('include(FindPkgConfig)\n')
-
-    bde_targets = []
+        fragments.append(TEST_TARGET_PROLOGUE.format(name=name))
+        fragments.append(lines(drivers))
+        fragments.append(COMMAND_EPILOGUE)
+
+    fragments.append(INSTALL_HEADERS_PROLOGUE)
+    fragments.append(lines(map(relocate, target.headers())))
+    fragments.append(INSTALL_HEADERS_DESTINATION)
+    fragments.append(COMMAND_EPILOGUE)
+
+    fragments.append(INSTALL_LIBRARY.format(name=name))
+    return bool(drivers)
+
+def target_fragments(target:      Target,
+                     fragments:   List[str],
+                     unity_batch: Optional[int]=None,
+                     relocate:    Relocate=unchanged) -> bool:
+    '''Append the commands for the specified 'target' to the specified
+    'fragments', and return whether 'target' has any test drivers.  BDE
+    targets are built as unity builds if 'unity_batch' is specified, as per
+    'unity_fragments'.  Paths are written as mapped by the specified
+    'relocate'.'''
+    has_drivers = False
+    if isinstance(target, Group) or isinstance(target, Package):
+        has_drivers = bde_fragments(target, fragments, unity_batch, relocate)
+    elif isinstance(target, CMake):
+        path = relocate(target.path())
+        fragments.append(f'add_subdirectory({path} {target.name})\n')
+    elif isinstance(target, Pkg):
+        fragments.append(PKG_CONFIG.format(name=target.name,
+                                           package=target.package))
+
+    if target.overrides:
+        fragments.append(f'include({relocate(target.overrides)})\n')
+    return has_drivers
+
+def minimum_version(targets:     List[Target],
+                    unity_batch: Optional[int]) -> str:
+    '''Return the minimum version of CMake supporting the commands generated
+    for the specified 'targets' with the specified 'unity_batch'.'''
+    if unity_batch is not None:
+        return '3.18'  # UNITY_BUILD_MODE and UNITY_GROUP
+    if any(t.precompiled_headers for t in targets):
+        return '3.16'  # target_precompile_headers
+    return '3.8'
+
+def prologue_fragments(targets:     List[Target],
+                       unity_batch: Optional[int]=None) -> List[str]:
+    version   = minimum_version(targets, unity_batch)
+    fragments = [LISTS_PROLOGUE.format(name=targets[0].name, version=version),
+                 INSTALL_TARGETS]
+    if any(isinstance(t, Pkg) for t in targets):
+        fragments.append('include(FindPkgConfig)\n')
+    return fragments
+
+def all_tests_fragment(tested: List[str]) -> str:
+    if not tested:
+        return ''
+    return ALL_TESTS_PROLOGUE + lines(f'{t}.t' for t in tested) + \
+                                                              COMMAND_EPILOGUE
+
+def generate(targets:     List[Target],
+             out:         TextIO,
+             unity_batch: Optional[int]=None,
+             directory:   Optional[Path]=None) -> None:
+    # Paths in 'targets' already use '/' as their separator, which CMake
+    # supports on every platform.  They are written relative to 'directory',
+    # where the lists file will be, if specified, as per 'relocation'.  The
+    # whole file is assembled from fragments and written at once.
+    relocate  = relocation(directory)
+    fragments = prologue_fragments(targets, unity_batch)
+    tested    = [t.name for t in reversed(targets)
+                     if target_fragments(t, fragments, unity_batch, relocate)]
+    fragments.append(all_tests_fragment(tested))
+    out.write(''.join(fragments))
+
+def write_if_changed(path: Path, content: str) -> bool:
+    '''Write the specified 'content' to the file at the specified 'path'
+    unless it already has that content, and return whether it was written.
+    The file is replaced atomically so that it is never seen half-written,
+    and its directory is created if necessary.'''
+    data = content.encode()
+    try:
+        if path.stat().st_size == len(data):
+            digest = hashlib.sha256()
+            with path.open('rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            if digest.digest() == hashlib.sha256(data).digest():
+                return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(path.name + '.tmp')
+    temporary.write_bytes(data)
+    os.replace(str(temporary), str(path))
+    return True
+
+# The name of the file listing the '.cmake' files written to a directory.
+MANIFEST = 'bdemeta.manifest'
+
+def generate_directory(targets:     List[Target],
+                       directory:   Path,
+                       unity_batch: Optional[int]=None) -> List[Path]:
+    '''Write a 'CMakeLists.txt' file including one '<name>.cmake' file per
+    target in the specified 'targets' to the specified 'directory', leaving
+    the files whose content has not changed untouched, and removing the
+    '.cmake' files written by a previous call that are no longer generated.
+    Return the files written.  BDE targets are built as unity builds if
+    'unity_batch' is specified, as per 'unity_fragments'.'''
+    directory.mkdir(parents=True, exist_ok=True)
+    relocate = relocation(directory)
+
+    lists   = prologue_fragments(targets, unity_batch)
+    tested  = []
+    written = []
+    names   = []
     for target in reversed(targets):
-        if isinstance(target, Group) or isinstance(target, Package):
-            generate_bde(target, out)
-            if len(list(target.drivers())):
-                bde_targets.append(target)
-        elif isinstance(target, CMake):
-            path = target.path()
-            out.write('add_subdirectory({path} {target.name})\n'.format(
-                                            **locals()).replace('\\', '/'))
-        elif isinstance(target, Pkg):
-            generate_pkg(target, out)
-
-        if target.overrides:
-            out.write(f'include({target.overrides})\n'.replace('\\', '/'))
-
-    if bde_targets:
-        out.write(ALL_TESTS_PROLOGUE)
-        for target in bde_targets:
-            out.write(f'    {target.name}.t\n')
-        out.write(COMMAND_EPILOGUE)
-
+        fragments: List[str] = []
+        if target_fragments(target, fragments, unity_batch, relocate):
+            tested.append(target.name)
+        if not fragments:
+            continue
+        name = f'{target.name}.cmake'
+        names.append(name)
+        lists.append(f'include(${{CMAKE_CURRENT_LIST_DIR}}/{name})\n')
+        if write_if_changed(directory/name, ''.join(fragments)):
+            written.append(directory/name)
+    lists.append(all_tests_fragment(tested))
+    if write_if_changed(directory/'CMakeLists.txt', ''.join(lists)):
+        written.append(directory/'CMakeLists.txt')
+
+    # Only files listed in the manifest were written by 'generate_directory',
+    # so any other file in 'directory' is left alone.
+    manifest = directory/MANIFEST
+    try:
+        previous = manifest.read_text().split('\n')
+    except OSError:
+        previous = []
+    for name in set(previous) - set(names):
+        if name.endswith('.cmake') and posixpath.basename(name) == name:
+            try:
+                (directory/name).unlink()
+            except FileNotFoundError:
+                pass
+    if write_if_changed(manifest, ''.join(f'{n}\n' for n in sorted(names))):
+        written.append(manifest)
+    return written
@@ -1,6 +1,6 @@
 # bdemeta.graph
 
-from typing import Callable, Iterable, List, Set
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
 
 class CyclicGraphError(RuntimeError):
     def __init__(self, cycle: Iterable[str]) -> None:
@@ -13,23 +13,88 @@ def tsort(nodes:       Iterable[str],
     visited: Set[str]    = set()
     postorder: List[str] = []
 
-    def dft(node: str, stack: List[str]) -> None:
-        if node in visited:
-            return
+    # Each entry on 'stack' is a node currently being visited along with an
+    # iterator over its remaining adjacencies.  'on_stack' holds the same
+    # nodes so that a back edge can be detected in constant time.
+    stack: List[Tuple[str, Iterator[str]]] = []
+    on_stack: Set[str]                     = set()
 
-        if node in stack:
-            raise CyclicGraphError(list(stack) + [node])
+    def enter(node: str) -> None:
+        if node in on_stack:
+            raise CyclicGraphError([n for n, _ in stack] + [node])
+        on_stack.add(node)
+        stack.append((node, iter(normalize(adjacencies(node)))))
 
-        stack.append(node)
-        for adjacent in normalize(adjacencies(node)):
-            dft(adjacent, stack)
-        stack.pop()
+    for root in normalize(nodes):
+        if root in visited:
+            continue
 
-        visited.add(node)
-        postorder.insert(0, node)
-
-    for node in normalize(nodes):
-        dft(node, [])
+        enter(root)
+        while stack:
+            node, remaining = stack[-1]
+            for adjacent in remaining:
+                if adjacent not in visited:
+                    enter(adjacent)
+                    break
+            else:
+                stack.pop()
+                on_stack.remove(node)
+                visited.add(node)
+                postorder.append(node)
 
+    postorder.reverse()
     return postorder
 
+class Closures:
+    '''Memoize 'tsort([node], adjacencies, normalize)' for individual nodes,
+    deriving the result for a node from the results already computed for its
+    adjacent nodes rather than walking its entire closure again.'''
+
+    def __init__(self,
+                 adjacencies: Callable[[str], Iterable[str]],
+                 normalize:   Normalize=lambda x: x) -> None:
+        self._adjacencies = adjacencies
+        self._normalize   = normalize
+        self._sorted: Dict[str, List[str]] = {}
+
+    def _merge(self, node: str, adjacents: Iterable[str]) -> List[str]:
+        # The postorder of a depth-first traversal from 'node' is the
+        # concatenation of the postorders of its adjacent nodes, each omitting
+        # nodes already finished by a previous one, followed by 'node' itself.
+        finished: Set[str]   = set()
+        postorder: List[str] = []
+        for adjacent in adjacents:
+            for n in reversed(self._sorted[adjacent]):
+                if n not in finished:
+                    finished.add(n)
+                    postorder.append(n)
+        postorder.append(node)
+        postorder.reverse()
+        return postorder
+
+    def __call__(self, node: str) -> List[str]:
+        '''Return the topologically sorted closure of the specified 'node',
+        with 'node' first.  The returned list must not be modified.'''
+        if node in self._sorted:
+            return self._sorted[node]
+
+        adjacents = {node: list(self._normalize(self._adjacencies(node)))}
+        if all(a in self._sorted for a in adjacents[node]):
+            # If the closure of every adjacent node is known, 'node' cannot be
+            # part of a cycle.
+            self._sorted[node] = self._merge(node, adjacents[node])
+            return self._sorted[node]
+
+        def lookup(n: str) -> List[str]:
+            if n not in adjacents:
+                adjacents[n] = list(self._normalize(self._adjacencies(n)))
+            return adjacents[n]
+
+        for n in reversed(tsort([node], lookup)):
+            if n not in self._sorted:
+                self._sorted[n] = self._merge(n, adjacents[n])
+        return self._sorted[node]
+
+    def clear(self) -> None:
+        '''Forget every memoized closure.'''
+        self._sorted.clear()
@@ -1,14 +1,18 @@
 # bdemeta.resolver
 
 import abc
+import functools
+import json
+import os
 from pathlib import Path
-from typing import (Callable, cast, Dict, Generic, List, Mapping, Optional,
+from typing import (cast, Callable, Dict, Generic, List, Mapping, Optional,
                     Set, Sequence, Tuple, TypeVar)
 Node = TypeVar('Node')
 
 import bdemeta.graph
-from bdemeta.types import (Application, CMake, Config, Group, Identification,
-                           Package, Pkg, Target)
+from bdemeta.cache import ResolutionCache
+from bdemeta.types import (Application, CMake, Component, Config, Group,
+                           Identification, Package, Pkg, Target)
 
 class TargetNotFoundError(RuntimeError):
     pass
@@ -31,20 +35,36 @@ def normalize_roots(roots: List[Path], config_dir: Path) -> List[Path]:
 
     return result
 
-def bde_items(path: Path) -> Set[str]:
-    items: List[str] = []
+def ordered_bde_items(path: Path) -> List[str]:
+    '''Return the items of the BDE item file at the specified 'path' in the
+    order they first appear in it.'''
     with path.open() as items_file:
-        for l in items_file:
-            if len(l) > 0 and l[0] != '#':
-                items = items + l.split()
-    return set(items)
-
-def lookup_dependencies(name: str,
-                        deps: Callable[[str], Set[str]],
-                        seen: Mapping[str, Node]) -> Sequence[Node]:
-    targets = bdemeta.graph.tsort([name], deps, sorted)
-    targets.remove(name)
-    return [seen[t] for t in targets]
+        text = items_file.read()
+
+    if '#' not in text:
+        return list(dict.fromkeys(text.split()))
+
+    items: Dict[str, None] = {}
+    for line in text.splitlines():
+        items.update(dict.fromkeys(line.split('#', 1)[0].split()))
+    return list(items)
+
+def bde_items(path: Path) -> Set[str]:
+    return set(ordered_bde_items(path))
+
+def subdirectories(path: Path) -> List[str]:
+    try:
+        with os.scandir(path) as entries:
+            return [entry.name for entry in entries if entry.is_dir()]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+def lookup_dependencies(name:     str,
+                        closures: bdemeta.graph.Closures,
+                        seen:     Mapping[str, Node]) -> Sequence[Node]:
+    targets = closures(name)
+    assert targets[0] == name
+    return [seen[t] for t in targets[1:]]
 
 class Resolver(Generic[Node]):
     @abc.abstractmethod
@@ -58,65 +78,160 @@ class Resolver(Generic[Node]):
         '''Return the set of dependency names for a target with the specified
         'name'.'''
 
-def resolve(resolver: Resolver[Node], names: List[str]) -> List[Node]:
+    def prefetch(self, name: str) -> List[Callable[[], object]]:
+        '''Return the reads, other than of its dependencies, that resolving a
+        target with the specified 'name' requires, as functions that may be
+        called concurrently to memoize their results.'''
+        return []
+
+def prefetch_dependencies(resolver: Resolver[Node],
+                          names:    List[str],
+                          jobs:     int) -> None:
+    '''Call 'resolver.dependencies' for every target reachable from the
+    specified 'names', using the specified number of 'jobs' threads to
+    look up all targets at the same depth concurrently, then perform the
+    reads returned by 'resolver.prefetch' for all of them concurrently.'''
+    # Imported here since it is only needed with more than one job.
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Any error expected while reading metadata is raised again, in a
+    # deterministic order, when the targets are resolved.
+    def dependencies(name: str) -> Set[str]:
+        try:
+            return resolver.dependencies(name)
+        except (OSError, TargetNotFoundError):
+            return set()
+
+    def prefetch(name: str) -> List[Callable[[], object]]:
+        try:
+            return resolver.prefetch(name)
+        except (OSError, TargetNotFoundError):
+            return []
+
+    def read(function: Callable[[], object]) -> None:
+        try:
+            function()
+        except (OSError, TargetNotFoundError):
+            pass
+
+    seen     = set(names)
+    frontier = sorted(seen)
+    with ThreadPoolExecutor(jobs) as executor:
+        while frontier:
+            adjacent: Set[str] = set()
+            for deps in executor.map(dependencies, frontier):
+                adjacent.update(deps)
+            frontier = sorted(adjacent - seen)
+            seen    |= adjacent
+
+        reads = [r for rs in executor.map(prefetch, sorted(seen)) for r in rs]
+        list(executor.map(read, reads))
+
+def resolve(resolver: Resolver[Node],
+            names:    List[str],
+            jobs:     int=1) -> List[Node]:
+    if jobs > 1:
+        prefetch_dependencies(resolver, names, jobs)
+
     store: Dict[str, Node] = {}
     targets = bdemeta.graph.tsort(names, resolver.dependencies, sorted)
     for t in reversed(targets):
         store[t] = resolver.resolve(t, store)
     return [store[t] for t in targets]
 
-def build_components(path: Path) -> List[Dict[str, Optional[str]]]:
+def build_components(path: Path) -> List[Component]:
     name = path.name
-    components = []
+    with os.scandir(path) as entries:
+        files = [entry.name for entry in entries if entry.is_file()]
+
+    components: List[Component] = []
     if '+' in name:
-        for file in path.iterdir():
-            if file.suffix == '.c' or file.suffix == '.cpp':
-                components.append({
-                    'header': None,
-                    'source': str(file),
-                    'driver': None,
-                })
-            elif file.suffix == '.h':
-                components.append({
-                    'header': str(file),
-                    'source': None,
-                    'driver': None,
-                })
+        for file in files:
+            suffix = os.path.splitext(file)[1]
+            if suffix == '.c' or suffix == '.cpp':
+                components.append(Component(None, (path/file).as_posix(), None))
+            elif suffix == '.h':
+                components.append(Component((path/file).as_posix(), None, None))
     else:
-        for item in bde_items(path/'package'/(name + '.mem')):
-            base   = path/item
-            header = Path(str(base) + '.h')
-            source = Path(str(base) + '.cpp')
-            driver = Path(str(base) + '.t.cpp')
-            components.append({
-                'header': str(header) if header.is_file() else None,
-                'source': str(source),
-                'driver': str(driver) if driver.is_file() else None,
-            })
+        present = set(files)
+        for item in ordered_bde_items(path/'package'/(name + '.mem')):
+            header = item + '.h'
+            source = item + '.cpp'
+            driver = item + '.t.cpp'
+            components.append(Component(
+                (path/header).as_posix() if header in present else None,
+                (path/source).as_posix(),
+                (path/driver).as_posix() if driver in present else None,
+            ))
+    return components
+
+def cached_bde_items(cache: Optional[ResolutionCache], path: Path) -> Set[str]:
+    if cache is None:
+        return bde_items(path)
+
+    value = cache.get('items', str(path))
+    if value is not None:
+        return set(cast(List[str], value))
+    items = bde_items(path)
+    cache.put('items', str(path), sorted(items), [path])
+    return items
+
+def cached_build_components(cache: Optional[ResolutionCache],
+                            path:  Path) -> List[Component]:
+    if cache is None:
+        return build_components(path)
+
+    value = cache.get('components', str(path))
+    if value is not None:
+        return [Component(*c) for c in cast(List[List[Optional[str]]], value)]
+    components = build_components(path)
+    paths      = [path]
+    if '+' not in path.name:
+        paths.append(path/'package'/(path.name + '.mem'))
+    cache.put('components', str(path), list(components), paths)
     return components
 
 class PackageResolver(Resolver[Package]):
-    def __init__(self, group_path: Path) -> None:
+    def __init__(self,
+                 group_path: Path,
+                 cache:      Optional[ResolutionCache]=None) -> None:
         self._group_path = group_path
+        self._cache      = cache
+        self._closures   = bdemeta.graph.Closures(self.dependencies, sorted)
+        self._dependencies: Dict[str, Set[str]]          = {}
+        self._components: Dict[str, List[Component]] = {}
 
     def dependencies(self, name: str) -> Set[str]:
-        return bde_items(self._group_path/name/'package'/(name + '.dep'))
+        if name not in self._dependencies:
+            path = self._group_path/name/'package'/(name + '.dep')
+            self._dependencies[name] = cached_bde_items(self._cache, path)
+        return set(self._dependencies[name])
+
+    def components(self, name: str) -> List[Component]:
+        '''Return the components of the package with the specified 'name'.
+        The returned list must not be modified.'''
+        if name not in self._components:
+            self._components[name] = cached_build_components(
+                                                   self._cache,
+                                                   self._group_path/name)
+        return self._components[name]
 
     def resolve(self,
                 name: str,
                 resolved_packages: Mapping[str, Package]) -> Package:
         path       = self._group_path/name
-        components = build_components(path)
+        components = self.components(name)
         deps       = lookup_dependencies(name,
-                                         self.dependencies,
+                                         self._closures,
                                          resolved_packages)
-        return Package(str(path), deps, components)
+        return Package(path.as_posix(), deps, components)
 
 class TargetResolver(Resolver[Target]):
     def __init__(self,
                  config: Config,
                  incl_test_deps: bool=False,
-                 plugin_tests: bool=False) -> None:
+                 plugin_tests: bool=False,
+                 cache_path: Optional[Path]=None) -> None:
         self._roots                     = cast(List[Path], config['roots'])
         self._conan_roots               = cast(List[Path], config.get('conan_roots', []))
         self._standalones               = cast(Set[str],
@@ -131,6 +246,15 @@ class TargetResolver(Resolver[Target]):
                                                          {}))
         self._plugin_tests             = plugin_tests
         self._incl_test_deps           = incl_test_deps
+        self._closures                 = bdemeta.graph.Closures(
+                                                         self.dependencies,
+                                                         sorted)
+        self._identifications: Dict[str, Identification] = {}
+        self._dependencies: Dict[str, Set[str]]          = {}
+        self._root_indices: Dict[Path, Dict[str, List[Identification]]] = {}
+        self._members: Dict[str, Set[str]]                   = {}
+        self._package_resolvers: Dict[str, PackageResolver] = {}
+        self._components: Dict[str, List[Component]]         = {}
 
         providers = config.get('providers', {})
         assert isinstance(providers, dict)
@@ -145,57 +269,165 @@ class TargetResolver(Resolver[Target]):
         runtime_libs = cast(List[str], config.get('runtime_libraries', []))
         self._runtime_libs = set(runtime_libs)
 
-    @staticmethod
-    def _is_group(root: Path, name: str) -> Optional[Path]:
-        path = root/'groups'/name
-        if path.is_dir() and (path/'group').is_dir():
-            return path
-        return None
+        self._cache: Optional[ResolutionCache] = None
+        if cache_path is not None:
+            # Identifications depend on the roots and the standalone
+            # categories searched within them, so a cache populated under a
+            # different configuration is discarded.
+            key = json.dumps({
+                'roots':       [str(root) for root in self._roots],
+                'standalones': sorted(self._standalones),
+            })
+            self._cache = ResolutionCache(cache_path, key)
 
-    def _is_standalone(self, root: Path, name: str) -> Optional[Path]:
-        for category in self._standalones:
-            path = root/category/name
-            if path.is_dir() and (path/'package').is_dir():
-                return path
-        return None
+    @property
+    def cache(self) -> Optional[ResolutionCache]:
+        '''The cache of the metadata read by this resolver, if any.'''
+        return self._cache
 
-    def _is_application(self, root: Path, name: str) -> Optional[Path]:
-        path = root/'applications'/name
-        if path.is_dir() and (path/'package').is_dir() \
-                         and (path/f'{name}.m.cpp').is_file():
-            return path
-        return None
+    def save_cache(self) -> None:
+        '''Write the metadata read so far to the cache file, if any.'''
+        if self._cache is not None:
+            self._cache.save()
 
-    @staticmethod
-    def _is_cmake(root: Path, name: str) -> Optional[Path]:
-        if root.stem == name and (root/'CMakeLists.txt').is_file():
-            return root
-        path = root/'thirdparty'/name
-        if path.is_dir() and (path/'CMakeLists.txt').is_file():
-            return path
-        return None
+    def _index_root(self, root: Path) -> Dict[str, List[Identification]]:
+        # Map each name to the candidate identifications for it in 'root', in
+        # order of precedence.  Candidates are only checked for the metadata
+        # that distinguishes them when they are looked up.
+        index: Dict[str, List[Identification]] = {}
 
-    def identify_root(self, name: str) -> Optional[Tuple[Path, Identification]]:
+        def add(name: str, type: str, path: Path) -> None:
+            index.setdefault(name, []).append(Identification(type, path))
+
+        for name in subdirectories(root/'groups'):
+            add(name, 'group', root/'groups'/name)
+        for category in self._standalones:
+            for name in subdirectories(root/category):
+                add(name, 'package', root/category/name)
+        for name in subdirectories(root/'applications'):
+            add(name, 'application', root/'applications'/name)
+        add(root.stem, 'cmake', root)
+        for name in subdirectories(root/'thirdparty'):
+            add(name, 'cmake', root/'thirdparty'/name)
+        return index
+
+    @staticmethod
+    def _is_valid(name: str, candidate: Identification) -> bool:
+        path = candidate.path
+        assert isinstance(path, Path)
+        if candidate.type == 'group':
+            return (path/'group').is_dir()
+        elif candidate.type == 'package':
+            return (path/'package').is_dir()
+        elif candidate.type == 'application':
+            return (path/'package').is_dir() and \
+                                             (path/f'{name}.m.cpp').is_file()
+        else:
+            assert candidate.type == 'cmake'
+            return (path/'CMakeLists.txt').is_file()
+
+    def _search_roots(self, name: str) -> Tuple[
+                                        Optional[Tuple[Path, Identification]],
+                                        List[Path]]:
+        # Return the identification of 'name' along with the directories whose
+        # contents it was derived from.
+        paths: List[Path] = []
         for root in self._roots:
-            path = TargetResolver._is_group(root, name)
-            if path is not None:
-                return root, Identification('group', path)
+            if root not in self._root_indices:
+                self._root_indices[root] = self._index_root(root)
 
-            path = self._is_standalone(root, name)
-            if path is not None:
-                return root, Identification('package', path)
+            paths.append(root)
+            paths.append(root/'groups')
+            paths.extend(root/category for category in self._standalones)
+            paths.append(root/'applications')
+            paths.append(root/'thirdparty')
 
-            path = self._is_application(root, name)
-            if path is not None:
-                return root, Identification('application', path)
+            for candidate in self._root_indices[root].get(name, []):
+                assert isinstance(candidate.path, Path)
+                paths.append(candidate.path)
+                if TargetResolver._is_valid(name, candidate):
+                    return (root, candidate), paths
 
-            path = TargetResolver._is_cmake(root, name)
-            if path is not None:
-                return root, Identification('cmake', path)
+        return None, paths
+
+    def identify_root(self, name: str) -> Optional[Tuple[Path, Identification]]:
+        if self._cache is not None:
+            value = self._cache.get('identification', name)
+            if value is not None:
+                entry = cast(Dict[str, str], value)
+                if not entry:
+                    return None
+                return Path(entry['root']), Identification(entry['type'],
+                                                           Path(entry['path']))
+
+        result, paths = self._search_roots(name)
+        if self._cache is not None:
+            entry = {}
+            if result is not None:
+                root, identification = result
+                entry = {
+                    'root': str(root),
+                    'type': identification.type,
+                    'path': str(identification.path),
+                }
+            self._cache.put('identification', name, entry, paths)
+        return result
 
+    def invalidate(self, name: Optional[str]=None) -> None:
+        '''Forget the identification and dependencies of the target with the
+        specified 'name', or of every target if 'name' is not specified, so
+        that they are read again when next required.  Forgetting every target
+        also forgets the contents of each root.'''
+        if name is None:
+            self._identifications.clear()
+            self._dependencies.clear()
+            self._root_indices.clear()
+            self._members.clear()
+            self._package_resolvers.clear()
+            self._components.clear()
+        else:
+            self._identifications.pop(name, None)
+            self._dependencies.pop(name, None)
+            self._members.pop(name, None)
+            self._package_resolvers.pop(name, None)
+            self._components.pop(name, None)
+        self._closures.clear()
+        if self._cache is not None:
+            self._cache.forget_stats()
+
+    def owner(self, component: str) -> Optional[str]:
+        '''Return the name of the target containing the component with the
+        specified name, or 'None' if there is no such target.  The package
+        of a component is named by one of its '_'-separated prefixes, and is
+        either a target itself or a member of the group named by its first
+        three characters.'''
+        parts = component.split('_')
+        for length in range(len(parts) - 1, 0, -1):
+            package = '_'.join(parts[:length])
+            root_identity = self.identify_root(package)
+            if root_identity:
+                return package
+            root_identity = self.identify_root(package[:3])
+            if root_identity and root_identity[1].type == 'group':
+                path = root_identity[1].path
+                assert isinstance(path, Path)
+                members = cached_bde_items(self._cache,
+                                           path/'group'/(package[:3] + '.mem'))
+                if package in members:
+                    return package[:3]
         return None
 
+    def depends_on(self, name: str, targets: Set[str]) -> bool:
+        '''Return whether the target with the specified 'name' is, or
+        transitively depends on, any of the specified 'targets'.'''
+        return not targets.isdisjoint(self._closures(name))
+
     def identify(self, name: str) -> Identification:
+        if name not in self._identifications:
+            self._identifications[name] = self._identify(name)
+        return self._identifications[name]
+
+    def _identify(self, name: str) -> Identification:
         root_identity = self.identify_root(name)
         if root_identity:
             root, identification = root_identity
@@ -215,6 +447,11 @@ class TargetResolver(Resolver[Target]):
         raise TargetNotFoundError(name)
 
     def dependencies(self, name: str) -> Set[str]:
+        if name not in self._dependencies:
+            self._dependencies[name] = self._read_dependencies(name)
+        return set(self._dependencies[name])
+
+    def _read_dependencies(self, name: str) -> Set[str]:
         target = self.identify(name)
 
         result = set()
@@ -227,14 +464,49 @@ class TargetResolver(Resolver[Target]):
                 meta_directory = target.type
 
             assert isinstance(target.path, Path)
-            result |= bde_items(target.path/meta_directory/(name + '.dep'))
+            result |= cached_bde_items(self._cache,
+                                       target.path/meta_directory/(name + '.dep'))
             if self._incl_test_deps:
                 test_deps_path = target.path/meta_directory/(name + '.t.dep')
                 if test_deps_path.is_file():
-                    result |= bde_items(test_deps_path)
+                    result |= cached_bde_items(self._cache, test_deps_path)
         result |= set(self._extra_dependencies.get(name, []))
         return result
 
+    def _group_members(self, name: str, path: Path) -> Set[str]:
+        if name not in self._members:
+            self._members[name] = cached_bde_items(
+                                         self._cache,
+                                         path/'group'/(name + '.mem'))
+        return self._members[name]
+
+    def _package_resolver(self, name: str, path: Path) -> PackageResolver:
+        if name not in self._package_resolvers:
+            self._package_resolvers[name] = PackageResolver(path, self._cache)
+        return self._package_resolvers[name]
+
+    def _target_components(self, name: str, path: Path) -> List[Component]:
+        # The returned list must not be modified.
+        if name not in self._components:
+            self._components[name] = cached_build_components(self._cache, path)
+        return self._components[name]
+
+    def prefetch(self, name: str) -> List[Callable[[], object]]:
+        identification = self.identify(name)
+        path           = identification.path
+        if identification.type == 'group':
+            assert isinstance(path, Path)
+            packages = self._package_resolver(name, path)
+            reads: List[Callable[[], object]] = []
+            for member in sorted(self._group_members(name, path)):
+                reads.append(functools.partial(packages.dependencies, member))
+                reads.append(functools.partial(packages.components, member))
+            return reads
+        if identification.type in {'application', 'package'}:
+            assert isinstance(path, Path)
+            return [functools.partial(self._target_components, name, path)]
+        return []
+
     @staticmethod
     def _add_override(identification: Identification,
                       name: str,
@@ -242,40 +514,41 @@ class TargetResolver(Resolver[Target]):
         assert(identification.path is not None)
         overrides = identification.path/(name + '.cmake')
         if overrides.is_file():
-            target.overrides = str(overrides)
+            target.overrides = overrides.as_posix()
 
     def resolve(self, name: str, seen: Dict[str, Target]) -> Target:
-        deps = lookup_dependencies(name, self.dependencies, seen)
+        deps = lookup_dependencies(name, self._closures, seen)
 
         identification = self.identify(name)
 
         result: Target
         if identification.type == 'group':
             assert isinstance(identification.path, Path)
-            path = identification.path/'group'/(name + '.mem')
-            packages = resolve(PackageResolver(identification.path),
-                               list(bde_items(path)))
-            result = Group(str(identification.path), deps, packages)
+            members  = self._group_members(name, identification.path)
+            packages = resolve(self._package_resolver(name,
+                                                      identification.path),
+                               sorted(members))
+            result = Group(identification.path.as_posix(), deps, packages)
             TargetResolver._add_override(identification, name, result)
         elif identification.type == 'package':
             assert isinstance(identification.path, Path)
-            components = build_components(identification.path)
-            result = Package(str(identification.path), deps, components)
+            components = self._target_components(name, identification.path)
+            result = Package(identification.path.as_posix(), deps, components)
             TargetResolver._add_override(identification, name, result)
         elif identification.type == 'application':
             assert isinstance(identification.path, Path)
-            components = build_components(identification.path)
-            main_file = str(identification.path/f'{name}.m.cpp')
-            if main_file not in {c['source'] for c in components}:
-                components.append({
-                    'header': None,
-                    'source': main_file,
-                    'driver': None,
-                })
-            result = Application(str(identification.path), deps, components)
+            components = list(self._target_components(name,
+                                                      identification.path))
+            main_file = (identification.path/f'{name}.m.cpp').as_posix()
+            if main_file not in {c.source for c in components}:
+                components.append(Component(None, main_file, None))
+            result = Application(identification.path.as_posix(),
+                                 deps,
+                                 components)
             TargetResolver._add_override(identification, name, result)
         elif identification.type == 'cmake':
-            result = CMake(name, str(identification.path), deps)
+            assert isinstance(identification.path, Path)
+            result = CMake(name, identification.path.as_posix(), deps)
         elif identification.type == 'pkg_config':
             assert isinstance(identification.package, str)
             result = Pkg(name, identification.package, deps)
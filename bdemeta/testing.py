@@ -1,32 +1,192 @@
 # bdemeta.testing
 
+import collections
+import contextlib
+import datetime
 import enum
-import itertools
+import fnmatch
+import hashlib
+import json
 import multiprocessing
+import multiprocessing.pool
+import multiprocessing.synchronize
+import os
+import queue
+import signal
+import socket
 import subprocess
 import sys
-from typing import Callable, List, Set, TextIO, Tuple
+import threading
+import time
+import xml.sax.saxutils
+from pathlib import Path
+from typing import (BinaryIO, Callable, Dict, Iterable, Iterator, List,
+                    Mapping, NamedTuple, Optional, Set, TextIO, Tuple)
+
+from bdemeta.cache import ResolutionCache
 
 class RunResult(enum.Enum):
     SUCCESS      = enum.auto()
     FAILURE      = enum.auto()
     NO_SUCH_CASE = enum.auto()
+    TIMEOUT      = enum.auto()
+    CANCELLED    = enum.auto()  # see 'driver_pool'
+
+class Environment(NamedTuple):
+    '''The working directory and environment variables in which to run test
+    drivers.'''
+    cwd: str
+    env: Dict[str, str]
+
+# A runner runs a command with an optional timeout in seconds, writing its
+# output to the file at an optional path, and discarding it otherwise, in an
+# optional environment rather than that of the current process.
+Runner = Callable[[List[str],
+                   Optional[float],
+                   Optional[str],
+                   Optional[Environment]],
+                  RunResult]
+
+class ServiceError(RuntimeError):
+    pass
+
+# The status with which a process exiting with '-1' is seen to exit: the low
+# byte on POSIX systems and the full 32-bit value on Windows.
+minus_one_rc = 0xFFFFFFFF if sys.platform == 'win32' else 0xFF
+
+def kill_group(process: 'subprocess.Popen[bytes]') -> None:
+    '''Kill the specified 'process' along with any processes it started.'''
+    if sys.platform == 'win32':
+        process.kill()
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+class RunningDrivers:
+    '''The drivers being run by 'test_runner' in this process.  Once the
+    event given to 'watch' is set, those running are killed and no more are
+    started.'''
+
+    def __init__(self) -> None:
+        self._lock      = threading.Lock()
+        self._running: Dict['subprocess.Popen[bytes]', bool] = {}
+        self._cancelled: Optional[multiprocessing.synchronize.Event] = None
+
+    def watch(self, cancelled: multiprocessing.synchronize.Event) -> None:
+        self._cancelled = cancelled
+        threading.Thread(target=self._kill_when_cancelled,
+                         daemon=True).start()
 
-Runner = Callable[[List[str]], RunResult]
+    def _kill_when_cancelled(self) -> None:
+        assert self._cancelled is not None
+        self._cancelled.wait()
+        with self._lock:
+            for process, grouped in self._running.items():
+                if grouped:
+                    kill_group(process)
+                else:
+                    process.kill()
 
-minus_one_rc = subprocess.run([sys.executable,
-                               '-c',
-                               'import sys; sys.exit(-1)']).returncode
+    def start(self,
+              command:     List[str],
+              output:      Optional[BinaryIO],
+              grouped:     bool,
+              environment: Optional[Environment]) \
+                                       -> Optional['subprocess.Popen[bytes]']:
+        '''Start the specified 'command', writing its output to the
+        optionally specified 'output', in a process group of its own if
+        'grouped' is set, and in the optionally specified 'environment'.
+        Return the process started, or 'None' if the drivers of this process
+        have been cancelled.'''
+        with self._lock:
+            if self.cancelled():
+                return None
+            cwd, env = environment or (None, None)
+            process  = subprocess.Popen(command,
+                                        stdout=output or subprocess.DEVNULL,
+                                        stderr=subprocess.STDOUT,
+                                        start_new_session=grouped,
+                                        cwd=cwd,
+                                        env=env)
+            self._running[process] = grouped
+        return process
 
-def test_runner(command: List[str]) -> RunResult:
+    def finished(self, process: 'subprocess.Popen[bytes]') -> None:
+        with self._lock:
+            del self._running[process]
+
+    def cancelled(self) -> bool:
+        return self._cancelled is not None and self._cancelled.is_set()
+
+running_drivers = RunningDrivers()
+
+def watch_drivers(cancelled: multiprocessing.synchronize.Event) -> None:
+    running_drivers.watch(cancelled)
+
+def driver_pool(processes: int, method: Optional[str]=None) \
+                -> Tuple[multiprocessing.pool.Pool,
+                         multiprocessing.synchronize.Event]:
+    '''Return a pool of the specified number of 'processes', started by the
+    optionally specified 'method', along with an event that, once set, has
+    the drivers being run by 'test_runner' in them killed and no more
+    run.'''
+    context   = multiprocessing.get_context(method)
+    cancelled = context.Event()
+    pool      = context.Pool(processes,
+                             initializer=watch_drivers,
+                             initargs=(cancelled,))
+    return pool, cancelled
+
+def test_runner(command:     List[str],
+                timeout:     Optional[float]=None,
+                output:      Optional[str]=None,
+                environment: Optional[Environment]=None) -> RunResult:
+    # The output of the driver goes straight to the log file or to the null
+    # device, never through this process.  The log file is removed again
+    # unless the case failed.
+    log       = open(output, 'wb') if output is not None else None
+    timed_out = False
     try:
-        subprocess.check_output(command, stderr=subprocess.STDOUT)
-    except subprocess.CalledProcessError as e:
-        if e.returncode == minus_one_rc:
-            return RunResult.NO_SUCH_CASE
-        else:
-            return RunResult.FAILURE
-    return RunResult.SUCCESS
+        # A driver that times out is killed along with everything it started,
+        # so it is run in a process group of its own.
+        process = running_drivers.start(command,
+                                        log,
+                                        timeout is not None and \
+                                                     sys.platform != 'win32',
+                                        environment)
+        if process is not None:
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                kill_group(process)
+                process.wait()
+                timed_out = True
+            finally:
+                running_drivers.finished(process)
+    finally:
+        if log is not None:
+            log.close()
+
+    # A driver killed, or never started, because the drivers of this process
+    # were cancelled, as per 'driver_pool', has no result of its own.
+    if process is None or running_drivers.cancelled():
+        result = RunResult.CANCELLED
+    elif timed_out:
+        result = RunResult.TIMEOUT
+    elif process.returncode == 0:
+        result = RunResult.SUCCESS
+    elif process.returncode == minus_one_rc:
+        result = RunResult.NO_SUCH_CASE
+    else:
+        result = RunResult.FAILURE
+
+    if output is not None and result in (RunResult.SUCCESS,
+                                         RunResult.NO_SUCH_CASE,
+                                         RunResult.CANCELLED):
+        os.unlink(output)
+    return result
 
 class MockRunner:
     def __init__(self, behaviour: str) -> None:
@@ -34,12 +194,24 @@ class MockRunner:
         self._behaviour                = behaviour
         self._run                      = 0
 
-    def __call__(self, command: List[str]) -> RunResult:
+    def __call__(self,
+                 command:     List[str],
+                 timeout:     Optional[float]=None,
+                 output:      Optional[str]=None,
+                 environment: Optional[Environment]=None) -> RunResult:
         self.commands.append(command)
-        if self._run >= len(self._behaviour):
+        if command and command[-1].isdigit():
+            # Cases may be run in any order, so behave according to the case
+            # requested rather than the number of commands run.
+            index = int(command[-1]) - 1
+        else:
+            index      = self._run
+            self._run += 1
+        if index >= len(self._behaviour):
             return RunResult.NO_SUCH_CASE
-        code = self._behaviour[self._run]
-        self._run += 1
+        code = self._behaviour[index]
+        if code == 't':
+            return RunResult.TIMEOUT
         return RunResult.SUCCESS if code == 's' else RunResult.FAILURE
 
 def trim(value: str, max_length: int, trail: str='...') -> str:
@@ -49,20 +221,860 @@ def trim(value: str, max_length: int, trail: str='...') -> str:
         return value
     return value[:max_length - len(trail)] + trail
 
-def run_one(args:      Tuple[Runner, List[str], int, str, str]) \
-                                                       -> Tuple[str, Set[int]]:
-    runner, executor, max_cases, name, test = args
-    errors = set()
-
-    span = itertools.count(1) if max_cases == -1 else range(1, max_cases + 1)
-    for case in span:
-        command = executor + [test, str(case)]
-        result  = runner(command)
-        if result == RunResult.FAILURE:
-            errors.add(case)
+def log_prefix(log_dir: Optional[Path], name: str) -> Optional[str]:
+    '''Return the prefix of the paths of the logs of the driver with the
+    specified 'name' in the specified 'log_dir', if any.'''
+    if log_dir is None:
+        return None
+    return str(log_dir / name.replace('/', '_').replace(os.sep, '_'))
+
+def log_file(prefix: str, case: int) -> str:
+    return f'{prefix}.{case}.log'
+
+def tail(path: str, size: int=4096) -> str:
+    '''Return at most the last 'size' bytes of the file at the specified
+    'path', starting at a line boundary where possible.'''
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        length = f.tell()
+        f.seek(max(0, length - size))
+        data = f.read()
+    if length > size and b'\n' in data:
+        data = data[data.index(b'\n') + 1:]
+    return data.decode(errors='replace')
+
+# A runner, executor, driver, case (or maximum number of cases for discovery),
+# timeout, log prefix and environment.
+Case = Tuple[Runner,
+             List[str],
+             str,
+             int,
+             Optional[float],
+             Optional[str],
+             Optional[Environment]]
+
+def run_case(args: Case) -> RunResult:
+    runner, executor, test, case, timeout, logs, environment = args
+    output = log_file(logs, case) if logs is not None else None
+    return runner(executor + [test, str(case)], timeout, output, environment)
+
+class Outcome(NamedTuple):
+    result:   RunResult
+    start:    float  # time since the epoch at which the case started
+    duration: float  # in seconds
+    worker:   int    # process id of the worker that ran the case
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+def timed_case(args: Case) -> Outcome:
+    start   = time.time()
+    elapsed = time.monotonic()
+    result  = run_case(args)
+    return Outcome(result, start, time.monotonic() - elapsed, os.getpid())
+
+class Discovery(NamedTuple):
+    cases:    int                 # number of cases found
+    exact:    bool                # whether 'cases' was not capped
+    outcomes: Dict[int, Outcome]  # outcomes of the cases run along the way
+
+    @property
+    def results(self) -> Dict[int, RunResult]:
+        return {c: o.result for c, o in self.outcomes.items()}
+
+def discover_cases(args: Case) -> Discovery:
+    '''Find the number of cases of a driver by running cases at
+    exponentially increasing numbers until one does not exist, then
+    bisecting between the last case found and the first one missing.  Stop
+    as soon as a case is cancelled, as per 'driver_pool'.'''
+    runner, executor, test, max_cases, timeout, logs, environment = args
+    outcomes: Dict[int, Outcome] = {}
+    missing   = False
+    cancelled = False
+
+    def exists(case: int) -> bool:
+        nonlocal missing, cancelled
+        if max_cases != -1 and case > max_cases:
+            return False
+        outcomes[case] = timed_case((runner,
+                                     executor,
+                                     test,
+                                     case,
+                                     timeout,
+                                     logs,
+                                     environment))
+        if outcomes[case].result == RunResult.NO_SUCH_CASE:
+            missing = True
+            return False
+        if outcomes[case].result == RunResult.CANCELLED:
+            cancelled = True
+            return False
+        return True
+
+    found, absent = 0, 1
+    while exists(absent):
+        found, absent = absent, absent * 2
+    while absent - found > 1 and not cancelled:
+        middle = (found + absent) // 2
+        if exists(middle):
+            found = middle
+        else:
+            absent = middle
+    return Discovery(found,
+                     missing,
+                     {c: o for c, o in outcomes.items() if c <= found})
+
+def file_digest(path: str) -> Optional[str]:
+    '''Return the SHA-256 digest of the contents of the file at the specified
+    'path', or 'None' if it cannot be read.'''
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+class Timings:
+    '''The durations of individual test cases, keyed by driver name and
+    optionally persisted in a file across runs.'''
+
+    def __init__(self, path: Optional[Path]=None) -> None:
+        self._cache = ResolutionCache(path, 'timings') if path else None
+        self._durations: Dict[str, Dict[int, float]] = {}
+
+    def _driver(self, name: str) -> Dict[int, float]:
+        if name not in self._durations:
+            stored = self._cache.get('timings', name) if self._cache else None
+            if isinstance(stored, dict):
+                self._durations[name] = {int(c): float(d)
+                                                  for c, d in stored.items()}
+            else:
+                self._durations[name] = {}
+        return self._durations[name]
+
+    def expected(self, name: str, case: int) -> Optional[float]:
+        '''Return the expected duration of the specified 'case' of the
+        driver with the specified 'name', or 'None' if it is unknown.'''
+        return self._driver(name).get(case)
+
+    def total(self, name: str) -> Optional[float]:
+        '''Return the expected duration of all cases of the driver with the
+        specified 'name', or 'None' if it has never been run.'''
+        durations = self._driver(name)
+        return sum(durations.values()) if durations else None
+
+    def record(self, name: str, case: int, seconds: float) -> None:
+        '''Record that the specified 'case' of the driver with the specified
+        'name' took the specified number of 'seconds'.  The expected
+        duration is smoothed over previous runs.'''
+        durations = self._driver(name)
+        previous  = durations.get(case)
+        durations[case] = seconds if previous is None else \
+                                                       (previous + seconds) / 2
+
+    def slowest(self, names: Iterable[str], count: int) \
+                                            -> List[Tuple[str, int, float]]:
+        '''Return the specified 'count' slowest cases of the drivers with
+        the specified 'names', slowest first.'''
+        cases = []
+        for name in names:
+            for case, duration in self._driver(name).items():
+                cases.append((name, case, duration))
+        return sorted(cases, key=lambda c: c[2], reverse=True)[:count]
+
+    def save(self) -> None:
+        if self._cache is None:
+            return
+        for name, durations in self._durations.items():
+            if durations:
+                self._cache.put('timings',
+                                name,
+                                {str(c): d for c, d in durations.items()},
+                                [])
+        self._cache.save()
+
+class ResultCache:
+    '''The cases of each test driver that passed when it was last run, keyed
+    by a digest of the driver and the executor it was run with, and
+    persisted in a file across runs.'''
+
+    def __init__(self,
+                 path:     Path,
+                 executor: List[str],
+                 reuse:    bool=True) -> None:
+        '''Load the results stored at the specified 'path' for drivers run
+        with the specified 'executor'.  If 'reuse' is not set, no stored
+        results are returned, but new results are still recorded.'''
+        self._cache    = ResolutionCache(path, 'results')
+        self._executor = executor
+        self._reuse    = reuse
+        self.served    = 0  # number of cases skipped thanks to this cache
+
+    def _key(self, digest: str) -> str:
+        return json.dumps([digest] + self._executor)
+
+    def passed(self, digest: str) -> Tuple[Optional[int], List[int]]:
+        '''Return the number of cases of the driver with the specified
+        'digest', or 'None' if it is unknown, along with those of its cases
+        that passed.'''
+        stored = None
+        if self._reuse:
+            stored = self._cache.get('results', self._key(digest))
+        if not isinstance(stored, dict):
+            return None, []
+        cases = stored.get('cases')
+        return cases if isinstance(cases, int) else None, \
+                                  [int(c) for c in stored.get('passed', [])]
+
+    def record(self,
+               digest: str,
+               cases:  Optional[int],
+               passed: Iterable[int]) -> None:
+        '''Record that the driver with the specified 'digest' has the
+        specified number of 'cases', if known, of which the specified
+        'passed' cases passed.'''
+        self._cache.put('results',
+                        self._key(digest),
+                        {'cases': cases, 'passed': sorted(passed)},
+                        [])
+
+    def save(self) -> None:
+        self._cache.save()
+
+class Driver:
+    '''The scheduling state of one test driver whose cases are being run
+    concurrently.'''
+
+    def __init__(self,
+                 name:      str,
+                 test:      str,
+                 max_cases: int,
+                 timeout:   Optional[float]=None,
+                 logs:      Optional[str]=None) -> None:
+        self.name                        = name
+        self.test                        = test
+        self.timeout                     = timeout
+        self.logs                        = logs
+        self.next_case                   = 1
+        self.limit: Optional[int]        = \
+                                   None if max_cases == -1 else max_cases + 1
+        self.in_flight                   = 0
+        self.errors: Dict[int, RunResult] = {}
+        self.finished: Set[int]          = set()
+        self.digest: Optional[str]       = None
+        self.exact                       = False
+        self.counted                     = False
+        self.discovering                 = False
+        self.order: Optional[List[int]]  = None
+
+    def has_work(self) -> bool:
+        '''Return whether a case of this driver may still need running.'''
+        if self.discovering:
+            return False
+        if self.order is not None:
+            return bool(self.order)
+        return self.limit is None or self.next_case < self.limit
+
+    def is_done(self) -> bool:
+        return not self.discovering and \
+                                   not self.has_work() and self.in_flight == 0
+
+    def take(self) -> int:
+        '''Return the next case of this driver to run.'''
+        self.in_flight += 1
+        if self.order is not None:
+            return self.order.pop()
+        case = self.next_case
+        self.next_case += 1
+        while self.next_case in self.finished:
+            self.next_case += 1
+        return case
+
+    def record(self, case: int, result: RunResult) -> None:
+        self.in_flight -= 1
+        if self.limit is not None and case >= self.limit:
+            # A speculative run past the last case.
+            return
+        if result in (RunResult.FAILURE, RunResult.TIMEOUT):
+            self.errors[case] = result
         elif result == RunResult.NO_SUCH_CASE:
-            break
-    return name, errors
+            self.limit   = case
+            self.exact   = True
+            self.counted = True
+            self.errors = {c: r for c, r in self.errors.items() if c < case}
+        elif result == RunResult.CANCELLED:
+            # No later case is run, without knowing whether it exists.
+            if self.limit is None or case < self.limit:
+                self.limit = case
+                self.exact = False
+
+    def skip(self, cases: Iterable[int]) -> int:
+        '''Do not run the specified 'cases' of this driver, which are known
+        to pass, and return the number of cases skipped as a result.'''
+        skipped = 0
+        for case in cases:
+            if case >= self.next_case and case not in self.finished and \
+                                  (self.limit is None or case < self.limit):
+                self.finished.add(case)
+                skipped += 1
+        while self.next_case in self.finished:
+            self.next_case += 1
+        return skipped
+
+    def discovered(self,
+                   cases:    int,
+                   results:  Mapping[int, RunResult],
+                   expected: Optional[Callable[[int], Optional[float]]]=None,
+                   exact:    bool=True) -> None:
+        '''Record that this driver has the specified number of 'cases', of
+        which those in the specified 'results' have already been run.  If the
+        optionally specified 'expected' durations are given, run the remaining
+        cases longest first, starting with those of unknown duration.  Unless
+        'exact' is unset, 'cases' is all of the cases of this driver rather
+        than merely as many as may be run.'''
+        self.discovering = False
+        self.counted     = True
+        if self.limit is None or cases + 1 <= self.limit:
+            self.limit = cases + 1
+            self.exact = exact
+        for case, result in results.items():
+            self.finished.add(case)
+            if result in (RunResult.FAILURE, RunResult.TIMEOUT):
+                self.errors[case] = result
+        while self.next_case in self.finished:
+            self.next_case += 1
+
+        if expected is not None:
+            def priority(case: int) -> Tuple[float, int]:
+                duration = expected(case)
+                if duration is None:
+                    duration = float('inf')
+                return duration, -case
+            self.order = sorted((c for c in range(self.next_case, self.limit)
+                                                  if c not in self.finished),
+                                key=priority)
+
+def load_average() -> Optional[float]:
+    '''Return the system load averaged over the last minute, or 'None' if it
+    is unavailable.'''
+    if sys.platform == 'win32':
+        return None
+    else:
+        try:
+            return os.getloadavg()[0]
+        except OSError:
+            return None
+
+def available_memory() -> Optional[int]:
+    '''Return the number of bytes of memory available for starting new
+    processes without swapping, or 'None' if it is unknown.'''
+    if sys.platform == 'win32':
+        return None
+    else:
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        try:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return None
+
+class Throttle:
+    '''Limit the number of test cases run at once to fewer than a maximum
+    number of 'jobs' when the machine is busy or short of memory.  The limit
+    is re-evaluated at most once per 'interval' seconds.'''
+
+    def __init__(self,
+                 jobs:        int,
+                 auto:        bool=False,
+                 mem_per_job: Optional[int]=None,
+                 interval:    float=1.0,
+                 load:        Callable[[], Optional[float]]=load_average,
+                 memory:      Callable[[], Optional[int]]=available_memory,
+                 clock:       Callable[[], float]=time.monotonic) -> None:
+        '''If 'auto' is set, leave as many of the 'jobs' idle as the load
+        average shows to be used by other processes.  If 'mem_per_job' is
+        specified, start no more cases than that many bytes each fit in the
+        memory available at the start of the run, nor than fit in the memory
+        available at any point during the run.'''
+        self._jobs                  = jobs
+        self._auto                  = auto
+        self._mem_per_job           = mem_per_job
+        self._interval              = interval
+        self._load                  = load
+        self._memory                = memory
+        self._clock                 = clock
+        self._checked: Optional[float] = None
+        self._budget: Optional[int]    = None
+        self._allowed               = jobs
+
+    def _evaluate(self, running: int) -> int:
+        allowed = self._jobs
+        if self._auto:
+            load = self._load()
+            if load is not None:
+                # The load average includes the cases already running.
+                allowed -= round(max(0.0, load - running))
+        if self._mem_per_job:
+            available = self._memory()
+            if available is not None:
+                if self._budget is None:
+                    self._budget = available // self._mem_per_job
+                allowed = min(allowed,
+                              self._budget,
+                              running + available // self._mem_per_job)
+        return max(1, allowed)
+
+    def __call__(self, running: int) -> int:
+        '''Return how many cases may run at once, given that the specified
+        number of cases are 'running'.'''
+        now = self._clock()
+        if self._checked is None or now - self._checked >= self._interval:
+            self._checked = now
+            self._allowed = self._evaluate(running)
+        return self._allowed
+
+# The failed cases of each driver, mapped to whether they failed or timed out.
+Results = Iterable[Tuple[str, Dict[int, RunResult]]]
+
+# Called with the name of a driver, a case and its outcome as each case that
+# exists finishes.
+CaseListener = Callable[[str, int, Outcome], None]
+
+# The number of cases run at once of a driver whose number of cases is not yet
+# known, when run by an executor.  Every case run past the last one costs a
+# full start of the executor, which may be far more expensive than that of a
+# native test driver.
+EXECUTOR_READ_AHEAD = 2
+
+def driver_timeout(name:      str,
+                   timeout:   Optional[float],
+                   overrides: Mapping[str, float]) -> Optional[float]:
+    '''Return the timeout of each case of the driver with the specified
+    'name': that of the first of the specified 'overrides' whose pattern
+    matches 'name', or the specified default 'timeout' otherwise.'''
+    for pattern, seconds in overrides.items():
+        if fnmatch.fnmatch(name, pattern):
+            return seconds
+    return timeout
+
+def run_jobs(pool:        multiprocessing.pool.Pool,
+             runner:      Runner,
+             executor:    List[str],
+             tests:       List[Tuple[str, str]],
+             max_cases:   int,
+             jobs:        int=os.cpu_count() or 1,
+             discover:    bool=False,
+             cache:       Optional[ResolutionCache]=None,
+             timings:     Optional[Timings]=None,
+             timeout:     Optional[float]=None,
+             overrides:   Optional[Mapping[str, float]]=None,
+             log_dir:     Optional[Path]=None,
+             fail_fast:   bool=False,
+             results:     Optional[ResultCache]=None,
+             on_case:     Optional[CaseListener]=None,
+             capacity:    Optional[Callable[[int], int]]=None,
+             cancel:      Optional[multiprocessing.synchronize.Event]=None,
+             environment: Optional[Environment]=None) -> Results:
+    '''Run the cases of the specified 'tests' individually on the specified
+    'pool' of 'jobs' processes, yielding the failed cases of each driver as
+    soon as all of its cases have been run.  Cases are handed out
+    round-robin across drivers, and each driver runs up to 'jobs' cases
+    ahead of the last one known to exist, so that idle processes pick up the
+    cases of long drivers rather than waiting for them, or only up to
+    'EXECUTOR_READ_AHEAD' cases if an 'executor' is given.  If 'discover' is
+    set, the number of cases of each driver is instead found up front by
+    'discover_cases', or looked up by driver digest in the optionally
+    specified 'cache', so that no case is run speculatively.  If
+    'timings' are specified, the duration of every case is recorded in them
+    and the drivers and discovered cases expected to take longest are run
+    first.  Each case is given the optionally specified 'timeout' in seconds
+    to finish, unless one of the optionally specified 'overrides' applies to
+    its driver as per 'driver_timeout'.  The output of each case that fails
+    is kept in the optionally specified 'log_dir' as per 'log_file', and
+    all other output is discarded.  If 'fail_fast' is set, stop after
+    yielding the first driver with a failed case, whether or not its other
+    cases have been run.  Cases still running when stopping early are waited
+    for, after setting the optionally specified 'cancel' event of the pool,
+    as per 'driver_pool', to cut them short.
+    Cases that passed when last run with the same driver and 'executor', as
+    recorded in the optionally specified 'results', are not run again, and
+    the results of every driver whose cases have all been run are recorded
+    in them.  The optionally specified 'on_case' is called as each case
+    finishes, including the cases run by discovery.  If the optionally
+    specified 'capacity' is given, it is called with the number of cases
+    running before more are started and returns how many may run at once,
+    which is at most 'jobs'.  Cases are run in the optionally specified
+    'environment' rather than that of the processes of the 'pool'.'''
+    if log_dir is not None:
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+    completions: 'queue.Queue[Tuple[Driver, int, object]]' = queue.Queue()
+    drivers    = [Driver(name,
+                         test,
+                         max_cases,
+                         driver_timeout(name, timeout, overrides or {}),
+                         log_prefix(log_dir, name))
+                                                        for name, test in tests]
+    in_flight  = 0
+    read_ahead = min(jobs, EXECUTOR_READ_AHEAD) if executor else jobs
+
+    expected: Optional[Callable[[Driver], Callable[[int], Optional[float]]]]
+    expected = None
+    if timings is not None:
+        def by_total(driver: Driver) -> float:
+            total = timings.total(driver.name)
+            return float('inf') if total is None else total
+        drivers.sort(key=by_total, reverse=True)
+
+        def expected(driver: Driver) -> Callable[[int], Optional[float]]:
+            return lambda case: timings.expected(driver.name, case)
+    pending = collections.deque(drivers)
+    undiscovered: 'collections.deque[Driver]' = collections.deque()
+
+    def submit(driver: Driver) -> None:
+        nonlocal in_flight
+        in_flight += 1
+
+        def done(result: object) -> None:
+            completions.put((driver, case, result))
+
+        if driver.discovering:
+            case = 0
+            pool.apply_async(discover_cases,
+                             ((runner,
+                               executor,
+                               driver.test,
+                               max_cases,
+                               driver.timeout,
+                               driver.logs,
+                               environment),),
+                             callback=done,
+                             error_callback=done)
+        else:
+            case = driver.take()
+            pool.apply_async(timed_case,
+                             ((runner,
+                               executor,
+                               driver.test,
+                               case,
+                               driver.timeout,
+                               driver.logs,
+                               environment),),
+                             callback=done,
+                             error_callback=done)
+
+    def fill() -> None:
+        # Without a 'capacity', each process has a case queued behind the one
+        # it is running, so that it does not wait for the next to be
+        # submitted.
+        limit = 2 * jobs if capacity is None else min(jobs,
+                                                      capacity(in_flight))
+        while undiscovered and in_flight < limit:
+            submit(undiscovered.popleft())
+
+        # Drivers without work, including those still being discovered, are
+        # dropped from 'pending'.
+        skipped = 0
+        while pending and in_flight < limit and skipped < len(pending):
+            driver = pending.popleft()
+            if not driver.has_work():
+                continue
+            pending.append(driver)
+            if driver.in_flight >= (jobs if driver.counted else read_ahead):
+                skipped += 1
+                continue
+            skipped = 0
+            submit(driver)
+
+    def abandon() -> None:
+        # Cases still running must neither go on running nor finish while the
+        # pool runs the next batch.
+        nonlocal in_flight
+        if in_flight and cancel is not None:
+            cancel.set()
+        while in_flight:
+            completions.get()
+            in_flight -= 1
+
+    if cache is not None or results is not None:
+        for driver in drivers:
+            driver.digest = file_digest(driver.test)
+
+    if results is not None:
+        for driver in drivers:
+            if driver.digest is None:
+                continue
+            known, passed = results.passed(driver.digest)
+            results.served += driver.skip(passed)
+            if known is not None:
+                driver.discovered(known, {}, expected and expected(driver))
+
+    if discover:
+        for driver in drivers:
+            if driver.exact:
+                continue
+            cases = None
+            if driver.digest is not None and cache is not None:
+                cases = cache.get('cases', driver.digest)
+            if isinstance(cases, int):
+                driver.discovered(cases, {}, expected and expected(driver))
+            elif driver.has_work():
+                driver.discovering = True
+                undiscovered.append(driver)
+
+    for driver in drivers:
+        if driver.is_done():
+            yield driver.name, driver.errors
+
+    fill()
+    while in_flight:
+        driver, case, result = completions.get()
+        in_flight -= 1
+        if isinstance(result, BaseException):
+            abandon()
+            raise result
+        if isinstance(result, Discovery):
+            driver.discovered(result.cases,
+                              result.results,
+                              expected and expected(driver),
+                              result.exact)
+            for c, outcome in sorted(result.outcomes.items()):
+                if timings is not None:
+                    timings.record(driver.name, c, outcome.duration)
+                if on_case is not None:
+                    on_case(driver.name, c, outcome)
+            if driver not in pending:
+                pending.append(driver)
+            if result.exact and driver.digest is not None and \
+                                                          cache is not None:
+                cache.put('cases', driver.digest, result.cases, [])
+        else:
+            assert isinstance(result, Outcome)
+            driver.record(case, result.result)
+            if result.result not in (RunResult.NO_SUCH_CASE,
+                                     RunResult.CANCELLED):
+                if timings is not None:
+                    timings.record(driver.name, case, result.duration)
+                if on_case is not None:
+                    on_case(driver.name, case, result)
+        if fail_fast and driver.errors:
+            abandon()
+            yield driver.name, driver.errors
+            return
+        if driver.is_done():
+            if results is not None and driver.digest is not None:
+                assert driver.limit is not None
+                results.record(driver.digest,
+                               driver.limit - 1 if driver.exact else None,
+                               (c for c in range(1, driver.limit)
+                                                   if c not in driver.errors))
+            yield driver.name, driver.errors
+        fill()
+
+def report_results(stdout:      TextIO,
+                   stderr:      TextIO,
+                   get_columns: Callable[[], int],
+                   num_drivers: int,
+                   results:     Results,
+                   log_dir:     Optional[Path]=None) -> int:
+    run_drivers = 0 # drivers run so far
+    errors      = {}
+
+    for test, test_errors in results:
+        run_drivers += 1
+        if test_errors:
+            errors[test] = test_errors
+
+        columns = get_columns()
+        message = trim(f'[{run_drivers}/{num_drivers}] Testing {test}',
+                       columns)
+        if stderr.isatty():
+            print('\r' + ' ' * columns + '\r', end='', file=stderr)
+            print(message, end='', file=stderr, flush=True)
+        else:
+            print(message, file=stderr, flush=True)
+    print(file=stderr, flush=True)
+
+    for test, test_errors in errors.items():
+        for error, result in sorted(test_errors.items()):
+            if result == RunResult.TIMEOUT:
+                print(f'TIMEOUT TEST {test} CASE {error}', file=stdout)
+            else:
+                print(f'FAIL TEST {test} CASE {error}', file=stdout)
+
+    if log_dir is not None:
+        for test, test_errors in errors.items():
+            prefix = log_prefix(log_dir, test)
+            assert prefix is not None
+            for error in sorted(test_errors):
+                path = log_file(prefix, error)
+                try:
+                    output = tail(path)
+                except OSError:
+                    continue
+                print(f'==> {path} <==', file=stderr)
+                print(output, end='' if output.endswith('\n') else '\n',
+                      file=stderr)
+    return 1 if errors else 0
+
+def report_timings(stderr:  TextIO,
+                   timings: Timings,
+                   names:   Iterable[str],
+                   count:   int) -> None:
+    '''Print the specified 'count' slowest cases of the drivers with the
+    specified 'names'.'''
+    slowest = timings.slowest(names, count)
+    if slowest:
+        print('Slowest cases:', file=stderr)
+    for name, case, duration in slowest:
+        print(f'{duration:10.3f}s {name} CASE {case}', file=stderr)
+
+def report_served(stderr: TextIO, served: int) -> None:
+    '''Print the specified number of cases that were 'served' from the
+    results cache rather than run.'''
+    print(f'{served} cases served from results cache', file=stderr)
+
+def case_record(name: str, case: int, outcome: Outcome) -> Dict[str, object]:
+    '''Return a JSON-serializable description of the specified 'outcome' of
+    the specified 'case' of the driver with the specified 'name'.'''
+    return {
+        'driver':   name,
+        'case':     case,
+        'result':   outcome.result.name,
+        'start':    outcome.start,
+        'end':      outcome.end,
+        'duration': outcome.duration,
+        'worker':   outcome.worker,
+    }
+
+class JsonReporter:
+    '''Write one JSON object per line to a stream for each test case as it
+    finishes.'''
+
+    def __init__(self, stream: TextIO) -> None:
+        self._stream = stream
+
+    def __call__(self, name: str, case: int, outcome: Outcome) -> None:
+        print(json.dumps(case_record(name, case, outcome)),
+              file=self._stream,
+              flush=True)
+
+class JUnitReporter:
+    '''Write a JUnit XML report to a stream, adding a 'testcase' element for
+    each test case as it finishes.  The report is complete once 'close' has
+    been called.'''
+
+    def __init__(self, stream: TextIO) -> None:
+        self._stream = stream
+        print('<?xml version="1.0" encoding="UTF-8"?>', file=stream)
+        print('<testsuites>', file=stream)
+        print('  <testsuite name="bdemeta">', file=stream, flush=True)
+
+    def __call__(self, name: str, case: int, outcome: Outcome) -> None:
+        quote     = xml.sax.saxutils.quoteattr
+        timestamp = datetime.datetime.fromtimestamp(outcome.start,
+                                                    datetime.timezone.utc)
+        lines     = [f'    <testcase classname={quote(name)} '
+                     f'name="{case}" time="{outcome.duration:.6f}" '
+                     f'timestamp="{timestamp.isoformat()}">',
+                     '      <properties>',
+                     f'        <property name="worker" '
+                     f'value="{outcome.worker}"/>',
+                     f'        <property name="end" '
+                     f'value="{outcome.end:.6f}"/>',
+                     '      </properties>']
+        if outcome.result == RunResult.FAILURE:
+            lines.append('      <failure message="failed"/>')
+        elif outcome.result == RunResult.TIMEOUT:
+            lines.append('      <failure message="timed out"/>')
+        lines.append('    </testcase>')
+        print('\n'.join(lines), file=self._stream, flush=True)
+
+    def close(self) -> None:
+        print('  </testsuite>', file=self._stream)
+        print('</testsuites>', file=self._stream, flush=True)
+
+@contextlib.contextmanager
+def case_reporters(json_path:  Optional[Path]=None,
+                   junit_path: Optional[Path]=None) \
+                                           -> Iterator[Optional[CaseListener]]:
+    '''Yield a listener writing a JSON lines report to the optionally
+    specified 'json_path' and a JUnit XML report to the optionally specified
+    'junit_path', or 'None' if neither is specified.'''
+    with contextlib.ExitStack() as stack:
+        listeners: List[CaseListener] = []
+        if json_path is not None:
+            listeners.append(JsonReporter(stack.enter_context(
+                                                        json_path.open('w'))))
+        if junit_path is not None:
+            junit = JUnitReporter(stack.enter_context(junit_path.open('w')))
+            stack.callback(junit.close)
+            listeners.append(junit)
+
+        if not listeners:
+            yield None
+            return
+
+        def report(name: str, case: int, outcome: Outcome) -> None:
+            for listener in listeners:
+                listener(name, case, outcome)
+        yield report
+
+class RunOptions(NamedTuple):
+    '''Options for running a batch of tests, shared by 'run_tests',
+    'run_tests_remotely' and the test service.'''
+    max_cases:   int                           = -1
+    discover:    bool                          = False
+    case_cache:  Optional[Path]                = None
+    timing_db:   Optional[Path]                = None
+    slowest:     int                           = 0
+    timeout:     Optional[float]               = None
+    overrides:   Optional[Mapping[str, float]] = None
+    log_dir:     Optional[Path]                = None
+    fail_fast:   bool                          = False
+    result_db:   Optional[Path]                = None
+    reuse:       bool                          = True
+    json_path:   Optional[Path]                = None
+    junit_path:  Optional[Path]                = None
+    jobs:        Optional[int]                 = None
+    auto_jobs:   bool                          = False
+    mem_per_job: Optional[int]                 = None
+
+    def to_json(self) -> Dict[str, object]:
+        '''Return these options as sent to the test service.  Paths are made
+        absolute since the service may run in another directory.'''
+        data: Dict[str, object] = dict(self._asdict())
+        for name in RUN_OPTION_PATHS:
+            path = getattr(self, name)
+            data[name] = str(path.resolve()) if path is not None else None
+        data['overrides'] = dict(self.overrides or {})
+        return data
+
+    @staticmethod
+    def from_json(data: Mapping[str, object]) -> 'RunOptions':
+        '''Return the options sent to the test service as the specified
+        'data' by 'to_json'.'''
+        values = dict(RunOptions._field_defaults)
+        values.update(data)
+        for name in RUN_OPTION_PATHS:
+            if values.get(name) is not None:
+                values[name] = Path(values[name])
+        return RunOptions._make(values[name] for name in RunOptions._fields)
+
+RUN_OPTION_PATHS = ('case_cache',
+                    'timing_db',
+                    'log_dir',
+                    'result_db',
+                    'json_path',
+                    'junit_path')
 
 def run_tests(stdout:      TextIO,
               stderr:      TextIO,
@@ -70,32 +1082,344 @@ def run_tests(stdout:      TextIO,
               executor:    List[str],
               get_columns: Callable[[], int],
               tests:       List[Tuple[str, str]],
-              max_cases:   int=-1) -> int:
-    num_drivers  = len(tests) # all test drivers
-    run_drivers  = 0          # drivers run so far
-
-    with multiprocessing.Pool() as pool:
-        args   = [(runner, executor, max_cases, t[0], t[1]) for t in tests]
-        jobs   = pool.imap_unordered(run_one, args)
-        errors = {}
-
-        for test, test_errors in jobs:
-            run_drivers += 1
-            if test_errors:
-                errors[test] = test_errors
-
-            columns = get_columns()
-            message = trim(f'[{run_drivers}/{num_drivers}] Testing {test}',
-                           columns)
-            if stderr.isatty():
-                print('\r' + ' ' * columns + '\r', end='', file=stderr)
-                print(message, end='', file=stderr, flush=True)
-            else:
-                print(message, file=stderr, flush=True)
-    print(file=stderr, flush=True)
+              options:     RunOptions=RunOptions()) -> int:
+    cache    = None
+    if options.case_cache:
+        cache = ResolutionCache(options.case_cache, 'cases')
+    timings  = None
+    if options.timing_db or options.slowest:
+        timings = Timings(options.timing_db)
+    results  = None
+    if options.result_db:
+        results = ResultCache(options.result_db, executor, options.reuse)
+    jobs     = options.jobs or os.cpu_count() or 1
+    throttle = None
+    if options.auto_jobs or options.mem_per_job:
+        throttle = Throttle(jobs, options.auto_jobs, options.mem_per_job)
 
-    for test, test_errors in errors.items():
-        for error in test_errors:
-            print(f'FAIL TEST {test} CASE {error}', file=stdout)
-    return 1 if errors else 0
+    pool, cancel = driver_pool(jobs)
+    with case_reporters(options.json_path, options.junit_path) as on_case, \
+         pool:
+        rc = report_results(stdout,
+                            stderr,
+                            get_columns,
+                            len(tests),
+                            run_jobs(pool,
+                                     runner,
+                                     executor,
+                                     tests,
+                                     options.max_cases,
+                                     jobs,
+                                     discover=options.discover,
+                                     cache=cache,
+                                     timings=timings,
+                                     timeout=options.timeout,
+                                     overrides=options.overrides,
+                                     log_dir=options.log_dir,
+                                     fail_fast=options.fail_fast,
+                                     results=results,
+                                     on_case=on_case,
+                                     capacity=throttle,
+                                     cancel=cancel),
+                            options.log_dir)
+    if cache is not None:
+        cache.save()
+    if results is not None:
+        results.save()
+        report_served(stderr, results.served)
+    if timings is not None:
+        timings.save()
+        report_timings(stderr, timings, (t[0] for t in tests), options.slowest)
+    return rc
+
+def unix_socket() -> socket.socket:
+    if sys.platform == 'win32':
+        raise ServiceError('local sockets are not supported on Windows')
+    else:
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+def connect(address: str) -> Optional[socket.socket]:
+    sock = unix_socket()
+    try:
+        sock.connect(address)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+def send_message(stream: TextIO, message: object) -> None:
+    print(json.dumps(message), file=stream, flush=True)
+
+class Service:
+    '''A long-lived service that runs batches of test drivers submitted over
+    a local socket, reusing one process pool for every batch.'''
+
+    def __init__(self, address: str, runner: Runner) -> None:
+        if os.path.exists(address):
+            sock = connect(address)
+            if sock is not None:
+                sock.close()
+                raise ServiceError(address)
+            # Left behind by a service that did not shut down cleanly.
+            os.unlink(address)
+
+        self._address   = address
+        self._socket    = unix_socket()
+        umask = os.umask(0o177)  # only the current user may submit tests
+        try:
+            self._socket.bind(address)
+        finally:
+            os.umask(umask)
+        self._socket.listen()
+        self._listening = True
+        self._runner    = runner
+        self._jobs      = os.cpu_count() or 1
+        # Spawned rather than forked processes inherit neither the sockets of
+        # the service nor those of the client connected when they start,
+        # which would otherwise never see the end of its results.
+        self._pool, self._cancel = driver_pool(self._jobs, 'spawn')
+
+    def _run(self,
+             stream:      TextIO,
+             executor:    List[str],
+             tests:       List[Tuple[str, str]],
+             options:     RunOptions,
+             cases:       bool,
+             environment: Environment) -> None:
+        '''Run the specified 'tests' with the specified 'executor' and
+        'options' in the specified 'environment', streaming their results to
+        the specified 'stream', along with the outcome of every case if
+        'cases' is set.'''
+        if self._cancel.is_set():
+            # The processes of a cancelled pool run no more drivers.
+            self._pool.terminate()
+            self._pool.join()
+            self._pool, self._cancel = driver_pool(self._jobs, 'spawn')
+        cache    = None
+        if options.case_cache:
+            cache = ResolutionCache(options.case_cache, 'cases')
+        timings  = Timings(options.timing_db) if options.timing_db else None
+        passed   = None
+        if options.result_db:
+            passed = ResultCache(options.result_db, executor, options.reuse)
+        # No more cases can be run at once than the pool has processes.
+        jobs     = min(options.jobs or self._jobs, self._jobs)
+        throttle = None
+        if options.auto_jobs or options.mem_per_job:
+            throttle = Throttle(jobs, options.auto_jobs, options.mem_per_job)
+        on_case = None
+        if cases:
+            def on_case(name: str, case: int, outcome: Outcome) -> None:
+                send_message(stream, {'case': case_record(name,
+                                                          case,
+                                                          outcome)})
+        results = run_jobs(self._pool,
+                           self._runner,
+                           executor,
+                           tests,
+                           options.max_cases,
+                           jobs,
+                           discover=options.discover,
+                           cache=cache,
+                           timings=timings,
+                           timeout=options.timeout,
+                           overrides=options.overrides,
+                           log_dir=options.log_dir,
+                           fail_fast=options.fail_fast,
+                           results=passed,
+                           on_case=on_case,
+                           capacity=throttle,
+                           cancel=self._cancel,
+                           environment=environment)
+        for test, errors in results:
+            failed = [[c, r.name] for c, r in sorted(errors.items())]
+            send_message(stream, [test, failed])
+        if passed is not None:
+            # Sent after every driver.
+            send_message(stream, {'served': passed.served})
+            passed.save()
+        if cache is not None:
+            cache.save()
+        if timings is not None:
+            timings.save()
+
+    def serve_one(self) -> bool:
+        '''Accept one request and answer it, returning whether the service
+        should go on accepting requests.  The results of a batch of tests are
+        followed by a 'done' record, or by an 'error' record if the batch
+        could not be run to the end.'''
+        connection, _ = self._socket.accept()
+        try:
+            with connection, connection.makefile('rw') as stream:
+                try:
+                    request = json.loads(stream.readline())
+                    if request.get('stop'):
+                        # No client may connect once the stop is acknowledged.
+                        self._stop_listening()
+                        send_message(stream, {'stopped': True})
+                    else:
+                        self._run(stream,
+                                  request['executor'],
+                                  [(name, path) for name, path in
+                                                            request['tests']],
+                                  RunOptions.from_json(request['options']),
+                                  bool(request.get('cases')),
+                                  Environment(request['cwd'], request['env']))
+                        send_message(stream, {'done': True})
+                except Exception as e:
+                    # A batch that cannot be run must not bring down the
+                    # service, but its client is told.
+                    send_message(stream,
+                                 {'error': f'{type(e).__name__}: {e}'})
+        except OSError:
+            pass  # the client is no longer listening
+        return self._listening
+
+    def serve_forever(self) -> None:
+        '''Answer requests until one of them asks the service to stop.'''
+        while self.serve_one():
+            pass
+
+    def _stop_listening(self) -> None:
+        if self._listening:
+            self._listening = False
+            self._socket.close()
+            os.unlink(self._address)
+
+    def close(self) -> None:
+        self._stop_listening()
+        self._pool.terminate()
+        self._pool.join()
+
+# Starts the command given by its arguments in a session of its own, and
+# exits without waiting for it.
+DETACH = '''import subprocess, sys
+subprocess.Popen(sys.argv[1:],
+                 stdin=subprocess.DEVNULL,
+                 stdout=subprocess.DEVNULL,
+                 stderr=subprocess.DEVNULL,
+                 start_new_session=True)'''
+
+def start_service(address: str, timeout: float=10) -> socket.socket:
+    # The service is started through an intermediate process, which is waited
+    # for, so that it is detached from this process rather than left as a
+    # child that is never waited for.
+    subprocess.Popen([sys.executable,
+                      '-c',
+                      DETACH,
+                      sys.executable,
+                      '-m',
+                      'bdemeta',
+                      'runtests',
+                      '--serve',
+                      address],
+                     stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL).wait()
+    deadline = time.monotonic() + timeout
+    while True:
+        sock = connect(address)
+        if sock is not None:
+            return sock
+        if time.monotonic() > deadline:
+            raise ServiceError(address)
+        time.sleep(0.05)
+
+def run_tests_remotely(stdout:      TextIO,
+                       stderr:      TextIO,
+                       address:     str,
+                       executor:    List[str],
+                       get_columns: Callable[[], int],
+                       tests:       List[Tuple[str, str]],
+                       options:     RunOptions=RunOptions()) -> int:
+    '''Run the specified 'tests' on the service listening at the specified
+    'address', starting the service first if necessary.  The service runs no
+    more cases at once than it has processes, regardless of 'options.jobs'.'''
+    sock = connect(address)
+    if sock is None:
+        sock = start_service(address)
+
+    with sock, sock.makefile('rw') as stream, \
+         case_reporters(options.json_path, options.junit_path) as on_case:
+        # Drivers are run in the working directory and environment of this
+        # process, whichever process started the service.
+        send_message(stream, {
+            'executor': executor,
+            'tests':    tests,
+            'options':  options.to_json(),
+            'cases':    on_case is not None,
+            'cwd':      os.getcwd(),
+            'env':      dict(os.environ),
+        })
+        sock.shutdown(socket.SHUT_WR)
+
+        served   = 0
+        reported = 0
+        done     = False
+        error    = None
+
+        def results() -> Iterator[Tuple[str, Dict[int, RunResult]]]:
+            nonlocal served, reported, done, error
+            for line in stream:
+                if not line.endswith('\n'):
+                    break  # cut short by the service exiting
+                message = json.loads(line)
+                if isinstance(message, dict):
+                    if 'case' in message:
+                        record = message['case']
+                        assert on_case is not None
+                        on_case(record['driver'],
+                                record['case'],
+                                Outcome(RunResult[record['result']],
+                                        record['start'],
+                                        record['duration'],
+                                        record['worker']))
+                    elif 'served' in message:
+                        served = message['served']
+                    elif 'error' in message:
+                        error = message['error']
+                    else:
+                        done = message['done']
+                    continue
+                test, failed = message
+                reported += 1
+                yield test, {c: RunResult[r] for c, r in failed}
+
+        rc = report_results(stdout,
+                            stderr,
+                            get_columns,
+                            len(tests),
+                            results(),
+                            options.log_dir)
+
+    # Only with 'fail_fast' may the service stop short of the last driver.
+    if error is None and not done:
+        error = 'the service exited before the batch was done'
+    if error is None and reported < len(tests) and not options.fail_fast:
+        error = f'only {reported} of {len(tests)} drivers were run'
+    if error is not None:
+        print('Test service failed:', error, file=stderr)
+        return -1
+
+    if options.result_db:
+        report_served(stderr, served)
+    # The service saves the timing database before closing the connection.
+    if options.timing_db and options.slowest:
+        report_timings(stderr,
+                       Timings(options.timing_db),
+                       (t[0] for t in tests),
+                       options.slowest)
+    return rc
 
+def stop_service(address: str) -> bool:
+    '''Stop the service listening at the specified 'address' once it has
+    finished any batches submitted before, returning whether one was
+    listening.'''
+    sock = connect(address)
+    if sock is None:
+        return False
+    with sock, sock.makefile('rw') as stream:
+        send_message(stream, {'stop': True})
+        sock.shutdown(socket.SHUT_WR)
+        stream.readline()
+    return True
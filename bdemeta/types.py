@@ -2,11 +2,18 @@
 
 import os
 from pathlib import Path
-from typing import Dict, Iterator, List, Optional, Sequence, Union
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Union
 
 Config = Dict[str, Union[List[Path], List[str], Dict[str, str]]]
 
+class Component(NamedTuple):
+    header: Optional[str]
+    source: Optional[str]
+    driver: Optional[str]
+
 class Identification:
+    __slots__ = ('type', 'path', 'package')
+
     def __init__(self,
                  type:    str,
                  path:    Optional[Path] = None,
@@ -22,7 +29,18 @@ class Identification:
         else:
             return False
 
+# Paths held by targets are expected to use '/' as their separator on every
+# platform, so that they can be written to CMake files unchanged.
+
 class Target:
+    __slots__ = ('name',
+                 '_dependencies',
+                 'has_output',
+                 'lazily_bound',
+                 'overrides',
+                 'plugin_tests',
+                 'precompiled_headers')
+
     def __init__(self, name: str, dependencies: Sequence['Target']) -> None:
         self.name                     = name
         self._dependencies            = dependencies
@@ -30,45 +48,52 @@ class Target:
         self.lazily_bound             = False
         self.overrides: Optional[str] = None
         self.plugin_tests             = False
+        self.precompiled_headers: List[str] = []
 
     def dependencies(self) -> Sequence['Target']:
         return self._dependencies
 
 class Package(Target):
+    __slots__ = ('_path', '_components')
+
     def __init__(self,
                  path: str,
                  dependencies: Sequence[Target],
-                 components: List[Dict[str, Optional[str]]]) -> None:
+                 components: Sequence[Component]) -> None:
         Target.__init__(self, os.path.basename(path), dependencies)
         self._path       = path
-        self._components = components
+        self._components = tuple(components)
 
     def includes(self) -> Iterator[str]:
         yield self._path
 
     def headers(self) -> Iterator[str]:
         for component in self._components:
-            if component['header'] is not None:
-                yield component['header']
+            if component.header is not None:
+                yield component.header
 
     def sources(self) -> Iterator[str]:
         for component in self._components:
-            if component['source'] is not None:
-                yield component['source']
+            if component.source is not None:
+                yield component.source
 
     def drivers(self) -> Iterator[str]:
         for component in self._components:
-            if component['driver'] is not None:
-                yield component['driver']
+            if component.driver is not None:
+                yield component.driver
 
 class Application(Package):
+    __slots__ = ()
+
     def __init__(self,
                  path: str,
                  dependencies: Sequence[Target],
-                 components: List[Dict[str, Optional[str]]]) -> None:
+                 components: Sequence[Component]) -> None:
         Package.__init__(self, path, dependencies, components)
 
 class Group(Target):
+    __slots__ = ('_path', '_packages')
+
     def __init__(self,
                  path: str,
                  dependencies: Sequence[Target],
@@ -77,9 +102,12 @@ class Group(Target):
         self._path     = path
         self._packages = list(packages)
 
+    def packages(self) -> Sequence[Package]:
+        return self._packages
+
     def includes(self) -> Iterator[str]:
         for package in self._packages:
-            yield os.path.join(self._path, package.name)
+            yield from package.includes()
 
     def headers(self) -> Iterator[str]:
         for package in self._packages:
@@ -97,6 +125,8 @@ class Group(Target):
                 yield driver
 
 class CMake(Target):
+    __slots__ = ('_path',)
+
     def __init__(self, name: str, path: str, deps: Sequence[Target]) -> None:
         Target.__init__(self, name, deps)
         self._path = path
@@ -105,6 +135,8 @@ class CMake(Target):
         return self._path
 
 class Pkg(Target):
+    __slots__ = ('package',)
+
     def __init__(self,
                  name: str,
                  package: str,
@@ -13,6 +13,9 @@ class DirEntry:
     def is_dir(self):
         return self._is_dir
 
+    def is_file(self):
+        return not self._is_dir
+
 class ScandirIterator:
     def __init__(self, data):
         self._entries = (DirEntry(name, type(value) == dict) for \
@@ -40,6 +43,9 @@ class OsPatcher(object):
         self._real_scandir = pathlib._NormalAccessor.scandir
         pathlib._NormalAccessor.scandir = self._scandir
 
+        self._real_os_scandir = os.scandir
+        os.scandir = self._scandir
+
         self._real_stat = pathlib._NormalAccessor.stat
         pathlib._NormalAccessor.stat = self._stat
 
@@ -50,8 +56,9 @@ class OsPatcher(object):
         io.open = self._real_open
         pathlib._NormalAccessor.listdir = self._real_listdir
         pathlib._NormalAccessor.scandir = self._real_scandir
+        os.scandir = self._real_os_scandir
         pathlib._NormalAccessor.stat = self._real_stat
-        pathlib.is_dir = self._real_isdir
+        pathlib.Path.is_dir = self._real_isdir
 
     def _buildParents(self, dir, children):
         for child in children:
@@ -84,7 +91,7 @@ class OsPatcher(object):
         return self._traverse(path).keys()
 
     def _scandir(self, path):
-        data = self._traverse(path)
+        data = self._traverse(pathlib.Path(path))
         if type(data) != dict:
             raise NotADirectoryError(f'{path} is not a directory')
         return ScandirIterator(data)
@@ -2,16 +2,19 @@
 
 import json
 import shutil
+import subprocess
 import sys
 from io       import StringIO
 from pathlib  import Path as P
 from unittest import TestCase
+from unittest import mock
 
 from bdemeta.__main__ import InvalidPathError, \
-                             run, main, get_columns, get_parser
+                             run, main, get_columns, get_parser, \
+                             service_address, parse_size
 from bdemeta.cmake    import generate
 from bdemeta.resolver import resolve, TargetResolver
-from bdemeta.testing  import run_tests, MockRunner
+from bdemeta.testing  import run_tests, MockRunner, ServiceError
 from tests.patcher    import OsPatcher
 
 def get_filestore_writer(files):
@@ -190,6 +193,98 @@ class CMakeTest(TestCase):
 
         assert(output1.getvalue() == output2.getvalue())
 
+    def test_generate_cmake_directory(self):
+        for written, report in (([P('out')/'p.cmake'], 'updated\n'),
+                                ([],                   'unchanged\n')):
+            output = StringIO()
+            with mock.patch('bdemeta.cmake.generate_directory',
+                            return_value=written) as generate_dir:
+                run(output,
+                    None,
+                    None,
+                    None,
+                    '',
+                    ['cmake', '--output-dir', 'out', 'bdemeta.json', 'p'])
+            assert(report == output.getvalue())
+            targets, directory, unity_batch = generate_dir.call_args[0]
+            assert(['p']    == [t.name for t in targets])
+            assert(P('out') == directory)
+            assert(None     == unity_batch)
+
+    def test_generate_cmake_file(self):
+        expected = StringIO()
+        generate(resolve(TargetResolver(self._config), 'p'),
+                 expected,
+                 directory=P('build'))
+
+        for written, report in ((True, 'updated\n'), (False, 'unchanged\n')):
+            output = StringIO()
+            with mock.patch('bdemeta.cmake.write_if_changed',
+                            return_value=written) as write:
+                run(output,
+                    None,
+                    None,
+                    None,
+                    '',
+                    ['cmake',
+                     '-o',
+                     'build/CMakeLists.txt',
+                     'bdemeta.json',
+                     'p'])
+            assert(report == output.getvalue())
+            path, content = write.call_args[0]
+            assert(P('build')/'CMakeLists.txt' == path)
+            assert(expected.getvalue()         == content)
+            assert('    ../r/standalones/p\n' in content)
+
+    def test_generate_cmake_unity(self):
+        targets = resolve(TargetResolver(self._config), 'p')
+        for flags, unity_batch in ((['--unity'],                       0),
+                                   (['--unity-batch', '4'],            4),
+                                   (['--unity', '--unity-batch', '4'], 4)):
+            expected = StringIO()
+            generate(targets, expected, unity_batch)
+            output = StringIO()
+            run(output,
+                None,
+                None,
+                None,
+                '',
+                ['cmake'] + flags + ['bdemeta.json', 'p'])
+            assert(expected.getvalue() == output.getvalue())
+
+    def test_generate_cmake_pch(self):
+        for flags, selected in (([],        False),
+                                (['--pch'], True)):
+            with mock.patch('bdemeta.cmake.select_precompiled_headers') \
+                                                                    as select:
+                run(StringIO(),
+                    None,
+                    None,
+                    None,
+                    '',
+                    ['cmake'] + flags + ['bdemeta.json', 'p'])
+            assert(selected == select.called)
+            if selected:
+                targets, includes = select.call_args[0]
+                assert(['p'] == [t.name for t in targets])
+
+    def test_generate_cmake_invalid_unity_batch(self):
+        stderr = StringIO()
+        rc = main(StringIO(),
+                  stderr,
+                  None,
+                  lambda: 80,
+                  '',
+                  [__name__,
+                   'cmake',
+                   '--unity-batch',
+                   '0',
+                   'bdemeta.json',
+                   'p'])
+        assert(-1 == rc)
+        assert('unity batch: 0' in stderr.getvalue())
+
 class MainTest(TestCase):
     def setUp(self):
         self._patcher = OsPatcher({
@@ -251,6 +346,16 @@ class MainTest(TestCase):
              [None, 'walk', 'bdemeta.json', 'p2'])
         assert('p2 p1\n' == stdout.getvalue())
 
+    def test_concurrent_walk(self):
+        stdout = StringIO()
+        main(stdout,
+             None,
+             None,
+             None,
+             '',
+             [None, 'walk', '-j', '4', 'bdemeta.json', 'p2', 'c1'])
+        assert('p2 p1 CONAN_PKG::c1\n' == stdout.getvalue())
+
     def test_cyclic_error(self):
         stdout = StringIO()
         stderr = StringIO()
@@ -380,6 +485,311 @@ class RunTestTest(TestCase):
         assert(stderr1.getvalue() == stderr2.getvalue())
         assert(runner1.commands   == runner2.commands)
 
+    def test_running_tests_on_service(self):
+        stdout = StringIO()
+        stderr = StringIO()
+        with mock.patch('bdemeta.testing.run_tests_remotely',
+                        return_value=1) as remote:
+            rc = main(stdout,
+                      stderr,
+                      MockRunner(''),
+                      lambda: 80,
+                      '',
+                      [__name__,
+                       'runtests',
+                       '--daemon',
+                       '--socket',
+                       'svc',
+                       'foo.t'])
+        assert(1 == rc)
+        args = remote.call_args[0]
+        assert('svc' == args[2])
+        assert([('foo.t', str(P('foo.t').resolve()))] == args[5])
+
+    def test_default_service_address(self):
+        with mock.patch('bdemeta.testing.run_tests_remotely',
+                        return_value=0) as remote:
+            main(StringIO(),
+                 StringIO(),
+                 MockRunner(''),
+                 lambda: 80,
+                 '',
+                 [__name__, 'runtests', '--daemon', 'foo.t'])
+        assert(service_address() == remote.call_args[0][2])
+
+    def test_service_unreachable(self):
+        stderr = StringIO()
+        with mock.patch('bdemeta.testing.run_tests_remotely',
+                        side_effect=ServiceError('svc')):
+            rc = main(StringIO(),
+                      stderr,
+                      MockRunner(''),
+                      lambda: 80,
+                      '',
+                      [__name__, 'runtests', '--daemon', '--socket', 'svc'])
+        assert(-1 == rc)
+        assert('svc' in stderr.getvalue())
+
+    def test_timeouts(self):
+        with mock.patch('bdemeta.testing.run_tests',
+                        return_value=0) as run_tests:
+            main(StringIO(),
+                 StringIO(),
+                 MockRunner(''),
+                 lambda: 80,
+                 '',
+                 [__name__,
+                  'runtests',
+                  '--timeout',
+                  '60',
+                  '--driver-timeout',
+                  'foo*=600',
+                  'foo.t'])
+        options = run_tests.call_args[1]['options']
+        assert(60.0            == options.timeout)
+        assert({'foo*': 600.0} == options.overrides)
+
+    def test_results_cache(self):
+        for flags, reuse in (([], True), (['--no-cache'], False)):
+            with mock.patch('bdemeta.testing.run_tests',
+                            return_value=0) as run_tests:
+                main(StringIO(),
+                     StringIO(),
+                     MockRunner(''),
+                     lambda: 80,
+                     '',
+                     [__name__,
+                      'runtests',
+                      '--fail-fast',
+                      '--results-cache',
+                      'results.json'] + flags + ['foo.t'])
+            options = run_tests.call_args[1]['options']
+            assert(True              == options.fail_fast)
+            assert(P('results.json') == options.result_db)
+            assert(reuse             == options.reuse)
+
+    def test_reports(self):
+        with mock.patch('bdemeta.testing.run_tests',
+                        return_value=0) as run_tests:
+            main(StringIO(),
+                 StringIO(),
+                 MockRunner(''),
+                 lambda: 80,
+                 '',
+                 [__name__,
+                  'runtests',
+                  '--json',
+                  'cases.json',
+                  '--junit',
+                  'junit.xml',
+                  'foo.t'])
+        options = run_tests.call_args[1]['options']
+        assert(P('cases.json') == options.json_path)
+        assert(P('junit.xml')  == options.junit_path)
+
+    def test_jobs(self):
+        for flags, jobs, auto, memory in (
+                ([],                                  None, False, None),
+                (['-j', '3'],                         3,    False, None),
+                (['-j', 'auto'],                      None, True,  None),
+                (['--jobs', '2', '--mem-per-job', '1G'],
+                                                      2,    False, 1 << 30)):
+            with mock.patch('bdemeta.testing.run_tests',
+                            return_value=0) as run_tests:
+                main(StringIO(),
+                     StringIO(),
+                     MockRunner(''),
+                     lambda: 80,
+                     '',
+                     [__name__, 'runtests'] + flags + ['foo.t'])
+            options = run_tests.call_args[1]['options']
+            assert(jobs   == options.jobs)
+            assert(auto   == options.auto_jobs)
+            assert(memory == options.mem_per_job)
+
+    def test_invalid_jobs(self):
+        for flags in (['-j', '0'],
+                      ['-j', 'many'],
+                      ['--mem-per-job', 'lots'],
+                      ['--mem-per-job', '0']):
+            stderr = StringIO()
+            rc = main(StringIO(),
+                      stderr,
+                      MockRunner(''),
+                      lambda: 80,
+                      '',
+                      [__name__, 'runtests'] + flags)
+            assert(-1 == rc)
+            assert(flags[1] in stderr.getvalue())
+
+    def test_parse_size(self):
+        assert(100       == parse_size('100'))
+        assert(2048      == parse_size('2k'))
+        assert(1536 << 20 == parse_size('1.5G'))
+        assert(1 << 40   == parse_size('1T'))
+
+    def test_invalid_driver_timeout(self):
+        for override in ['foo', '=5', 'foo=bar']:
+            stderr = StringIO()
+            rc = main(StringIO(),
+                      stderr,
+                      MockRunner(''),
+                      lambda: 80,
+                      '',
+                      [__name__, 'runtests', '--driver-timeout', override])
+            assert(-1 == rc)
+            assert(override in stderr.getvalue())
+
+    def test_stop_service(self):
+        for running in (True, False):
+            stderr = StringIO()
+            with mock.patch('bdemeta.testing.stop_service',
+                            return_value=running) as stop:
+                rc = main(StringIO(),
+                          stderr,
+                          MockRunner(''),
+                          lambda: 80,
+                          '',
+                          [__name__, 'runtests', '--stop', '--socket', 'svc'])
+            assert(0 == rc)
+            stop.assert_called_once_with('svc')
+            assert(running != ('svc' in stderr.getvalue()))
+
+    def test_service_timings_need_database(self):
+        stderr = StringIO()
+        rc = main(StringIO(),
+                  stderr,
+                  MockRunner(''),
+                  lambda: 80,
+                  '',
+                  [__name__, 'runtests', '--daemon', '--timings'])
+        assert(-1 == rc)
+        assert('--timing-db' in stderr.getvalue())
+
+    def test_no_service_on_windows(self):
+        stderr = StringIO()
+        with mock.patch('sys.platform', 'win32'):
+            rc = main(StringIO(),
+                      stderr,
+                      MockRunner(''),
+                      lambda: 80,
+                      '',
+                      [__name__, 'runtests', '--daemon', '--socket', 'svc'])
+        assert(-1 == rc)
+        assert(stderr.getvalue())
+
+class AffectedTest(TestCase):
+    def setUp(self):
+        self._patcher = OsPatcher({
+            'bdemeta.json': '{"roots": ["r"]}',
+            'r': {
+                'standalones': {
+                    'p1': {
+                        'package': {
+                            'p1.dep': '',
+                            'p1.mem': 'p1_a',
+                        },
+                    },
+                    'p2': {
+                        'package': {
+                            'p2.dep': 'p1',
+                            'p2.mem': 'p2_a',
+                        },
+                    },
+                    'p3': {
+                        'package': {
+                            'p3.dep': '',
+                            'p3.t.dep': 'p2',
+                            'p3.mem': 'p3_a',
+                        },
+                    },
+                    'p4': {
+                        'package': {
+                            'p4.dep': '',
+                            'p4.mem': 'p4_a',
+                        },
+                    },
+                },
+            },
+            'p1_a.t': '',
+            'p2_a.t': '',
+            'p3_a.t': '',
+            'p4_a.t': '',
+            'other.t': '',
+        })
+
+    def tearDown(self):
+        self._patcher.reset()
+
+    def _selected(self, *args):
+        with mock.patch('bdemeta.testing.run_tests',
+                        return_value=0) as run_tests:
+            rc = main(StringIO(),
+                      StringIO(),
+                      MockRunner(''),
+                      lambda: 80,
+                      '',
+                      [__name__, 'runtests', '--config', 'bdemeta.json'] +
+                                                                  list(args))
+        assert(0 == rc)
+        return sorted(name for name, _ in run_tests.call_args[0][5])
+
+    def test_transitive_dependents(self):
+        assert(['p1_a.t', 'p2_a.t', 'p3_a.t'] ==
+                                            self._selected('--affected', 'p1'))
+
+    def test_several_targets(self):
+        assert(['p2_a.t', 'p3_a.t', 'p4_a.t'] ==
+                      self._selected('--affected', 'p2', '--affected', 'p4'))
+
+    def test_within_specified_tests(self):
+        assert(['p2_a.t'] ==
+                            self._selected('--affected', 'p1', 'p2_a.t'))
+
+    def test_unknown_target(self):
+        stderr = StringIO()
+        rc = main(StringIO(),
+                  stderr,
+                  MockRunner(''),
+                  lambda: 80,
+                  '',
+                  [__name__,
+                   'runtests',
+                   '--config',
+                   'bdemeta.json',
+                   '--affected',
+                   'p9'])
+        assert(-1 == rc)
+        assert('p9' in stderr.getvalue())
+
+    def test_config_required(self):
+        stderr = StringIO()
+        rc = main(StringIO(),
+                  stderr,
+                  MockRunner(''),
+                  lambda: 80,
+                  '',
+                  [__name__, 'runtests', '--affected', 'p1'])
+        assert(-1 == rc)
+        assert('--config' in stderr.getvalue())
+
+class LazyImportTest(TestCase):
+    def test_walk_loads_no_test_modules(self):
+        script = '''
+import sys
+import bdemeta.__main__
+print(' '.join(sorted(sys.modules)))
+'''
+        modules = subprocess.run([sys.executable, '-c', script],
+                                 stdout=subprocess.PIPE,
+                                 check=True,
+                                 universal_newlines=True).stdout.split()
+        assert('bdemeta.resolver'       in modules)
+        assert('bdemeta.testing'    not in modules)
+        assert('bdemeta.cmake'      not in modules)
+        assert('multiprocessing'    not in modules)
+        assert('concurrent.futures' not in modules)
+
 class TerminalSizeTest(TestCase):
     def test_valid(self):
         assert(get_columns() == shutil.get_terminal_size().columns)
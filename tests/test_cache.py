@@ -0,0 +1,85 @@
+# tests.test_cache
+
+import json
+import os
+import tempfile
+from pathlib  import Path as P
+from unittest import TestCase
+
+from bdemeta.cache import ResolutionCache
+
+class ResolutionCacheTest(TestCase):
+    def setUp(self):
+        self._dir  = tempfile.TemporaryDirectory()
+        self._root = P(self._dir.name)
+        self._file = self._root/'a'
+        self._file.write_text('a')
+        self._path = self._root/'cache'/'resolution.json'
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_missing_entry(self):
+        cache = ResolutionCache(self._path, 'k')
+        assert(None == cache.get('items', 'a'))
+
+    def test_persisted_entry(self):
+        cache = ResolutionCache(self._path, 'k')
+        cache.put('items', 'a', ['x'], [self._file])
+        assert(['x'] == cache.get('items', 'a'))
+        cache.save()
+
+        cache = ResolutionCache(self._path, 'k')
+        assert(['x'] == cache.get('items', 'a'))
+        assert(None  == cache.get('items', 'b'))
+        assert(None  == cache.get('components', 'a'))
+
+    def test_changed_path(self):
+        cache = ResolutionCache(self._path, 'k')
+        cache.put('items', 'a', ['x'], [self._file])
+        cache.save()
+
+        self._file.write_text('ab')
+        cache = ResolutionCache(self._path, 'k')
+        assert(None == cache.get('items', 'a'))
+
+    def test_forget_stats(self):
+        cache = ResolutionCache(self._path, 'k')
+        cache.put('items', 'a', ['x'], [self._file])
+
+        self._file.write_text('ab')
+        assert(['x'] == cache.get('items', 'a'))
+        cache.forget_stats()
+        assert(None  == cache.get('items', 'a'))
+
+    def test_created_path(self):
+        missing = self._root/'b'
+        cache = ResolutionCache(self._path, 'k')
+        cache.put('items', 'a', [], [missing])
+        cache.save()
+
+        cache = ResolutionCache(self._path, 'k')
+        assert([] == cache.get('items', 'a'))
+
+        missing.write_text('b')
+        cache = ResolutionCache(self._path, 'k')
+        assert(None == cache.get('items', 'a'))
+
+    def test_different_key(self):
+        cache = ResolutionCache(self._path, 'k')
+        cache.put('items', 'a', ['x'], [self._file])
+        cache.save()
+
+        cache = ResolutionCache(self._path, 'l')
+        assert(None == cache.get('items', 'a'))
+
+    def test_corrupt_file(self):
+        self._path.parent.mkdir()
+        self._path.write_text('{')
+        cache = ResolutionCache(self._path, 'k')
+        assert(None == cache.get('items', 'a'))
+
+    def test_unmodified_not_saved(self):
+        cache = ResolutionCache(self._path, 'k')
+        cache.save()
+        assert(not self._path.exists())
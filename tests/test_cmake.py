@@ -1,13 +1,22 @@
 # tests.test_cmake
 
 from io          import StringIO
-from os.path     import join as pjoin, splitext
-from unittest    import TestCase
+from os.path     import splitext
+from pathlib     import Path as P
+from posixpath   import join as pjoin
+from unittest    import mock, TestCase
 
 import itertools
+import os
+import tempfile
 
-from bdemeta.cmake import generate
-from bdemeta.types import Application, CMake, Package, Pkg, Target
+from bdemeta.cache import ResolutionCache
+from bdemeta.cmake import generate, generate_directory, write_if_changed
+from bdemeta.cmake import MANIFEST
+from bdemeta.cmake import cached_includes, scan_includes
+from bdemeta.cmake import select_precompiled_headers
+from bdemeta.types import Application, CMake, Component, Group, Package, Pkg
+from bdemeta.types import Target
 
 from tests.cmake_parser import lex, find_commands, find_command, parse
 
@@ -22,16 +31,13 @@ class GenerateTargetTest(TestCase):
         _, command = find_command(cmake, 'add_library', [name])
         assert(name == command[0])
         for index, component in enumerate(components):
-            assert(component['source'] == command[index + 1])
+            assert(component.source == command[index + 1])
 
         _, command = find_command(cmake, 'target_include_directories', [name])
         assert(name     == command[0])
         assert('PUBLIC' == command[1])
 
-        # Note: CMake supports '/' for path separators on Windows (in addition
-        # to Unix), so for simplicity we use '/' universally
-        upath = path.replace('\\', '/')
-        assert(upath    == command[2])
+        assert(path     == command[2])
 
         _, command = find_command(cmake, 'target_link_libraries', [name])
         assert(name     == command[0])
@@ -41,7 +47,7 @@ class GenerateTargetTest(TestCase):
 
         for _, command in find_commands(cmake, 'install', ['FILES']):
             assert('FILES'       == command[0])
-            headers = [c['header'] for c in components if c['header'] != None]
+            headers = [c.header for c in components if c.header != None]
             index = 1
             for header in headers:
                 assert(header == command[index])
@@ -72,7 +78,7 @@ class GenerateTargetTest(TestCase):
         assert('.'           == command[5])
 
     def _check_target_drivers(self, cmake, name, components):
-        drivers = [c['driver'] for c in components if c['driver'] != None]
+        drivers = [c.driver for c in components if c.driver != None]
         for driver in drivers:
             executable = splitext(driver)[0]
             _, command = find_command(cmake, 'add_executable', [executable])
@@ -86,7 +92,7 @@ class GenerateTargetTest(TestCase):
             assert(name == command[1])
 
     def _check_test_target(self, cmake, name, components):
-        drivers = [c['driver'] for c in components if c['driver'] != None]
+        drivers = [c.driver for c in components if c.driver != None]
         if len(drivers):
             find_command(cmake, 'add_custom_target', [name + '.t'])
         else:
@@ -145,18 +151,14 @@ class GenerateTargetTest(TestCase):
         self._test_package('target', pjoin('path', 'target'), [], [], False)
 
     def test_one_comp_package_no_deps_no_test(self):
-        comps = [{ 'header': 'file.h',
-                   'source': 'file.cpp',
-                   'driver': None }]
+        comps = [Component('file.h', 'file.cpp', None)]
         self._test_package('target', pjoin('path', 'target'), [], comps, False)
 
     def test_application(self):
         name  = 'app'
         path  = pjoin('path', 'app')
         deps = [Target('foo', [])]
-        comps = [{ 'header': None,
-                   'source': 'file.m.cpp',
-                   'driver': None }]
+        comps = [Component(None, 'file.m.cpp', None)]
 
         target = Application(path, deps, comps)
 
@@ -169,15 +171,11 @@ class GenerateTargetTest(TestCase):
         find_command(cmake, 'target_link_libraries', [name, 'PUBLIC', 'foo'])
 
     def test_one_comp_package_no_deps_test(self):
-        comps = [{ 'header': 'file.h',
-                   'source': 'file.cpp',
-                   'driver': 'file.t.cpp' }]
+        comps = [Component('file.h', 'file.cpp', 'file.t.cpp')]
         self._test_package('target', pjoin('path', 'target'), [], comps, True)
 
     def test_one_comp_package_no_deps_plugin_test(self):
-        comps = [{ 'header': 'file.h',
-                   'source': 'file.cpp',
-                   'driver': 'file.t.cpp' }]
+        comps = [Component('file.h', 'file.cpp', 'file.t.cpp')]
         target = Package(pjoin('path', 'target'), [], comps)
         target.plugin_tests = True
 
@@ -276,8 +274,7 @@ class GenerateTargetTest(TestCase):
 
         # Note: CMake supports '/' for path separators on Windows (in addition
         # to Unix), so for simplicity we use '/' universally
-        upath = path.replace('\\', '/')
-        assert(f'add_subdirectory({upath} {c.name})' in out.getvalue())
+        assert(f'add_subdirectory({path} {c.name})' in out.getvalue())
 
     def test_no_pkg_config_no_include(self):
         c = CMake('foo', 'bar', [])
@@ -409,3 +406,321 @@ class GenerateTargetTest(TestCase):
         assert([name, 'INTERFACE', f'"${{{name}_STATIC_CFLAGS_OTHER}}"'] == \
                                                                       cflag[1])
 
+class WriteIfChangedTest(TestCase):
+    def setUp(self):
+        self._tmp  = tempfile.TemporaryDirectory()
+        self._path = P(self._tmp.name)/'CMakeLists.txt'
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_new_file(self):
+        assert(write_if_changed(self._path, 'foo\n'))
+        assert(b'foo\n' == self._path.read_bytes())
+
+    def test_unchanged(self):
+        write_if_changed(self._path, 'foo\n')
+        os.utime(self._path, (0, 0))
+        assert(not write_if_changed(self._path, 'foo\n'))
+        assert(0 == self._path.stat().st_mtime)
+
+    def test_changed_same_size(self):
+        write_if_changed(self._path, 'foo\n')
+        assert(write_if_changed(self._path, 'bar\n'))
+        assert(b'bar\n' == self._path.read_bytes())
+        assert(['CMakeLists.txt'] == os.listdir(self._tmp.name))
+
+    def test_missing_directory(self):
+        path = P(self._tmp.name)/'out'/'gen'/'CMakeLists.txt'
+        assert(write_if_changed(path, 'foo\n'))
+        assert(b'foo\n' == path.read_bytes())
+
+class GenerateDirectoryTest(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        os.chdir(self._tmp.name)
+        self._dir = P('out')
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def _targets(self, *sources, root='r'):
+        p1 = Package(pjoin(root, 'p1'), [], [Component(None,
+                                                       sources[0],
+                                                       None)])
+        p2 = Package(pjoin(root, 'p2'), [p1], [])
+        return [p2, p1]
+
+    def test_files(self):
+        targets = self._targets('a.cpp')
+        written = generate_directory(targets, self._dir)
+        assert({'CMakeLists.txt', 'p1.cmake', 'p2.cmake', MANIFEST} ==
+                                 {p.name for p in self._dir.iterdir()})
+        assert(set(written) == set(self._dir.iterdir()))
+
+        lists = (self._dir/'CMakeLists.txt').read_text()
+        p1 = lists.index('include(${CMAKE_CURRENT_LIST_DIR}/p1.cmake)')
+        p2 = lists.index('include(${CMAKE_CURRENT_LIST_DIR}/p2.cmake)')
+        assert(p1 < p2)
+
+        commands = list(lex(StringIO((self._dir/'p1.cmake').read_text())))
+        _, command = find_command(commands, 'add_library', ['p1'])
+        assert(['p1', '../a.cpp'] == command)
+
+    def test_paths_relative_to_directory(self):
+        p = Package(pjoin('r', 'p1'), [], [Component('r/p1/a.h',
+                                                     'r/p1/a.cpp',
+                                                     'r/p1/a.t.cpp')])
+        p.overrides = 'r/p1/p1.cmake'
+        c = CMake('c', 'r/c', [])
+        directory = self._dir/'sub'
+        generate_directory([p, c], directory)
+
+        commands = list(lex(StringIO((directory/'p1.cmake').read_text())))
+        _, command = find_command(commands, 'add_library', ['p1'])
+        assert(['p1', '../../r/p1/a.cpp'] == command)
+        _, command = find_command(commands, 'target_include_directories')
+        assert(['p1', 'PUBLIC', '../../r/p1'] == command)
+        _, command = find_command(commands, 'add_executable', ['a.t'])
+        assert('../../r/p1/a.t.cpp' == command[2])
+        find_command(commands, 'include', ['../../r/p1/p1.cmake'])
+
+        commands = list(lex(StringIO((directory/'c.cmake').read_text())))
+        find_command(commands, 'add_subdirectory', ['../../r/c', 'c'])
+
+    def test_absolute_paths_unchanged(self):
+        source  = (P(self._tmp.name)/'a.cpp').as_posix()
+        targets = self._targets(source)
+        generate_directory(targets, P(self._tmp.name)/'out')
+        commands = list(lex(StringIO((self._dir/'p1.cmake').read_text())))
+        _, command = find_command(commands, 'add_library', ['p1'])
+        assert(['p1', source] == command)
+
+    def test_same_content_as_single_file(self):
+        root    = P(self._tmp.name).as_posix()
+        targets = self._targets(pjoin(root, 'a.cpp'), root=root)
+        generate_directory(targets, self._dir)
+        out = StringIO()
+        generate(targets, out)
+
+        combined = (self._dir/'CMakeLists.txt').read_text()
+        for name in ('p1', 'p2'):
+            include = f'include(${{CMAKE_CURRENT_LIST_DIR}}/{name}.cmake)\n'
+            content = (self._dir/f'{name}.cmake').read_text()
+            combined = combined.replace(include, content)
+        assert(out.getvalue() == combined)
+
+    def test_unchanged_files_untouched(self):
+        generate_directory(self._targets('a.cpp'), self._dir)
+        for path in self._dir.iterdir():
+            os.utime(path, (0, 0))
+
+        written = generate_directory(self._targets('b.cpp'), self._dir)
+        assert([self._dir/'p1.cmake'] == written)
+        assert(0 != (self._dir/'p1.cmake').stat().st_mtime)
+        assert(0 == (self._dir/'p2.cmake').stat().st_mtime)
+        assert(0 == (self._dir/'CMakeLists.txt').stat().st_mtime)
+        assert('b.cpp' in (self._dir/'p1.cmake').read_text())
+
+    def test_file_in_directory(self):
+        out = StringIO()
+        generate(self._targets('a.cpp'), out, directory=self._dir)
+        commands = list(lex(out))
+        _, command = find_command(commands, 'add_library', ['p1'])
+        assert(['p1', '../a.cpp'] == command)
+
+        out = StringIO()
+        generate(self._targets('a.cpp'), out, directory=P('.'))
+        commands = list(lex(out))
+        _, command = find_command(commands, 'add_library', ['p1'])
+        assert(['p1', 'a.cpp'] == command)
+
+    def test_stale_files_removed(self):
+        generate_directory(self._targets('a.cpp'), self._dir)
+        (self._dir/'other.txt').write_text('')
+        (self._dir/'other.cmake').write_text('')
+
+        p3 = Package(pjoin('r', 'p3'), [], [])
+        generate_directory([p3], self._dir)
+        assert({'CMakeLists.txt', 'p3.cmake', 'other.txt', 'other.cmake',
+                MANIFEST} == {p.name for p in self._dir.iterdir()})
+        assert('p3.cmake\n' == (self._dir/MANIFEST).read_text())
+
+class PrecompiledHeadersTest(TestCase):
+    def test_no_headers(self):
+        out = StringIO()
+        generate([Package(pjoin('r', 'p1'), [], [])], out)
+        assert([] == find_commands(list(lex(out)),
+                                   'target_precompile_headers'))
+
+    def test_headers(self):
+        p = Package(pjoin('r', 'p1'), [], [Component(None, 'a.cpp', None)])
+        p.precompiled_headers = ['r/p0/p0_a.h', 'r/p0/p0_b.h']
+        p.overrides           = 'p1.cmake'
+        out = StringIO()
+        generate([p], out)
+
+        commands = list(lex(out))
+        index, command = find_command(commands, 'target_precompile_headers')
+        assert(['p1', 'PRIVATE', 'r/p0/p0_a.h', 'r/p0/p0_b.h'] == command)
+        overrides, _ = find_command(commands, 'include', ['p1.cmake'])
+        assert(index < overrides)
+
+        _, command = find_command(commands, 'cmake_minimum_required')
+        assert(['VERSION', '3.16'] == command)
+
+class ScanIncludesTest(TestCase):
+    def test_directives(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = P(tmp)/'a.cpp'
+            source.write_text('#include <b.h>\n'
+                              '  #  include "c.h"\n'
+                              '#include<d.h> // comment\n'
+                              '#define X\n'
+                              '// #include <e.h>\n'
+                              'int x; #include <f.h>\n'
+                              '#include <b.h>\n'
+                              '#include MACRO\n')
+            assert(['b.h', 'c.h', 'd.h'] == scan_includes(source))
+
+class CachedIncludesTest(TestCase):
+    def test_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = P(tmp)/'a.cpp'
+            path   = P(tmp)/'cache.json'
+            source.write_text('#include <b.h>\n')
+            cache = ResolutionCache(path, 'k')
+            assert(['b.h'] == cached_includes(cache, source))
+            cache.save()
+
+            cache = ResolutionCache(path, 'k')
+            with mock.patch('bdemeta.cmake.scan_includes',
+                            side_effect=AssertionError):
+                assert(['b.h'] == cached_includes(cache, source))
+
+            source.write_text('#include <b.h>\n#include <c.h>\n')
+            cache = ResolutionCache(path, 'k')
+            assert(['b.h', 'c.h'] == cached_includes(cache, source))
+
+    def test_no_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = P(tmp)/'a.cpp'
+            source.write_text('#include <b.h>\n')
+            assert(['b.h'] == cached_includes(None, source))
+
+class SelectPrecompiledHeadersTest(TestCase):
+    def setUp(self):
+        self._p1 = Package('r/p1', [], [Component(f'r/p1/p1_{c}.h', None, None)
+                                                         for c in 'abc'])
+        self._p2 = Package('r/p2', [self._p1], [
+            Component('r/p2/p2_a.h', f'r/p2/p2_{c}.cpp', None) for c in 'abcd'
+        ])
+
+    def _select(self, targets, includes, **kwargs):
+        select_precompiled_headers(targets, includes.__getitem__, **kwargs)
+
+    def test_most_frequent_dependency_headers(self):
+        self._select([self._p2, self._p1], {
+            'r/p2/p2_a.cpp': ['p1_b.h', 'p1_a.h', 'p2_a.h', 'bsl_map.h'],
+            'r/p2/p2_b.cpp': ['p1_a.h', 'p1_b.h', 'p2_a.h'],
+            'r/p2/p2_c.cpp': ['p1_a.h', 'p1_c.h'],
+            'r/p2/p2_d.cpp': ['p1_a.h'],
+        })
+        assert(['r/p1/p1_a.h', 'r/p1/p1_b.h'] == self._p2.precompiled_headers)
+        assert([] == self._p1.precompiled_headers)
+
+    def test_limit(self):
+        includes = {f'r/p2/p2_{c}.cpp': ['p1_c.h', 'p1_b.h'] for c in 'abcd'}
+        self._select([self._p2, self._p1], includes, limit=1)
+        assert(['r/p1/p1_b.h'] == self._p2.precompiled_headers)
+
+    def test_single_source(self):
+        p3 = Package('r/p3', [self._p1], [Component(None,
+                                                    'r/p3/p3_a.cpp',
+                                                    None)])
+        self._select([p3, self._p1], {'r/p3/p3_a.cpp': ['p1_a.h']})
+        assert([] == p3.precompiled_headers)
+
+    def test_group_excludes_own_packages(self):
+        p0 = Package('r/p0', [], [Component('r/p0/p0_a.h', None, None)])
+        g  = Group('r/g', [p0], [self._p1, self._p2])
+        c  = CMake('c', 'r/c', [])
+        self._select([c, g, p0], {
+            f'r/p2/p2_{c}.cpp': ['p0_a.h', 'p1_a.h', 'p2_a.h'] for c in 'abcd'
+        })
+        assert(['r/p0/p0_a.h'] == g.precompiled_headers)
+        assert([] == c.precompiled_headers)
+
+class UnityTest(TestCase):
+    def _package(self, name, *sources):
+        return Package(pjoin('r', name), [], [Component(None, s, None)
+                                                           for s in sources])
+
+    def _lex(self, targets, unity_batch):
+        out = StringIO()
+        generate(targets, out, unity_batch)
+        return list(lex(out))
+
+    def _unity(self, commands):
+        found = find_commands(commands, 'set_target_properties')
+        return [command for _, command in found if 'UNITY_BUILD' in command]
+
+    def _groups(self, commands):
+        found = find_commands(commands, 'set_source_files_properties')
+        return [command for _, command in found]
+
+    def test_minimum_version(self):
+        for unity_batch, version in ((None, '3.8'), (0, '3.18'), (2, '3.18')):
+            commands = self._lex([self._package('p1', 'a.cpp')], unity_batch)
+            _, command = find_command(commands, 'cmake_minimum_required')
+            assert(['VERSION', version] == command)
+
+    def test_no_unity_by_default(self):
+        commands = self._lex([self._package('p1', 'a.cpp')], None)
+        assert([] == self._unity(commands))
+        assert([] == self._groups(commands))
+
+    def test_package(self):
+        commands = self._lex([self._package('p1', 'b.cpp', 'a.cpp')], 0)
+        assert([['p1', 'PROPERTIES', 'UNITY_BUILD', 'ON',
+                 'UNITY_BUILD_MODE', 'GROUP']] == self._unity(commands))
+        assert([['b.cpp', 'a.cpp', 'PROPERTIES', 'UNITY_GROUP', '"p1"']] ==
+                                                        self._groups(commands))
+
+    def test_group_per_package(self):
+        p1 = self._package('p1', 'a.cpp')
+        p2 = self._package('p2')
+        p3 = self._package('p3', 'c.cpp', 'b.cpp')
+        g  = Group(pjoin('r', 'g'), [], [p1, p2, p3])
+        commands = self._lex([g], 0)
+        assert(['g'] == [command[0] for command in self._unity(commands)])
+        assert([['a.cpp',          'PROPERTIES', 'UNITY_GROUP', '"p1"'],
+                ['c.cpp', 'b.cpp', 'PROPERTIES', 'UNITY_GROUP', '"p3"']] ==
+                                                        self._groups(commands))
+
+    def test_batches(self):
+        package  = self._package('p1', 'a.cpp', 'b.cpp', 'c.cpp')
+        commands = self._lex([package], 2)
+        assert([['a.cpp', 'b.cpp', 'PROPERTIES', 'UNITY_GROUP', '"p1.1"'],
+                ['c.cpp',          'PROPERTIES', 'UNITY_GROUP', '"p1.2"']] ==
+                                                        self._groups(commands))
+
+    def test_single_batch_keeps_package_name(self):
+        package  = self._package('p1', 'a.cpp', 'b.cpp')
+        commands = self._lex([package], 2)
+        assert([['a.cpp', 'b.cpp', 'PROPERTIES', 'UNITY_GROUP', '"p1"']] ==
+                                                        self._groups(commands))
+
+    def test_other_targets_unaffected(self):
+        commands = self._lex([CMake('c', pjoin('r', 'c'), [])], 0)
+        assert([] == self._unity(commands))
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = P(tmp)
+            generate_directory([self._package('p1', 'a.cpp')], directory, 0)
+            commands = list(lex(StringIO((directory/'p1.cmake').read_text())))
+        assert(1 == len(self._unity(commands)))
+        assert(1 == len(self._groups(commands)))
@@ -3,7 +3,7 @@
 from itertools import chain, permutations
 from unittest import TestCase
 
-from bdemeta.graph import tsort, CyclicGraphError
+from bdemeta.graph import tsort, Closures, CyclicGraphError
 
 adjacencies = lambda x: lambda y: x.get(y, [])
 
@@ -136,3 +136,73 @@ class TsortTest(TestCase):
         assert(['d', 'a', 'b', 'c'] == tsort(['a', 'd'], graph, sorted))
         assert(['d', 'a', 'b', 'c'] == tsort(['d', 'a'], graph, sorted))
 
+
+    def test_cycle_below_root_raises_error(self):
+        # a --> b --> c
+        #       ^     |
+        #        \---/
+        graph = adjacencies({ 'a': ['b'],
+                              'b': ['c'],
+                              'c': ['b'], })
+        with self.assertRaises(CyclicGraphError) as e:
+            tsort(['a'], graph)
+        assert(e.exception.cycle == ['a', 'b', 'c', 'b'])
+
+    def test_long_chain(self):
+        # 0 --> 1 --> ... --> 9999
+        length = 10000
+        graph  = adjacencies({ str(i): [str(i + 1)] for i in range(length) })
+        assert([str(i) for i in range(length + 1)] == tsort(['0'], graph))
+
+class ClosuresTest(TestCase):
+    def test_matches_tsort(self):
+        #  /--> b --> d --> e
+        # a          ^
+        #  \--> c --/
+        graph = adjacencies({ 'a': ['b', 'c'],
+                              'b': ['d'],
+                              'c': ['d'],
+                              'd': ['e'],      })
+        closures = Closures(graph, sorted)
+        for node in ['e', 'd', 'c', 'b', 'a']:
+            assert(tsort([node], graph, sorted) == closures(node))
+
+        closures = Closures(graph, sorted)
+        for node in ['a', 'b', 'c', 'd', 'e']:
+            assert(tsort([node], graph, sorted) == closures(node))
+
+    def test_adjacencies_cached(self):
+        # a --> b --> c
+        calls = []
+        def graph(node):
+            calls.append(node)
+            return { 'a': ['b'], 'b': ['c'], }.get(node, [])
+
+        closures = Closures(graph)
+        assert(['c']           == closures('c'))
+        assert(['b', 'c']      == closures('b'))
+        assert(['a', 'b', 'c'] == closures('a'))
+        assert(['a', 'b', 'c'] == closures('a'))
+        assert(['c', 'b', 'a'] == calls)
+
+    def test_cycle_raises_error(self):
+        #  /--> b --> c
+        # |           |
+        # a <--------/
+        graph = adjacencies({ 'a': ['b'],
+                              'b': ['c'],
+                              'c': ['a'], })
+        closures = Closures(graph)
+        with self.assertRaises(CyclicGraphError) as e:
+            closures('a')
+        assert(e.exception.cycle == ['a', 'b', 'c', 'a'])
+
+    def test_clear(self):
+        edges = { 'a': ['b'], }
+        closures = Closures(adjacencies(edges))
+        assert(['a', 'b'] == closures('a'))
+
+        edges['a'] = []
+        assert(['a', 'b'] == closures('a'))
+        closures.clear()
+        assert(['a']      == closures('a'))
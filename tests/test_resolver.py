@@ -1,12 +1,17 @@
 # tests.test_resolver
 
+import os
+import tempfile
 from pathlib  import Path as P
 from unittest import TestCase
+from unittest import mock
 
 from bdemeta.resolver import bde_items, normalize_roots, PackageResolver, resolve, TargetResolver
-from bdemeta.resolver import InvalidPathError
+from bdemeta.resolver import InvalidPathError, Resolver
+from bdemeta.resolver import prefetch_dependencies
+from bdemeta.resolver import ordered_bde_items
 from bdemeta.resolver import TargetNotFoundError
-from bdemeta.types    import Identification
+from bdemeta.types    import CMake, Component, Group, Identification, Package
 from tests.patcher    import OsPatcher
 
 class NormalizeRootsTest(TestCase):
@@ -53,6 +58,16 @@ class BdeItemsTest(TestCase):
             'longer': {
                 'char': 'ab',
             },
+            'trailing': {
+                'comment': 'a # b\nc',
+            },
+            'indented': {
+                'comment': '  # a\nb',
+            },
+            'blank': {
+                'lines': '\n\na\n\n  \nb\n',
+            },
+            'ordered': 'c a\nb # d\na\n',
             'two': {
                 'same': {
                     'line': 'a b',
@@ -71,6 +86,15 @@ class BdeItemsTest(TestCase):
     def tearDown(self):
         self._patcher.reset()
 
+    def test_ordered_items(self):
+        assert(['a', 'c'] == ordered_bde_items(P('trailing')/'comment'))
+        assert(['a', 'b'] == ordered_bde_items(P('blank')/'lines'))
+        assert([]         == ordered_bde_items(P('two')/'commented'/'same'/
+                                                                      'line'))
+
+    def test_ordered_items_keep_file_order(self):
+        assert(['c', 'a', 'b'] == ordered_bde_items(P('ordered')))
+
     def test_one_char_item(self):
         assert({'a'} == bde_items(P('one')/'char'))
 
@@ -92,13 +116,24 @@ class BdeItemsTest(TestCase):
     def test_one_real_one_comment(self):
         assert({'a'} == bde_items(P('one')/'real'/'one'/'comment'))
 
+    def test_trailing_comment(self):
+        assert({'a', 'c'} == bde_items(P('trailing')/'comment'))
+
+    def test_indented_comment(self):
+        assert({'b'} == bde_items(P('indented')/'comment'))
+
+    def test_blank_lines(self):
+        assert({'a', 'b'} == bde_items(P('blank')/'lines'))
+
 class ResolveTest(TestCase):
-    class MockResolver(object):
+    class MockResolver(Resolver):
         def __init__(self, adjacencies):
             self._adjacencies = adjacencies
             self._resolutions = []
 
         def dependencies(self, name):
+            if name not in self._adjacencies:
+                raise TargetNotFoundError(name)
             return self._adjacencies[name]
 
         def resolve(self, name, store):
@@ -137,6 +172,32 @@ class ResolveTest(TestCase):
         assert('a' in r.resolutions())
         assert('b' in r.resolutions())
 
+    def test_concurrent_resolution(self):
+        adjacencies = {'a': ['b', 'c'],
+                       'b': ['d'],
+                       'c': ['d'],
+                       'd': [],         }
+        r1 = self.MockResolver(adjacencies)
+        r2 = self.MockResolver(adjacencies)
+        assert(resolve(r1, ['a']) == resolve(r2, ['a'], 4))
+        assert(r1.resolutions()   == r2.resolutions())
+
+    def test_concurrent_resolution_error(self):
+        r = self.MockResolver({'a': ['c', 'b'],
+                               'b': ['d'],      })
+        with self.assertRaises(TargetNotFoundError) as e:
+            resolve(r, ['a'], 4)
+        assert(('d',) == e.exception.args)
+
+    def test_concurrent_unexpected_error(self):
+        class FailingResolver(self.MockResolver):
+            def prefetch(self, name):
+                raise AssertionError(name)
+
+        r = FailingResolver({'a': []})
+        with self.assertRaises(AssertionError):
+            resolve(r, ['a'], 4)
+
 class PackageResolverTest(TestCase):
     def setUp(self):
         self.config = {
@@ -167,6 +228,12 @@ class PackageResolverTest(TestCase):
                         'g1p3_c1.t.cpp': '',
                         'g1p3_c1.h':     '',
                     },
+                    'g1p8': {
+                        'package': {
+                            'g1p8.dep': '',
+                            'g1p8.mem': 'g1p8_c3\ng1p8_c1\ng1p8_c2',
+                        },
+                    },
                     'g1+p4': {
                         'package': {
                             'g1+p4.dep': '',
@@ -228,29 +295,29 @@ class PackageResolverTest(TestCase):
     def test_empty_package(self):
         r = PackageResolver(P('r')/'g1')
         p = r.resolve('g1p1', {})
-        assert('g1p1'                    == p.name)
-        assert([]                        == p.dependencies())
-        assert([str(P('r')/'g1'/'g1p1')] == list(p.includes()))
-        assert([]                        == list(p.sources()))
+        assert('g1p1'        == p.name)
+        assert([]            == p.dependencies())
+        assert(['r/g1/g1p1'] == list(p.includes()))
+        assert([]            == list(p.sources()))
 
     def test_one_non_driver_component(self):
         r = PackageResolver(P('r')/'g1')
         p = r.resolve('g1p2', {})
-        assert('g1p2'                                  == p.name)
-        assert([]                                      == p.dependencies())
-        assert([str(P('r')/'g1'/'g1p2')]               == list(p.includes()))
-        assert([str(P('r')/'g1'/'g1p2'/'g1p2_c1.cpp')] == list(p.sources()))
-        assert([]                                      == list(p.drivers()))
+        assert('g1p2'                    == p.name)
+        assert([]                        == p.dependencies())
+        assert(['r/g1/g1p2']             == list(p.includes()))
+        assert(['r/g1/g1p2/g1p2_c1.cpp'] == list(p.sources()))
+        assert([]                        == list(p.drivers()))
 
     def test_one_driver_component(self):
         r = PackageResolver(P('r')/'g1')
         p = r.resolve('g1p3', {})
-        assert('g1p3'                                    == p.name)
-        assert([]                                        == p.dependencies())
-        assert([str(P('r')/'g1'/'g1p3')]                 == list(p.includes()))
-        assert([str(P('r')/'g1'/'g1p3'/'g1p3_c1.h')]     == list(p.headers()))
-        assert([str(P('r')/'g1'/'g1p3'/'g1p3_c1.cpp')]   == list(p.sources()))
-        assert([str(P('r')/'g1'/'g1p3'/'g1p3_c1.t.cpp')] == list(p.drivers()))
+        assert('g1p3'                      == p.name)
+        assert([]                          == p.dependencies())
+        assert(['r/g1/g1p3']               == list(p.includes()))
+        assert(['r/g1/g1p3/g1p3_c1.h']     == list(p.headers()))
+        assert(['r/g1/g1p3/g1p3_c1.cpp']   == list(p.sources()))
+        assert(['r/g1/g1p3/g1p3_c1.t.cpp'] == list(p.drivers()))
 
     def test_empty_package_with_dependency(self):
         r = PackageResolver(P('r')/'g2')
@@ -263,56 +330,70 @@ class PackageResolverTest(TestCase):
         assert('g2p2' == p2.name)
         assert([p1]   == p2.dependencies())
 
+    def test_components_from_one_directory_read(self):
+        r = PackageResolver(P('r')/'g1')
+        with mock.patch('pathlib.Path.is_file', side_effect=AssertionError):
+            p = r.resolve('g1p3', {})
+        assert(['r/g1/g1p3/g1p3_c1.h']     == list(p.headers()))
+        assert(['r/g1/g1p3/g1p3_c1.t.cpp'] == list(p.drivers()))
+
+    def test_components_in_member_order(self):
+        r = PackageResolver(P('r')/'g1')
+        p = r.resolve('g1p8', {})
+        assert(['r/g1/g1p8/g1p8_c3.cpp',
+                'r/g1/g1p8/g1p8_c1.cpp',
+                'r/g1/g1p8/g1p8_c2.cpp'] == list(p.sources()))
+
     def test_thirdparty_package_lists_cpps(self):
         r = PackageResolver(P('r')/'g1')
         p = r.resolve('g1+p4', {})
 
-        assert('g1+p4'                    == p.name)
-        assert([]                         == p.dependencies())
-        assert([str(P('r')/'g1'/'g1+p4')] == list(p.includes()))
+        assert('g1+p4'        == p.name)
+        assert([]             == p.dependencies())
+        assert(['r/g1/g1+p4'] == list(p.includes()))
 
-        assert(2                                == len(list(p.sources())))
-        assert(str(P('r')/'g1'/'g1+p4'/'a.cpp') in list(p.sources()))
-        assert(str(P('r')/'g1'/'g1+p4'/'b.cpp') in list(p.sources()))
+        assert(2 == len(list(p.sources())))
+        assert('r/g1/g1+p4/a.cpp' in list(p.sources()))
+        assert('r/g1/g1+p4/b.cpp' in list(p.sources()))
 
     def test_thirdparty_package_lists_cs(self):
         r = PackageResolver(P('r')/'g1')
         p = r.resolve('g1+p5', {})
-        assert('g1+p5'                          == p.name)
-        assert([]                               == p.dependencies())
-        assert([str(P('r')/'g1'/'g1+p5')]       == list(p.includes()))
-        assert([str(P('r')/'g1'/'g1+p5'/'a.c')] == list(p.sources()))
+        assert('g1+p5'            == p.name)
+        assert([]                 == p.dependencies())
+        assert(['r/g1/g1+p5']     == list(p.includes()))
+        assert(['r/g1/g1+p5/a.c'] == list(p.sources()))
 
     def test_thirdparty_package_ignores_non_c_non_cpp(self):
         r = PackageResolver(P('r')/'g1')
         p = r.resolve('g1+p6', {})
-        assert('g1+p6'                    == p.name)
-        assert([]                         == p.dependencies())
-        assert([str(P('r')/'g1'/'g1+p6')] == list(p.includes()))
-        assert([]                         == list(p.sources()))
+        assert('g1+p6'        == p.name)
+        assert([]             == p.dependencies())
+        assert(['r/g1/g1+p6'] == list(p.includes()))
+        assert([]             == list(p.sources()))
 
     def test_thirdparty_package_with_header(self):
         r = PackageResolver(P('r')/'g1')
         p = r.resolve('g1+p7', {})
-        assert('g1+p7'                          == p.name)
-        assert([]                               == p.dependencies())
-        assert([str(P('r')/'g1'/'g1+p7')]       == list(p.includes()))
-        assert([str(P('r')/'g1'/'g1+p7'/'a.h')] == list(p.headers()))
+        assert('g1+p7'            == p.name)
+        assert([]                 == p.dependencies())
+        assert(['r/g1/g1+p7']     == list(p.includes()))
+        assert(['r/g1/g1+p7/a.h'] == list(p.headers()))
 
     def test_level_two_package_has_dependency(self):
         r = PackageResolver(P('r')/'g2')
 
         p1 = r.resolve('g2p1', {})
-        assert('g2p1'                    == p1.name)
-        assert([]                        == p1.dependencies())
-        assert([str(P('r')/'g2'/'g2p1')] == list(p1.includes()))
-        assert(0                         == len(list(p1.sources())))
+        assert('g2p1'        == p1.name)
+        assert([]            == p1.dependencies())
+        assert(['r/g2/g2p1'] == list(p1.includes()))
+        assert(0             == len(list(p1.sources())))
 
         p2 = r.resolve('g2p2', { 'g2p1': p1 })
-        assert('g2p2'                    == p2.name)
-        assert([p1]                      == p2.dependencies())
-        assert([str(P('r')/'g2'/'g2p2')] == list(p2.includes()))
-        assert([]                        == list(p2.sources()))
+        assert('g2p2'        == p2.name)
+        assert([p1]          == p2.dependencies())
+        assert(['r/g2/g2p2'] == list(p2.includes()))
+        assert([]            == list(p2.sources()))
 
 class TargetResolverTest(TestCase):
     def setUp(self):
@@ -442,6 +523,40 @@ class TargetResolverTest(TestCase):
         gr2 = r.resolve('gr2', { 'gr1': gr1 })
         assert('gr2' == gr2.name)
 
+    def test_prefetch_group_members(self):
+        r = TargetResolver(self.config)
+        prefetch_dependencies(r, ['gr2'], 4)
+        with mock.patch('bdemeta.resolver.cached_bde_items',
+                        side_effect=AssertionError), \
+             mock.patch('bdemeta.resolver.cached_build_components',
+                        side_effect=AssertionError):
+            targets = resolve(r, ['gr2'])
+        assert(['gr2', 'gr1'] == [t.name for t in targets])
+        assert({'gr1p1', 'gr1p2'} == {p.name for p in targets[1].packages()})
+
+    def test_group_component_owner(self):
+        r = TargetResolver(self.config)
+        assert('gr1' == r.owner('gr1p1_foo'))
+        assert('gr1' == r.owner('gr1p2_foo'))
+
+    def test_unknown_component_owner(self):
+        r = TargetResolver(self.config)
+        assert(r.owner('gr9p1_foo') is None)
+        assert(r.owner('gr2p1_foo') is None)
+        assert(r.owner('gr1p1') is None)
+
+    def test_depends_on(self):
+        r = TargetResolver(self.config)
+        assert(r.depends_on('gr1', {'gr1'}))
+        assert(r.depends_on('gr2', {'gr1'}))
+        assert(r.depends_on('gr2', {'gr1', 'gr3'}))
+        assert(not r.depends_on('gr1', {'gr2'}))
+        assert(not r.depends_on('gr3', {'gr1'}))
+
+    def test_depends_on_incl_tests(self):
+        r = TargetResolver(self.config, True)
+        assert(r.depends_on('gr3', {'gr1'}))
+
 class ApplicationResolverTest(TestCase):
     def setUp(self):
         self.config = {
@@ -608,12 +723,17 @@ class StandaloneResolverTest(TestCase):
         p2 = r.resolve('p2', { 'p1': p1 })
         assert('p2' == p2.name)
 
+    def test_standalone_component_owner(self):
+        r = TargetResolver(self.config)
+        assert('p1' == r.owner('p1_c1'))
+        assert('p4' == r.owner('p4_c1'))
+
     def test_package_cmake_overrides(self):
         r = TargetResolver(self.config)
 
         p3 = r.resolve('p3', {})
-        assert('p3' == p3.name)
-        assert(str(P('r')/'standalones'/'p3'/'p3.cmake') == p3.overrides)
+        assert('p3'                        == p3.name)
+        assert('r/standalones/p3/p3.cmake' == p3.overrides)
 
 class CMakeResolverTest(TestCase):
     def setUp(self):
@@ -647,7 +767,7 @@ class CMakeResolverTest(TestCase):
     def test_thirdparty_cmake_path(self):
         r = TargetResolver(self.config)
         t = r.resolve('t1', {})
-        assert(str(P('r')/'thirdparty'/'t1') == t.path())
+        assert('r/thirdparty/t1' == t.path())
 
     def test_cmake_identification(self):
         r = TargetResolver(self.config)
@@ -800,3 +920,229 @@ class PluginTestsTest(TestCase):
         r   = TargetResolver(self.config, plugin_tests=True)
         gr2 = r.resolve('gr2',  {})
         assert(gr2.plugin_tests)
+
+class CachingTest(TestCase):
+    def setUp(self):
+        self.config = {
+            'roots': [
+                P('r'),
+            ],
+        }
+        self._tree = {
+            'r': {
+                'standalones': {
+                    'p1': {
+                        'package': {
+                            'p1.dep': '',
+                            'p1.mem': '',
+                        },
+                    },
+                    'p2': {
+                        'package': {
+                            'p2.dep': 'p1',
+                            'p2.mem': '',
+                        },
+                    },
+                },
+            },
+        }
+        self._patcher = OsPatcher(self._tree)
+
+    def tearDown(self):
+        self._patcher.reset()
+
+    def test_dependencies_cached(self):
+        r = TargetResolver(self.config)
+        assert(set(['p1']) == r.dependencies('p2'))
+
+        self._tree['r']['standalones']['p2']['package']['p2.dep'] = ''
+        assert(set(['p1']) == r.dependencies('p2'))
+
+    def test_identification_cached(self):
+        r = TargetResolver(self.config)
+        assert(Identification('package', P('r')/'standalones'/'p1') == \
+                                                              r.identify('p1'))
+
+        del self._tree['r']['standalones']['p1']
+        assert(Identification('package', P('r')/'standalones'/'p1') == \
+                                                              r.identify('p1'))
+
+    def test_invalidate_one(self):
+        r = TargetResolver(self.config)
+        assert(set(['p1']) == r.dependencies('p2'))
+        assert(set()       == r.dependencies('p1'))
+
+        self._tree['r']['standalones']['p1']['package']['p1.dep'] = 'p0'
+        self._tree['r']['standalones']['p2']['package']['p2.dep'] = ''
+        r.invalidate('p2')
+        assert(set()       == r.dependencies('p2'))
+        assert(set()       == r.dependencies('p1'))
+
+    def test_invalidate_all(self):
+        r = TargetResolver(self.config)
+        assert(['p2', 'p1'] == [t.name for t in resolve(r, ['p2'])])
+
+        del self._tree['r']['standalones']['p1']
+        self._tree['r']['standalones']['p2']['package']['p2.dep'] = ''
+        r.invalidate()
+        assert(['p2'] == [t.name for t in resolve(r, ['p2'])])
+        with self.assertRaises(TargetNotFoundError):
+            r.identify('p1')
+
+class RootIndexTest(TestCase):
+    def setUp(self):
+        self.config = {
+            'roots': [
+                P('r1'),
+                P('r2'),
+            ],
+        }
+        self._patcher = OsPatcher({
+            'r1': {
+                'groups': {
+                    'gr1': {
+                        'package': {},
+                    },
+                },
+                'applications': {
+                    'app1': {
+                        'package': {},
+                    },
+                },
+                'standalones': {
+                    'p1': {
+                        'package': {},
+                    },
+                },
+            },
+            'r2': {
+                'groups': {
+                    'gr1': {
+                        'group': {},
+                    },
+                },
+                'applications': {
+                    'app1': {
+                        'package': {},
+                        'app1.m.cpp': '',
+                    },
+                },
+                'standalones': {
+                    'p1': {
+                        'package': {},
+                    },
+                },
+            },
+        })
+
+    def tearDown(self):
+        self._patcher.reset()
+
+    def test_first_root_wins(self):
+        r = TargetResolver(self.config)
+        assert((P('r1'), Identification('package', P('r1')/'standalones'/'p1'))
+                                                       == r.identify_root('p1'))
+
+    def test_invalid_candidates_skipped(self):
+        r = TargetResolver(self.config)
+        assert((P('r2'), Identification('group', P('r2')/'groups'/'gr1'))
+                                                      == r.identify_root('gr1'))
+        assert((P('r2'), Identification('application',
+                                        P('r2')/'applications'/'app1'))
+                                                     == r.identify_root('app1'))
+
+    def test_unknown_name(self):
+        r = TargetResolver(self.config)
+        assert(None == r.identify_root('foo'))
+
+    def test_each_root_scanned_once(self):
+        scanned = []
+        scandir = os.scandir
+        def counting_scandir(path):
+            scanned.append(P(path))
+            return scandir(path)
+
+        os.scandir = counting_scandir
+        try:
+            r = TargetResolver(self.config)
+            for name in ['p1', 'gr1', 'app1', 'foo', 'bar']:
+                r.identify_root(name)
+        finally:
+            os.scandir = scandir
+
+        assert(len(scanned) == len(set(scanned)))
+        assert(P('r1')/'groups' in scanned)
+        assert(P('r2')/'groups' in scanned)
+
+class PersistentCacheTest(TestCase):
+    def setUp(self):
+        self._dir  = tempfile.TemporaryDirectory()
+        root       = P(self._dir.name)/'r'
+        self._p1   = root/'standalones'/'p1'
+        self._p2   = root/'standalones'/'p2'
+        for package, dep, mem in [(self._p1, '',   'p1_c1'),
+                                  (self._p2, 'p1', 'p2_c1')]:
+            (package/'package').mkdir(parents=True)
+            (package/'package'/(package.name + '.dep')).write_text(dep)
+            (package/'package'/(package.name + '.mem')).write_text(mem)
+        (self._p1/'p1_c1.h').write_text('')
+        self._config = { 'roots': [root] }
+        self._cache  = P(self._dir.name)/'build'/'bdemeta.cache'
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _resolve(self):
+        r       = TargetResolver(self._config, cache_path=self._cache)
+        targets = resolve(r, ['p2'])
+        r.save_cache()
+        return [(t.name,
+                 list(t.headers()),
+                 [d.name for d in t.dependencies()]) for t in targets]
+
+    def test_warm_run_does_not_parse(self):
+        cold = self._resolve()
+        with mock.patch('bdemeta.resolver.bde_items',
+                        side_effect=AssertionError), \
+             mock.patch('bdemeta.resolver.ordered_bde_items',
+                        side_effect=AssertionError), \
+             mock.patch('bdemeta.resolver.build_components',
+                        side_effect=AssertionError), \
+             mock.patch('bdemeta.resolver.subdirectories',
+                        side_effect=AssertionError):
+            warm = self._resolve()
+        assert(cold == warm)
+        assert([('p2', [], ['p1']),
+                ('p1', [(self._p1/'p1_c1.h').as_posix()], [])] == warm)
+
+    def test_changed_dependencies(self):
+        self._resolve()
+        (self._p2/'package'/'p2.dep').write_text('')
+        assert([('p2', [], [])] == self._resolve())
+
+    def test_changed_components(self):
+        self._resolve()
+        (self._p1/'p1_c1.h').unlink()
+        assert([('p2', [], ['p1']), ('p1', [], [])] == self._resolve())
+
+    def test_invalidate(self):
+        r = TargetResolver(self._config, cache_path=self._cache)
+        assert({'p1'} == r.dependencies('p2'))
+
+        (self._p2/'package'/'p2.dep').write_text('')
+        assert({'p1'} == r.dependencies('p2'))
+        r.invalidate('p2')
+        assert(set()  == r.dependencies('p2'))
+
+    def test_cache(self):
+        assert(TargetResolver(self._config).cache is None)
+        r = TargetResolver(self._config, cache_path=self._cache)
+        assert(r.cache is not None)
+
+    def test_changed_roots(self):
+        self._resolve()
+        for metadata in ['p1.dep', 'p1.mem']:
+            (self._p1/'package'/metadata).unlink()
+        (self._p1/'package').rmdir()
+        with self.assertRaises(TargetNotFoundError):
+            self._resolve()
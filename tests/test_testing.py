@@ -1,12 +1,33 @@
 # tests.test_testing
 
 import io
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import socket
+import subprocess
 import sys
-from unittest import TestCase
+import tempfile
+import threading
+import time
+from pathlib import Path as P
+from unittest import TestCase, skipIf
 from unittest import mock
+from xml.etree import ElementTree
 
-from bdemeta.testing import trim, run_one, test_runner, run_tests, \
-                            RunResult, MockRunner
+from bdemeta.cache   import ResolutionCache
+from bdemeta.testing import trim, test_runner, run_tests, \
+                            run_tests_remotely, run_jobs, RunResult, \
+                            MockRunner, Driver, discover_cases, \
+                            file_digest, Timings, ResultCache, \
+                            driver_timeout, \
+                            minus_one_rc, log_prefix, log_file, tail, \
+                            report_results, Outcome, JsonReporter, \
+                            JUnitReporter, case_reporters, Throttle, \
+                            RunOptions, driver_pool, EXECUTOR_READ_AHEAD, \
+                            Service, ServiceError, connect, \
+                            start_service, stop_service
 
 def gen_value(length):
     result = ''
@@ -32,6 +53,11 @@ class TestMockRunner(TestCase):
         assert(RunResult.NO_SUCH_CASE == runner('bar'))
         assert(['foo', 'bar']         == runner.commands)
 
+    def test_timeout(self):
+        runner = MockRunner('t')
+        assert(RunResult.TIMEOUT      == runner('foo'))
+        assert(RunResult.NO_SUCH_CASE == runner('bar'))
+
     def test_one_success_one_failure(self):
         runner = MockRunner('sf')
         assert(RunResult.SUCCESS      == runner('foo'))
@@ -60,67 +86,728 @@ class TestTrim(TestCase):
             elif max_length >= len(trail):
                 assert(trimmed.endswith(trail))
 
-class TestRunOne(TestCase):
-    def test_driver_with_no_cases(self):
-        runner = MockRunner('')
-        test, errors = run_one((runner, [], -1, 'foo', 'foo'))
-        assert('foo' == test)
-        assert(1 == len(runner.commands))
-        assert(['foo', '1'] == runner.commands[0])
-        assert(not errors)
+class SerialPool:
+    def apply_async(self, func, args, callback, error_callback):
+        try:
+            result = func(*args)
+        except Exception as e:
+            error_callback(e)
+        else:
+            callback(result)
+
+def broken_runner(command, timeout, output, environment):
+    raise ValueError(command)
+
+def slow_runner(command, timeout, output, environment):
+    if int(command[-1]) > 1:
+        return RunResult.NO_SUCH_CASE
+    return RunResult.SUCCESS if timeout is None else RunResult.TIMEOUT
+
+def cancelled_runner(command, timeout, output, environment):
+    if int(command[-1]) > 2:
+        return RunResult.CANCELLED
+    return RunResult.SUCCESS
+
+def counting_runner(command, timeout, output, environment):
+    # Count the runs of every driver next to it, cancelled or not.
+    with open(os.path.join(os.path.dirname(command[-2]), 'runs'), 'a') as f:
+        f.write(command[-1] + '\n')
+    return test_runner(command, timeout, output, environment)
+
+def logging_runner(command, timeout, output, environment):
+    if int(command[-1]) > 2:
+        return RunResult.NO_SUCH_CASE
+    with open(output, 'w') as f:
+        f.write(f'output of case {command[-1]}\n')
+    return RunResult.FAILURE if command[-1] == '2' else RunResult.SUCCESS
+
+class TestLogs(TestCase):
+    def test_log_prefix(self):
+        assert(log_prefix(None, 'foo.t') is None)
+        assert(str(P('logs') / 'foo.t')     == log_prefix(P('logs'), 'foo.t'))
+        assert(str(P('logs') / 'bar_foo.t') == log_prefix(P('logs'),
+                                                          'bar/foo.t'))
+        assert('foo.t.3.log' == log_file('foo.t', 3))
+
+    def test_tail_of_short_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'log')
+            with open(path, 'w') as f:
+                f.write('a\nb\n')
+            assert('a\nb\n' == tail(path))
+
+    def test_tail_of_long_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'log')
+            with open(path, 'w') as f:
+                for i in range(1000):
+                    f.write(f'line {i}\n')
+            output = tail(path, 64)
+            assert(len(output) <= 64)
+            assert(output.startswith('line '))
+            assert(output.endswith('line 999\n'))
+
+    def test_failed_logs_kept(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_dir = P(tmp) / 'logs'
+            results = list(run_jobs(SerialPool(),
+                                    logging_runner,
+                                    [],
+                                    [('foo', 'foo')],
+                                    -1,
+                                    log_dir=log_dir))
+            assert([('foo', {2: RunResult.FAILURE})] == results)
+            assert(log_dir.is_dir())
+
+            stdout = io.StringIO()
+            stderr = io.StringIO()
+            rc = report_results(stdout,
+                                stderr,
+                                lambda: 80,
+                                1,
+                                results,
+                                log_dir)
+            assert(1 == rc)
+            assert('FAIL TEST foo CASE 2\n' == stdout.getvalue())
+            assert(f'==> {log_dir / "foo.2.log"} <==\n'
+                   'output of case 2\n' in stderr.getvalue())
+
+class TestReporters(TestCase):
+    def test_json(self):
+        stream = io.StringIO()
+        JsonReporter(stream)('foo', 2, Outcome(RunResult.FAILURE, 10, 2.5, 7))
+        assert({'driver':   'foo',
+                'case':     2,
+                'result':   'FAILURE',
+                'start':    10,
+                'end':      12.5,
+                'duration': 2.5,
+                'worker':   7} == json.loads(stream.getvalue()))
+
+    def test_junit(self):
+        stream = io.StringIO()
+        junit  = JUnitReporter(stream)
+        junit('a<b', 1, Outcome(RunResult.SUCCESS, 0, 1.0, 7))
+        junit('foo', 2, Outcome(RunResult.FAILURE, 0, 1.0, 7))
+        junit('foo', 3, Outcome(RunResult.TIMEOUT, 0, 1.0, 7))
+        junit.close()
+
+        root  = ElementTree.fromstring(stream.getvalue())
+        cases = root.findall('./testsuite/testcase')
+        assert(['a<b', 'foo', 'foo'] == [c.get('classname') for c in cases])
+        assert(['1', '2', '3']       == [c.get('name') for c in cases])
+        assert('1970-01-01T00:00:00+00:00' == cases[0].get('timestamp'))
+        assert('7' == cases[0].find('./properties/property').get('value'))
+        assert(cases[0].find('failure') is None)
+        assert('failed'    == cases[1].find('failure').get('message'))
+        assert('timed out' == cases[2].find('failure').get('message'))
+
+    def test_case_reporters(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path  = P(tmp) / 'cases.json'
+            junit_path = P(tmp) / 'junit.xml'
+            with case_reporters(json_path, junit_path) as on_case:
+                on_case('foo', 1, Outcome(RunResult.SUCCESS, 0, 1.0, 7))
+            assert(1 == len(json_path.read_text().splitlines()))
+            root = ElementTree.fromstring(junit_path.read_text())
+            assert(1 == len(root.findall('./testsuite/testcase')))
+
+            with case_reporters() as on_case:
+                assert(on_case is None)
+
+class TestThrottle(TestCase):
+    def _throttle(self, jobs, auto=False, mem_per_job=None, load=None,
+                  memory=None):
+        clock = [0.0]
+        throttle = Throttle(jobs,
+                            auto,
+                            mem_per_job,
+                            load=lambda: load[0] if load else None,
+                            memory=lambda: memory[0] if memory else None,
+                            clock=lambda: clock[0])
+        return throttle, clock
+
+    def test_unlimited(self):
+        throttle, _ = self._throttle(4)
+        assert(4 == throttle(0))
+
+    def test_load(self):
+        load = [3.0]
+        throttle, clock = self._throttle(4, auto=True, load=load)
+        assert(1 == throttle(0))
+
+        # Cases already running account for part of the load.
+        clock[0] += 1
+        assert(3 == throttle(2))
+
+        load[0] = 10.0
+        clock[0] += 1
+        assert(1 == throttle(1))
+
+    def test_load_unknown(self):
+        throttle, _ = self._throttle(4, auto=True)
+        assert(4 == throttle(0))
+
+    def test_memory(self):
+        memory = [3 << 30]
+        throttle, clock = self._throttle(8, mem_per_job=1 << 30,
+                                                                memory=memory)
+        assert(3 == throttle(0))
+
+        # Never more than fit in the memory available at the start.
+        memory[0] = 8 << 30
+        clock[0] += 1
+        assert(3 == throttle(1))
+
+        memory[0] = 0
+        clock[0] += 1
+        assert(2 == throttle(2))
+
+    def test_reevaluated_after_interval(self):
+        load = [0.0]
+        throttle, clock = self._throttle(4, auto=True, load=load)
+        assert(4 == throttle(0))
+        load[0] = 4.0
+        clock[0] += 0.5
+        assert(4 == throttle(0))
+        clock[0] += 0.5
+        assert(1 == throttle(0))
+
+class TestDriverTimeout(TestCase):
+    def test_default(self):
+        assert(driver_timeout('foo.t', None, {}) is None)
+        assert(5 == driver_timeout('foo.t', 5, {'bar*': 10}))
+
+    def test_override(self):
+        assert(10 == driver_timeout('bar.t', 5, {'bar*': 10}))
+        assert(10 == driver_timeout('bar.t', None, {'bar*': 10, '*': 20}))
+
+class TestDriver(TestCase):
+    def test_unbounded(self):
+        driver = Driver('foo', 'foo', -1)
+        assert(driver.has_work())
+        assert(not driver.is_done())
+
+    def test_bounded(self):
+        driver = Driver('foo', 'foo', 2)
+        driver.next_case = 3
+        assert(not driver.has_work())
+        assert(driver.is_done())
+
+    def test_no_cases_allowed(self):
+        driver = Driver('foo', 'foo', 0)
+        assert(driver.is_done())
+
+    def test_discovered_cases_ordered(self):
+        durations = {1: 1.0, 2: 5.0, 4: 3.0}
+        driver    = Driver('foo', 'foo', -1)
+        driver.discovered(5, {1: RunResult.SUCCESS}, durations.get)
+        assert([3, 5, 2, 4] == [driver.take() for _ in range(4)])
+        assert(not driver.has_work())
+
+    def test_speculative_results_discarded(self):
+        driver = Driver('foo', 'foo', -1)
+        driver.next_case = 6
+        driver.in_flight = 5
+        driver.record(5, RunResult.FAILURE)
+        driver.record(2, RunResult.FAILURE)
+        driver.record(3, RunResult.NO_SUCH_CASE)
+        driver.record(4, RunResult.FAILURE)
+        driver.record(1, RunResult.SUCCESS)
+        assert(driver.is_done())
+        assert({2: RunResult.FAILURE} == driver.errors)
+
+class TestDiscoverCases(TestCase):
+    def test_case_counts(self):
+        for cases in range(70):
+            runner    = MockRunner('s' * cases)
+            discovery = discover_cases((runner, [], 'foo', -1, None, None, None))
+            assert(cases == discovery.cases)
+            assert(discovery.exact)
+            assert(set(range(1, cases + 1)) >= set(discovery.results))
+
+            # Every case is run at most once, and only logarithmically many
+            # are run.
+            run = [c[-1] for c in runner.commands]
+            assert(len(set(run)) == len(run))
+            assert(len(run) <= 2 * cases.bit_length() + 1)
+
+    def test_results_reused(self):
+        discovery = discover_cases((MockRunner('sfsfs'),
+                                    ['x'],
+                                    'foo',
+                                    -1,
+                                    None,
+                                    None,
+                                    None))
+        assert(5 == discovery.cases)
+        assert({1: RunResult.SUCCESS,
+                2: RunResult.FAILURE,
+                4: RunResult.FAILURE,
+                5: RunResult.SUCCESS} == discovery.results)
+
+    def test_max_cases(self):
+        runner    = MockRunner('s' * 10)
+        discovery = discover_cases((runner, [], 'foo', 6, None, None, None))
+        assert(6 == discovery.cases)
+        assert(not discovery.exact)
+        assert(all(int(c[-1]) <= 6 for c in runner.commands))
+
+    def test_cancelled(self):
+        discovery = discover_cases((cancelled_runner,
+                                    [],
+                                    'foo',
+                                    -1,
+                                    None,
+                                    None,
+                                    None))
+        assert(2 == discovery.cases)
+        assert(not discovery.exact)
+        assert({1: RunResult.SUCCESS, 2: RunResult.SUCCESS} ==
+                                                          discovery.results)
+
+    def test_max_cases_exceeds_cases(self):
+        discovery = discover_cases((MockRunner('s' * 3),
+                                    [],
+                                    'foo',
+                                    6,
+                                    None,
+                                    None,
+                                    None))
+        assert(3 == discovery.cases)
+        assert(discovery.exact)
+
+class TestFileDigest(TestCase):
+    def test_digest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'foo.t')
+            with open(path, 'wb') as f:
+                f.write(b'abc')
+            assert('ba7816bf8f01cfea414140de5dae2223'
+                   'b00361a396177a9cb410ff61f20015ad' == file_digest(path))
+
+    def test_missing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            assert(file_digest(os.path.join(tmp, 'foo.t')) is None)
+
+class TestTimings(TestCase):
+    def test_unknown(self):
+        timings = Timings()
+        assert(timings.expected('foo', 1) is None)
+        assert(timings.total('foo') is None)
+        assert([] == timings.slowest(['foo'], 10))
+
+    def test_record(self):
+        timings = Timings()
+        timings.record('foo', 1, 2.0)
+        timings.record('foo', 2, 1.0)
+        timings.record('foo', 1, 4.0)
+        assert(3.0 == timings.expected('foo', 1))
+        assert(4.0 == timings.total('foo'))
+
+    def test_slowest(self):
+        timings = Timings()
+        timings.record('foo', 1, 2.0)
+        timings.record('foo', 2, 1.0)
+        timings.record('bar', 1, 3.0)
+        timings.record('baz', 1, 9.0)
+        assert([('bar', 1, 3.0), ('foo', 1, 2.0)] ==
+                                        timings.slowest(['foo', 'bar'], 2))
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path    = P(tmp) / 'timings.json'
+            timings = Timings(path)
+            timings.record('foo', 3, 2.5)
+            timings.save()
+
+            timings = Timings(path)
+            assert(2.5 == timings.expected('foo', 3))
+            assert(timings.expected('foo', 1) is None)
+
+class TestResultCache(TestCase):
+    def test_unknown(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            results = ResultCache(P(tmp) / 'results.json', [])
+            assert((None, []) == results.passed('abc'))
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path    = P(tmp) / 'results.json'
+            results = ResultCache(path, ['run'])
+            results.record('abc', 3, [3, 1])
+            results.save()
+            assert((3, [1, 3]) == ResultCache(path, ['run']).passed('abc'))
+
+    def test_keyed_by_executor(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path    = P(tmp) / 'results.json'
+            results = ResultCache(path, ['run'])
+            results.record('abc', None, [1])
+            results.save()
+            assert((None, [1]) == ResultCache(path, ['run']).passed('abc'))
+            assert((None, []) == ResultCache(path, ['other']).passed('abc'))
+
+    def test_not_reused(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path    = P(tmp) / 'results.json'
+            results = ResultCache(path, [])
+            results.record('abc', 1, [1])
+            results.save()
+            assert((None, []) == ResultCache(path, [], False).passed('abc'))
+
+class TestRunJobs(TestCase):
+    def test_cases_interleaved(self):
+        runner  = MockRunner('ss')
+        results = list(run_jobs(SerialPool(),
+                                runner,
+                                [],
+                                [('foo', 'foo'), ('bar', 'bar')],
+                                -1,
+                                1))
+        assert([('foo', {}), ('bar', {})] == results)
+        assert([['foo', '1'],
+                ['bar', '1'],
+                ['foo', '2'],
+                ['bar', '2'],
+                ['foo', '3'],
+                ['bar', '3']] == runner.commands)
+
+    def test_cases_run_ahead(self):
+        runner  = MockRunner('sf')
+        results = list(run_jobs(SerialPool(),
+                                runner,
+                                [],
+                                [('foo', 'foo')],
+                                -1,
+                                4))
+        assert([('foo', {2: RunResult.FAILURE})] == results)
+        assert(3 <= len(runner.commands))
+
+    def test_executor_runs_fewer_ahead(self):
+        for executor, ahead in (([], 8), (['valgrind'], EXECUTOR_READ_AHEAD)):
+            runner  = MockRunner('sss')
+            results = list(run_jobs(SerialPool(),
+                                    runner,
+                                    executor,
+                                    [('foo', 'foo')],
+                                    -1,
+                                    8))
+            assert([('foo', {})] == results)
+            assert(3 + ahead >= len(runner.commands) > ahead)
+
+    def test_max_cases(self):
+        runner  = MockRunner('ffff')
+        results = list(run_jobs(SerialPool(),
+                                runner,
+                                [],
+                                [('foo', 'foo')],
+                                2,
+                                4))
+        assert([('foo', {c: RunResult.FAILURE for c in (1, 2)})] == results)
+        assert([['foo', '1'], ['foo', '2']] == runner.commands)
+
+    def test_no_cases(self):
+        results = list(run_jobs(SerialPool(),
+                                MockRunner(''),
+                                [],
+                                [('foo', 'foo')],
+                                0))
+        assert([('foo', {})] == results)
+
+    def test_runner_error(self):
+        with self.assertRaises(ValueError):
+            list(run_jobs(SerialPool(),
+                          broken_runner,
+                          [],
+                          [('foo', 'foo')],
+                          -1))
+
+    def test_discovered_cases_not_rerun(self):
+        runner  = MockRunner('sfsfsfs')
+        results = list(run_jobs(SerialPool(),
+                                runner,
+                                [],
+                                [('foo', 'foo')],
+                                -1,
+                                4,
+                                discover=True))
+        assert([('foo', {c: RunResult.FAILURE for c in (2, 4, 6)})] == results)
+
+        run = sorted(int(c[-1]) for c in runner.commands)
+        assert([1, 2, 3, 4, 5, 6, 7, 8] == run)
+
+    def test_discovery_respects_max_cases(self):
+        runner  = MockRunner('ffff')
+        results = list(run_jobs(SerialPool(),
+                                runner,
+                                [],
+                                [('foo', 'foo')],
+                                3,
+                                discover=True))
+        assert([('foo', {c: RunResult.FAILURE for c in (1, 2, 3)})] == results)
+        assert(all(int(c[-1]) <= 3 for c in runner.commands))
+
+    def test_discovery_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            test = os.path.join(tmp, 'foo.t')
+            with open(test, 'w') as f:
+                f.write('foo')
+
+            cache = ResolutionCache(P(tmp) / 'cases.json', 'cases')
+            list(run_jobs(SerialPool(),
+                          MockRunner('sss'),
+                          [],
+                          [('foo', test)],
+                          -1,
+                          discover=True,
+                          cache=cache))
+            assert(3 == cache.get('cases', file_digest(test)))
+
+            runner  = MockRunner('sss')
+            results = list(run_jobs(SerialPool(),
+                                    runner,
+                                    [],
+                                    [('foo', test)],
+                                    -1,
+                                    discover=True,
+                                    cache=cache))
+            assert([('foo', {})] == results)
+            assert([[test, '1'], [test, '2'], [test, '3']] == runner.commands)
+
+    def test_capped_discovery_not_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            test = os.path.join(tmp, 'foo.t')
+            with open(test, 'w') as f:
+                f.write('foo')
+
+            cache = ResolutionCache(P(tmp) / 'cases.json', 'cases')
+            list(run_jobs(SerialPool(),
+                          MockRunner('sss'),
+                          [],
+                          [('foo', test)],
+                          2,
+                          discover=True,
+                          cache=cache))
+            assert(cache.get('cases', file_digest(test)) is None)
+
+    def _driver(self, tmp, name, content):
+        test = os.path.join(tmp, name)
+        with open(test, 'w') as f:
+            f.write(content)
+        return test
+
+    def test_passed_cases_not_rerun(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            test    = self._driver(tmp, 'foo.t', 'foo')
+            passed  = ResultCache(P(tmp) / 'results.json', [])
+            results = list(run_jobs(SerialPool(),
+                                    MockRunner('sfs'),
+                                    [],
+                                    [('foo', test)],
+                                    -1,
+                                    results=passed))
+            assert([('foo', {2: RunResult.FAILURE})] == results)
+            assert(0 == passed.served)
+            assert((3, [1, 3]) == passed.passed(file_digest(test)))
+
+            runner  = MockRunner('sfs')
+            results = list(run_jobs(SerialPool(),
+                                    runner,
+                                    [],
+                                    [('foo', test)],
+                                    -1,
+                                    results=passed))
+            assert([('foo', {2: RunResult.FAILURE})] == results)
+            assert([[test, '2']] == runner.commands)
+            assert(2 == passed.served)
+
+    def test_passing_driver_not_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            test   = self._driver(tmp, 'foo.t', 'foo')
+            passed = ResultCache(P(tmp) / 'results.json', [])
+            list(run_jobs(SerialPool(),
+                          MockRunner('ss'),
+                          [],
+                          [('foo', test)],
+                          -1,
+                          discover=True,
+                          results=passed))
+
+            runner  = MockRunner('ss')
+            results = list(run_jobs(SerialPool(),
+                                    runner,
+                                    [],
+                                    [('foo', test)],
+                                    -1,
+                                    discover=True,
+                                    results=passed))
+            assert([('foo', {})] == results)
+            assert([] == runner.commands)
+            assert(2 == passed.served)
+
+    def test_changed_driver_rerun(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            test   = self._driver(tmp, 'foo.t', 'foo')
+            passed = ResultCache(P(tmp) / 'results.json', [])
+            list(run_jobs(SerialPool(),
+                          MockRunner('ss'),
+                          [],
+                          [('foo', test)],
+                          -1,
+                          results=passed))
+
+            self._driver(tmp, 'foo.t', 'bar')
+            runner = MockRunner('sf')
+            results = list(run_jobs(SerialPool(),
+                                    runner,
+                                    [],
+                                    [('foo', test)],
+                                    -1,
+                                    results=passed))
+            assert([('foo', {2: RunResult.FAILURE})] == results)
+            assert(0 == passed.served)
+
+    def test_longest_driver_first(self):
+        timings = Timings()
+        timings.record('foo', 1, 1.0)
+        timings.record('bar', 1, 2.0)
 
-    def test_driver_with_executor(self):
         runner = MockRunner('')
-        test, errors = run_one((runner, ['x', 'y'], -1, 'foo', 'foo'))
-        assert('foo' == test)
-        assert(1 == len(runner.commands))
-        assert(['x', 'y', 'foo', '1'] == runner.commands[0])
-        assert(not errors)
+        list(run_jobs(SerialPool(),
+                      runner,
+                      [],
+                      [('foo', 'foo'), ('bar', 'bar'), ('baz', 'baz')],
+                      -1,
+                      1,
+                      timings=timings))
+        assert(['baz', 'bar', 'foo'] == [c[0] for c in runner.commands])
 
-    def test_driver_with_four_successes(self):
-        runner = MockRunner('ssss')
-        test, errors = run_one((runner, [], -1, 'foo', 'foo'))
-        assert('foo' == test)
-        assert(5 == len(runner.commands))
-        assert(['foo', '1'] == runner.commands[0])
-        assert(['foo', '2'] == runner.commands[1])
-        assert(['foo', '3'] == runner.commands[2])
-        assert(['foo', '4'] == runner.commands[3])
-        assert(['foo', '5'] == runner.commands[4])
-        assert(not errors)
-
-    def test_driver_with_one_failure(self):
-        runner = MockRunner('f')
-        test, errors = run_one((runner, [], -1, 'foo', 'foo'))
-        assert('foo' == test)
-        assert(2 == len(runner.commands))
-        assert(['foo', '1'] == runner.commands[0])
-        assert(['foo', '2'] == runner.commands[1])
-        assert(1 == len(errors))
-        assert(1 in errors)
-
-    def test_driver_with_mixed_successes_failures(self):
-        runner = MockRunner('sfsf')
-        test, errors = run_one((runner, [], -1, 'foo', 'foo'))
-        assert('foo' == test)
-        assert(5 == len(runner.commands))
-        assert(['foo', '1'] == runner.commands[0])
-        assert(['foo', '2'] == runner.commands[1])
-        assert(['foo', '3'] == runner.commands[2])
-        assert(['foo', '4'] == runner.commands[3])
-        assert(['foo', '5'] == runner.commands[4])
-        assert(2 == len(errors))
-        assert(2 in errors)
-        assert(4 in errors)
-
-    def test_driver_with_more_cases_than_max(self):
-        runner = MockRunner('ssss')
-        test, errors = run_one((runner, [], 2, 'foo', 'foo'))
-        assert('foo' == test)
-        assert(2 == len(runner.commands))
-        assert(['foo', '1'] == runner.commands[0])
-        assert(['foo', '2'] == runner.commands[1])
-        assert(not errors)
+    def test_durations_recorded(self):
+        timings = Timings()
+        list(run_jobs(SerialPool(),
+                      MockRunner('sf'),
+                      [],
+                      [('foo', 'foo')],
+                      -1,
+                      timings=timings))
+        assert(timings.expected('foo', 2) is not None)
+        assert(timings.expected('foo', 3) is None)
+
+    def test_discovered_durations_recorded(self):
+        timings = Timings()
+        list(run_jobs(SerialPool(),
+                      MockRunner('sss'),
+                      [],
+                      [('foo', 'foo')],
+                      -1,
+                      discover=True,
+                      timings=timings))
+        assert(3 == len(timings.slowest(['foo'], 10)))
+
+    def test_capacity(self):
+        lock    = threading.Lock()
+        running = 0
+        peak    = 0
+
+        def runner(command, timeout, output, environment):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak     = max(peak, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+            if int(command[-1]) > 3:
+                return RunResult.NO_SUCH_CASE
+            return RunResult.SUCCESS
+
+        for discover in (False, True):
+            peak = 0
+            with multiprocessing.pool.ThreadPool(4) as pool:
+                results = list(run_jobs(pool,
+                                        runner,
+                                        [],
+                                        [('foo', 'foo'),
+                                         ('bar', 'bar'),
+                                         ('baz', 'baz')],
+                                        -1,
+                                        4,
+                                        discover=discover,
+                                        capacity=lambda running: 2))
+            assert(3 == len(results))
+            assert(2 == peak)
+
+    def test_cases_reported(self):
+        for discover in (False, True):
+            cases = []
+            list(run_jobs(SerialPool(),
+                          MockRunner('sfs'),
+                          [],
+                          [('foo', 'foo')],
+                          -1,
+                          discover=discover,
+                          on_case=lambda n, c, o: cases.append((n, c, o))))
+            assert([('foo', 1, RunResult.SUCCESS),
+                    ('foo', 2, RunResult.FAILURE),
+                    ('foo', 3, RunResult.SUCCESS)] ==
+                                 sorted((n, c, o.result) for n, c, o in cases))
+            for _, _, outcome in cases:
+                assert(os.getpid() == outcome.worker)
+                assert(outcome.start <= outcome.end)
+
+    def test_timeouts(self):
+        results = dict(run_jobs(SerialPool(),
+                                slow_runner,
+                                [],
+                                [('foo', 'foo'), ('bar', 'bar')],
+                                -1,
+                                overrides={'b*': 1}))
+        assert({'foo': {}, 'bar': {1: RunResult.TIMEOUT}} == results)
+
+    def test_fail_fast(self):
+        runner  = MockRunner('sfs')
+        results = list(run_jobs(SerialPool(),
+                                runner,
+                                [],
+                                [('foo', 'foo'), ('bar', 'bar')],
+                                -1,
+                                1,
+                                fail_fast=True))
+        assert([('foo', {2: RunResult.FAILURE})] == results)
+
+    def test_fail_fast_cancels(self):
+        cancel  = threading.Event()
+        results = list(run_jobs(SerialPool(),
+                                MockRunner('f'),
+                                [],
+                                [('foo', 'foo'), ('bar', 'bar')],
+                                -1,
+                                1,
+                                fail_fast=True,
+                                cancel=cancel))
+        assert([('foo', {1: RunResult.FAILURE})] == results)
+        assert(cancel.is_set())
+
+    def test_fail_fast_without_failures(self):
+        results = list(run_jobs(SerialPool(),
+                                MockRunner('ss'),
+                                [],
+                                [('foo', 'foo'), ('bar', 'bar')],
+                                -1,
+                                fail_fast=True))
+        assert([('foo', {}), ('bar', {})] == results)
+
+    def test_process_pool(self):
+        with multiprocessing.Pool(2) as pool:
+            results = dict(run_jobs(pool,
+                                    MockRunner('sfsfsfsfsf'),
+                                    [],
+                                    [('foo', 'foo'), ('bar', 'bar')],
+                                    -1,
+                                    2))
+        failed = {c: RunResult.FAILURE for c in (2, 4, 6, 8, 10)}
+        assert({'foo': failed, 'bar': failed} == results)
 
 class TestRun(TestCase):
     def test_single_success(self):
@@ -212,6 +899,495 @@ class TestRun(TestCase):
         assert(0 == rc)
         assert('\n' not in stderr.getvalue()[:-1])
 
+class TestRunOptions(TestCase):
+    def test_json_round_trip(self):
+        options = RunOptions(max_cases=5,
+                             timeout=1.5,
+                             overrides={'foo*': 3.0},
+                             log_dir=P('logs'),
+                             result_db=P('results.json').resolve(),
+                             reuse=False,
+                             jobs=2,
+                             auto_jobs=True)
+        data = json.loads(json.dumps(options.to_json()))
+        assert(str(P('logs').resolve()) == data['log_dir'])
+        assert(options._replace(log_dir=P('logs').resolve()) ==
+                                               RunOptions.from_json(data))
+
+    def test_defaults(self):
+        assert(RunOptions() == RunOptions.from_json({}))
+
+@skipIf(sys.platform == 'win32', 'requires Unix domain sockets')
+class TestService(TestCase):
+    def setUp(self):
+        self._tmp     = tempfile.TemporaryDirectory()
+        self._address = os.path.join(self._tmp.name, 'service.sock')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _serve(self, service, batches):
+        def serve():
+            for _ in range(batches):
+                service.serve_one()
+        thread = threading.Thread(target=serve)
+        thread.start()
+        return thread
+
+    def test_two_drivers_mixed_successes(self):
+        stdout  = io.StringIO()
+        stderr  = io.StringIO()
+        service = Service(self._address, MockRunner('sfsf'))
+        thread  = self._serve(service, 1)
+
+        rc = run_tests_remotely(stdout,
+                                stderr,
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"], ["bar", "bar"]])
+        thread.join()
+        service.close()
+        assert(1 == rc)
+
+        assert('foo' in stderr.getvalue())
+        assert('bar' in stderr.getvalue())
+
+        failures = stdout.getvalue().split('\n')[:-1]
+        assert(4 == len(failures))
+        assert('FAIL TEST foo CASE 2' in failures)
+        assert('FAIL TEST foo CASE 4' in failures)
+        assert('FAIL TEST bar CASE 2' in failures)
+        assert('FAIL TEST bar CASE 4' in failures)
+
+    def test_timeouts_forwarded(self):
+        stdout  = io.StringIO()
+        service = Service(self._address, MockRunner('ft'))
+        thread  = self._serve(service, 1)
+
+        rc = run_tests_remotely(stdout,
+                                io.StringIO(),
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"]],
+                                options=RunOptions(timeout=5))
+        thread.join()
+        service.close()
+        assert(1 == rc)
+        assert('FAIL TEST foo CASE 1\nTIMEOUT TEST foo CASE 2\n' ==
+                                                          stdout.getvalue())
+
+    def test_served_forwarded(self):
+        test = os.path.join(self._tmp.name, 'foo.t')
+        with open(test, 'w') as f:
+            f.write('foo')
+        path    = P(self._tmp.name) / 'results.json'
+        service = Service(self._address, MockRunner('sf'))
+        thread  = self._serve(service, 2)
+
+        for served in (0, 1):
+            stdout = io.StringIO()
+            stderr = io.StringIO()
+            rc = run_tests_remotely(stdout,
+                                    stderr,
+                                    self._address,
+                                    [],
+                                    lambda: 80,
+                                    [["foo", test]],
+                                    options=RunOptions(result_db=path))
+            assert(1 == rc)
+            assert('FAIL TEST foo CASE 2\n' == stdout.getvalue())
+            assert(f'{served} cases served from results cache' in
+                                                          stderr.getvalue())
+        thread.join()
+        service.close()
+
+    def test_cases_forwarded(self):
+        path    = P(self._tmp.name) / 'cases.json'
+        service = Service(self._address, MockRunner('sf'))
+        thread  = self._serve(service, 1)
+
+        rc = run_tests_remotely(io.StringIO(),
+                                io.StringIO(),
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"]],
+                                options=RunOptions(json_path=path))
+        thread.join()
+        service.close()
+        assert(1 == rc)
+        records = [json.loads(l) for l in path.read_text().splitlines()]
+        assert([(1, 'SUCCESS'), (2, 'FAILURE')] ==
+                          sorted((r['case'], r['result']) for r in records))
+
+    def test_service_is_reused_after_fail_fast(self):
+        service = Service(self._address, MockRunner('f' * 50))
+        thread  = self._serve(service, 2)
+
+        for fail_fast in (True, False):
+            stdout = io.StringIO()
+            rc = run_tests_remotely(stdout,
+                                    io.StringIO(),
+                                    self._address,
+                                    [],
+                                    lambda: 80,
+                                    [["foo", "foo"], ["bar", "bar"]],
+                                    options=RunOptions(fail_fast=fail_fast))
+            assert(1 == rc)
+        thread.join()
+        service.close()
+        assert(100 == len(stdout.getvalue().splitlines()))
+
+    def test_service_is_reused(self):
+        service = Service(self._address, MockRunner('s'))
+        thread  = self._serve(service, 2)
+
+        for _ in range(2):
+            rc = run_tests_remotely(io.StringIO(),
+                                    io.StringIO(),
+                                    self._address,
+                                    [],
+                                    lambda: 80,
+                                    [["foo", "foo"]])
+            assert(0 == rc)
+        thread.join()
+        service.close()
+        assert(not os.path.exists(self._address))
+
+    def test_stale_socket_is_replaced(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self._address)
+        stale.close()
+        assert(os.path.exists(self._address))
+        assert(connect(self._address) is None)
+
+        service = Service(self._address, MockRunner(''))
+        service.close()
+
+    def test_live_socket_is_not_replaced(self):
+        service = Service(self._address, MockRunner(''))
+        with self.assertRaises(ServiceError):
+            Service(self._address, MockRunner(''))
+        service.close()
+
+    def test_service_is_started(self):
+        service = Service(self._address, MockRunner('f'))
+        thread  = self._serve(service, 1)
+        stdout  = io.StringIO()
+
+        with mock.patch('bdemeta.testing.connect',
+                        side_effect=[None, connect(self._address)]), \
+             mock.patch('subprocess.Popen') as popen:
+            rc = run_tests_remotely(stdout,
+                                    io.StringIO(),
+                                    self._address,
+                                    [],
+                                    lambda: 80,
+                                    [["foo", "foo"]])
+        thread.join()
+        service.close()
+        assert(1 == rc)
+        assert('FAIL TEST foo CASE 1\n' == stdout.getvalue())
+
+        command = popen.call_args[0][0]
+        assert(['runtests', '--serve', self._address] == command[-3:])
+
+    def test_service_does_not_start(self):
+        with mock.patch('bdemeta.testing.connect', return_value=None), \
+             mock.patch('subprocess.Popen'), \
+             self.assertRaises(ServiceError):
+            start_service(self._address, timeout=0)
+
+    def _reply(self, *messages):
+        # A stand-in for the service sending the specified 'messages' in
+        # answer to one request.
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self._address)
+        sock.listen()
+
+        def serve():
+            connection, _ = sock.accept()
+            with sock, connection, connection.makefile('rw') as stream:
+                stream.readline()
+                for message in messages:
+                    print(json.dumps(message), file=stream, flush=True)
+        thread = threading.Thread(target=serve)
+        thread.start()
+        return thread
+
+    def test_early_exit_reported(self):
+        stderr = io.StringIO()
+        thread = self._reply(['foo', []])
+        rc = run_tests_remotely(io.StringIO(),
+                                stderr,
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"], ["bar", "bar"]])
+        thread.join()
+        assert(-1 == rc)
+        assert('Test service failed' in stderr.getvalue())
+
+    def test_missing_drivers_reported(self):
+        stderr = io.StringIO()
+        thread = self._reply(['foo', []], {'done': True})
+        rc = run_tests_remotely(io.StringIO(),
+                                stderr,
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"], ["bar", "bar"]])
+        thread.join()
+        assert(-1 == rc)
+        assert('only 1 of 2 drivers' in stderr.getvalue())
+
+    def test_fail_fast_may_skip_drivers(self):
+        thread = self._reply(['foo', [[1, 'FAILURE']]], {'done': True})
+        rc = run_tests_remotely(io.StringIO(),
+                                io.StringIO(),
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"], ["bar", "bar"]],
+                                options=RunOptions(fail_fast=True))
+        thread.join()
+        assert(1 == rc)
+
+    def test_error_reported(self):
+        logs = P(self._tmp.name) / 'logs'
+        logs.write_text('')
+        service = Service(self._address, MockRunner('s'))
+        thread  = self._serve(service, 2)
+
+        stderr = io.StringIO()
+        rc = run_tests_remotely(io.StringIO(),
+                                stderr,
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"]],
+                                options=RunOptions(log_dir=logs))
+        assert(-1 == rc)
+        assert('FileExistsError' in stderr.getvalue())
+
+        # The service goes on to run the next batch.
+        rc = run_tests_remotely(io.StringIO(),
+                                io.StringIO(),
+                                self._address,
+                                [],
+                                lambda: 80,
+                                [["foo", "foo"]])
+        thread.join()
+        service.close()
+        assert(0 == rc)
+
+    def test_service_is_stopped(self):
+        service = Service(self._address, MockRunner(''))
+        thread  = threading.Thread(target=service.serve_forever)
+        thread.start()
+
+        assert(stop_service(self._address))
+        thread.join()
+        assert(not os.path.exists(self._address))
+        assert(not stop_service(self._address))
+        service.close()
+
+    def test_client_directory_and_environment(self):
+        driver = os.path.join(self._tmp.name, 'driver.py')
+        with open(driver, 'w') as f:
+            f.write('''
+import os, sys
+if sys.argv[1] != '1':
+    sys.exit(-1)
+sys.exit(os.environ.get('BDEMETA_TEST') != 'yes' or
+         not os.path.exists('marker'))
+''')
+        open(os.path.join(self._tmp.name, 'marker'), 'w').close()
+
+        # The service is started with the directory and environment of this
+        # process, and then sent drivers from another.
+        package = str(P(__file__).resolve().parents[1])
+        with mock.patch.dict(os.environ, {'PYTHONPATH': package}):
+            start_service(self._address).close()
+        cwd = os.getcwd()
+        try:
+            os.chdir(self._tmp.name)
+            with mock.patch.dict(os.environ, {'BDEMETA_TEST': 'yes'}):
+                rc = run_tests_remotely(io.StringIO(),
+                                        io.StringIO(),
+                                        self._address,
+                                        [sys.executable],
+                                        lambda: 80,
+                                        [["driver", driver]])
+        finally:
+            os.chdir(cwd)
+            # Stopped before 'tearDown' removes its socket.
+            assert(stop_service(self._address))
+        assert(0 == rc)
+        assert(not os.path.exists(self._address))
+
+class TestRunTimeouts(TestCase):
+    def test_timeout_reported(self):
+        stdout = io.StringIO()
+        rc = run_tests(stdout,
+                       io.StringIO(),
+                       MockRunner('stf'),
+                       [],
+                       lambda: 80,
+                       [["foo", "foo"]])
+        assert(1 == rc)
+        assert('TIMEOUT TEST foo CASE 2\nFAIL TEST foo CASE 3\n' ==
+                                                          stdout.getvalue())
+
+class TestRunFailFast(TestCase):
+    def test_stops_at_first_failure(self):
+        stdout = io.StringIO()
+        rc = run_tests(stdout,
+                       io.StringIO(),
+                       MockRunner('f' * 50),
+                       [],
+                       lambda: 80,
+                       [["foo", "foo"], ["bar", "bar"]],
+                       options=RunOptions(fail_fast=True))
+        assert(1 == rc)
+        failures = stdout.getvalue().split('\n')[:-1]
+        assert(1 <= len(failures) < 100)
+
+    def test_stops_discovery(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fail = os.path.join(tmp, 'fail.py')
+            slow = os.path.join(tmp, 'slow.py')
+            with open(fail, 'w') as f:
+                f.write('import sys\n'
+                        'sys.exit(1 if sys.argv[1] == "1" else -1)\n')
+            with open(slow, 'w') as f:
+                f.write('import sys, time\n'
+                        'if int(sys.argv[1]) > 3:\n'
+                        '    sys.exit(-1)\n'
+                        'time.sleep(2)\n')
+
+            start  = time.monotonic()
+            stdout = io.StringIO()
+            rc     = run_tests(stdout,
+                               io.StringIO(),
+                               counting_runner,
+                               [sys.executable],
+                               lambda: 80,
+                               [["fail", fail], ["slow", slow]],
+                               options=RunOptions(discover=True,
+                                                  fail_fast=True,
+                                                  jobs=2))
+            assert(1 == rc)
+            assert('FAIL TEST fail CASE 1\n' == stdout.getvalue())
+            assert(time.monotonic() - start < 30)
+            with open(os.path.join(tmp, 'runs')) as f:
+                assert(len(f.readlines()) < 10)
+
+    @skipIf(sys.platform == 'win32', 'requires probing process ids')
+    def test_kills_running_drivers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pid_file = os.path.join(tmp, 'pid')
+            slow     = os.path.join(tmp, 'slow.py')
+            fail     = os.path.join(tmp, 'fail.py')
+            with open(slow, 'w') as f:
+                f.write(f'''
+import os, sys, time
+if sys.argv[1] != '1':
+    sys.exit(-1)
+with open({pid_file!r} + '.tmp', 'w') as f:
+    f.write(str(os.getpid()))
+os.rename({pid_file!r} + '.tmp', {pid_file!r})
+time.sleep(60)
+''')
+            with open(fail, 'w') as f:
+                f.write(f'''
+import os, time
+while not os.path.exists({pid_file!r}):
+    time.sleep(0.05)
+''' + 'raise SystemExit(1)\n')
+
+            start = time.monotonic()
+            rc    = run_tests(io.StringIO(),
+                              io.StringIO(),
+                              test_runner,
+                              [sys.executable],
+                              lambda: 80,
+                              [["slow", slow], ["fail", fail]],
+                              options=RunOptions(fail_fast=True, jobs=2))
+            assert(1 == rc)
+            assert(time.monotonic() - start < 30)
+            with open(pid_file) as f:
+                pid = int(f.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+class TestRunResultsCache(TestCase):
+    def test_served_reported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            test = os.path.join(tmp, 'foo.t')
+            with open(test, 'w') as f:
+                f.write('foo')
+            path = P(tmp) / 'results.json'
+
+            for served, reuse in ((0, True), (2, True), (0, False)):
+                stderr = io.StringIO()
+                rc = run_tests(io.StringIO(),
+                               stderr,
+                               MockRunner('ss'),
+                               [],
+                               lambda: 80,
+                               [["foo", test]],
+                               options=RunOptions(result_db=path,
+                                                  reuse=reuse))
+                assert(0 == rc)
+                assert(f'{served} cases served from results cache' in
+                                                          stderr.getvalue())
+
+class TestRunReports(TestCase):
+    def test_junit_written(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = P(tmp) / 'junit.xml'
+            rc = run_tests(io.StringIO(),
+                           io.StringIO(),
+                           MockRunner('sf'),
+                           [],
+                           lambda: 80,
+                           [["foo", "foo"], ["bar", "bar"]],
+                           options=RunOptions(junit_path=path))
+            assert(1 == rc)
+            root = ElementTree.fromstring(path.read_text())
+            assert(4 == len(root.findall('./testsuite/testcase')))
+            assert(2 == len(root.findall('./testsuite/testcase/failure')))
+
+class TestRunTimings(TestCase):
+    def test_slowest_reported(self):
+        stderr = io.StringIO()
+        rc = run_tests(io.StringIO(),
+                       stderr,
+                       MockRunner('ss'),
+                       [],
+                       lambda: 80,
+                       [["foo", "foo"]],
+                       options=RunOptions(slowest=1))
+        assert(0 == rc)
+        lines = stderr.getvalue().split('\n')
+        assert('Slowest cases:' in lines)
+        assert(1 == len([l for l in lines if ' foo CASE ' in l]))
+
+    def test_timing_db_written(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = P(tmp) / 'timings.json'
+            run_tests(io.StringIO(),
+                      io.StringIO(),
+                      MockRunner('ss'),
+                      [],
+                      lambda: 80,
+                      [["foo", "foo"]],
+                      options=RunOptions(timing_db=path))
+            assert(2.0 >= Timings(path).total('foo'))
+
 class TestRunnerTest(TestCase):
     def test_success(self):
         result = test_runner([sys.executable, "-c", "import sys; sys.exit(0)"])
@@ -227,4 +1403,112 @@ class TestRunnerTest(TestCase):
                               "import sys; sys.exit(-1)"])
         assert(result == RunResult.NO_SUCH_CASE)
 
+    def test_output_of_failure_kept(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log    = os.path.join(tmp, 'log')
+            result = test_runner([sys.executable,
+                                  "-c",
+                                  "import sys; print('oops'); sys.exit(1)"],
+                                 None,
+                                 log)
+            assert(result == RunResult.FAILURE)
+            with open(log) as f:
+                assert('oops' == f.read().strip())
+
+    def test_output_of_success_discarded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log    = os.path.join(tmp, 'log')
+            result = test_runner([sys.executable,
+                                  "-c",
+                                  "import sys; print('fine'); sys.exit(0)"],
+                                 None,
+                                 log)
+            assert(result == RunResult.SUCCESS)
+            assert(not os.path.exists(log))
+
+    def test_output_of_missing_case_discarded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log    = os.path.join(tmp, 'log')
+            result = test_runner([sys.executable,
+                                  "-c",
+                                  "import sys; sys.exit(-1)"],
+                                 None,
+                                 log)
+            assert(result == RunResult.NO_SUCH_CASE)
+            assert(not os.path.exists(log))
+
+    def test_minus_one_rc(self):
+        process = subprocess.run([sys.executable,
+                                  "-c",
+                                  "import sys; sys.exit(-1)"])
+        assert(minus_one_rc == process.returncode)
+
+    def test_success_within_timeout(self):
+        result = test_runner([sys.executable, "-c", "import sys; sys.exit(0)"],
+                             30)
+        assert(result == RunResult.SUCCESS)
+
+    def test_timeout(self):
+        start  = time.monotonic()
+        result = test_runner([sys.executable,
+                              "-c",
+                              "import time; time.sleep(30)"],
+                             0.5)
+        assert(result == RunResult.TIMEOUT)
+        assert(time.monotonic() - start < 10)
+
+    @skipIf(sys.platform == 'win32', 'requires process groups')
+    def test_cancelled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            started = os.path.join(tmp, 'started')
+            ran     = os.path.join(tmp, 'ran')
+            pool, cancel = driver_pool(1)
+            with pool:
+                running = pool.apply_async(test_runner, ([
+                    sys.executable,
+                    '-c',
+                    f'import time; open({started!r}, "w"); time.sleep(60)',
+                ],))
+                while not os.path.exists(started):
+                    time.sleep(0.05)
+                start = time.monotonic()
+                cancel.set()
+                assert(RunResult.CANCELLED == running.get(30))
+                assert(time.monotonic() - start < 30)
+
+                # No more drivers are run once cancelled.
+                result = pool.apply(test_runner, ([
+                    sys.executable,
+                    '-c',
+                    f'open({ran!r}, "w")',
+                ],))
+                assert(RunResult.CANCELLED == result)
+                assert(not os.path.exists(ran))
+
+    def test_timeout_kills_process_group(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pid_file = os.path.join(tmp, 'pid')
+            script   = f"""
+import subprocess, sys, time
+child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'],
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL)
+with open({pid_file!r}, 'w') as f:
+    f.write(str(child.pid))
+time.sleep(30)
+"""
+            result = test_runner([sys.executable, "-c", script], 2)
+            assert(result == RunResult.TIMEOUT)
+            with open(pid_file) as f:
+                pid = int(f.read())
 
+        # The killed grandchild is reparented and reaped by init, which may
+        # take a moment.
+        for _ in range(100):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.05)
+        else:
+            self.fail('grandchild still running')
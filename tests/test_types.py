@@ -4,7 +4,7 @@ from os.path import join as pj
 from unittest import TestCase
 
 from bdemeta.types import (Target, Application, Package, Group, CMake, Pkg,
-                           Identification)
+                           Component, Identification)
 
 class TestIdentification(TestCase):
     def test_equal_ids(self):
@@ -36,27 +36,33 @@ class TestPackage(TestCase):
         assert(['bar'] == p.dependencies())
 
     def test_headers(self):
-        p = Package(pj('path', 'to', 'foo'), ['bar'], [{ 'header': 'baz'}])
+        c = Component(header='baz', source=None, driver=None)
+        p = Package(pj('path', 'to', 'foo'), ['bar'], [c])
         assert(['baz'] == list(p.headers()))
 
     def test_no_headers(self):
-        p = Package(pj('path', 'to', 'foo'), ['bar'], [{ 'header': None }])
+        c = Component(header=None, source=None, driver=None)
+        p = Package(pj('path', 'to', 'foo'), ['bar'], [c])
         assert([] == list(p.headers()))
 
     def test_sources(self):
-        p = Package(pj('path', 'to', 'foo'), ['bar'], [{ 'source': 'baz'}])
+        c = Component(header=None, source='baz', driver=None)
+        p = Package(pj('path', 'to', 'foo'), ['bar'], [c])
         assert(['baz'] == list(p.sources()))
 
     def test_no_sources(self):
-        p = Package(pj('path', 'to', 'foo'), ['bar'], [{ 'source': None }])
+        c = Component(header=None, source=None, driver=None)
+        p = Package(pj('path', 'to', 'foo'), ['bar'], [c])
         assert([] == list(p.sources()))
 
     def test_drivers(self):
-        p = Package(pj('path', 'to', 'foo'), ['bar'], [{ 'driver': 'baz'}])
+        c = Component(header=None, source=None, driver='baz')
+        p = Package(pj('path', 'to', 'foo'), ['bar'], [c])
         assert(['baz'] == list(p.drivers()))
 
     def test_no_drivers(self):
-        p = Package(pj('path', 'to', 'foo'), ['bar'], [{ 'driver': None }])
+        c = Component(header=None, source=None, driver=None)
+        p = Package(pj('path', 'to', 'foo'), ['bar'], [c])
         assert([] == list(p.drivers()))
 
     def test_includes(self):
@@ -74,27 +80,33 @@ class TestApplication(TestCase):
         assert(['bar'] == a.dependencies())
 
     def test_headers(self):
-        a = Application(pj('path', 'to', 'foo'), ['bar'], [{ 'header': 'baz'}])
+        c = Component(header='baz', source=None, driver=None)
+        a = Application(pj('path', 'to', 'foo'), ['bar'], [c])
         assert(['baz'] == list(a.headers()))
 
     def test_no_headers(self):
-        a = Application(pj('path', 'to', 'foo'), ['bar'], [{ 'header': None }])
+        c = Component(header=None, source=None, driver=None)
+        a = Application(pj('path', 'to', 'foo'), ['bar'], [c])
         assert([] == list(a.headers()))
 
     def test_sources(self):
-        a = Application(pj('path', 'to', 'foo'), ['bar'], [{ 'source': 'baz'}])
+        c = Component(header=None, source='baz', driver=None)
+        a = Application(pj('path', 'to', 'foo'), ['bar'], [c])
         assert(['baz'] == list(a.sources()))
 
     def test_no_sources(self):
-        a = Application(pj('path', 'to', 'foo'), ['bar'], [{ 'source': None }])
+        c = Component(header=None, source=None, driver=None)
+        a = Application(pj('path', 'to', 'foo'), ['bar'], [c])
         assert([] == list(a.sources()))
 
     def test_drivers(self):
-        a = Application(pj('path', 'to', 'foo'), ['bar'], [{ 'driver': 'baz'}])
+        c = Component(header=None, source=None, driver='baz')
+        a = Application(pj('path', 'to', 'foo'), ['bar'], [c])
         assert(['baz'] == list(a.drivers()))
 
     def test_no_drivers(self):
-        a = Application(pj('path', 'to', 'foo'), ['bar'], [{ 'driver': None }])
+        c = Component(header=None, source=None, driver=None)
+        a = Application(pj('path', 'to', 'foo'), ['bar'], [c])
         assert([] == list(a.drivers()))
 
     def test_includes(self):
@@ -132,9 +144,9 @@ class TestGroup(TestCase):
         c1_path   = pj('path', 'g', 'p1', 'gp1_c1.cpp')
         p1_path   = pj('path', 'g', 'p1')
         g_path    = pj('path', 'g')
-        p1 = Package(p1_path, [], [{ 'header': c1_header,
-                                     'source': c1_path,
-                                     'driver': None,      }])
+        p1 = Package(p1_path, [], [Component(c1_header,
+                                             c1_path,
+                                             None)])
         g  = Group(g_path, [], [p1])
 
         assert([c1_path]   == list(g.sources()))
@@ -145,9 +157,9 @@ class TestGroup(TestCase):
         c1_path = pj('path', 'g', 'p1', 'gp1_c1.c')
         p1_path = pj('path', 'g', 'p1')
         g_path  = pj('path', 'g')
-        p1 = Package(p1_path, [], [{ 'header': None,
-                                     'source': c1_path,
-                                     'driver': None, }])
+        p1 = Package(p1_path, [], [Component(None,
+                                             c1_path,
+                                             None)])
         g  = Group(g_path, [], [p1])
 
         assert([c1_path] == list(g.sources()))
@@ -158,9 +170,9 @@ class TestGroup(TestCase):
         c1_driver = pj('path', 'g', 'p1', 'gp1_c1.t.cpp')
         p1_path   = pj('path', 'g', 'p1')
         g_path    = pj('path', 'g')
-        p1 = Package(p1_path, [], [{ 'header': c1_header,
-                                     'source': c1_path,
-                                     'driver': c1_driver, }])
+        p1 = Package(p1_path, [], [Component(c1_header,
+                                             c1_path,
+                                             c1_driver)])
         g  = Group(g_path, [], [p1])
 
         assert([c1_path]   == list(g.sources()))
@@ -198,3 +210,15 @@ class TestPkg(TestCase):
         p2 = Pkg('p2', 'p2', [p1])
         assert(p1 in p2.dependencies())
 
+
+class TestSlots(TestCase):
+    def test_no_instance_dicts(self):
+        component = Component('h', 's', 'd')
+        targets   = [Target('t', []),
+                     Package('p', [], [component]),
+                     Application('a', [], [component]),
+                     Group('g', [], []),
+                     CMake('c', 'c', []),
+                     Pkg('p', 'p', [])]
+        for target in targets:
+            assert(not hasattr(target, '__dict__'))